@@ -59,6 +59,29 @@ update_interval_settings = "{} {} {} {} {}".format( \
 @kronos.register(update_interval_settings)
 def run_digest_update():
     call_command('update_digests', interactive=False)
+
+# every minute index the resources which have been changed in the meantime
+@kronos.register("* * * * *")
+def run_index_queue_processing():
+    call_command('process_index_queue', interactive=False)
+
+# every hour merge the changed download and view counts into the search index
+@kronos.register("17 * * * *")
+def run_access_count_merge():
+    call_command('merge_access_counts', interactive=False)
+
+# every night roll up the statistics of the past day and remove the rolled up
+# query statistics which are older than the retention period
+@kronos.register("7 0 * * *")
+def run_stats_rollup():
+    call_command('rollup_stats', interactive=False)
+    call_command('prune_query_stats', interactive=False)
+
+# every night remove expired tombstones from the inventory change log
+@kronos.register("42 3 * * *")
+def run_inventory_change_pruning():
+    LOGGER.info("Will now prune the inventory change log.")
+    call_command('prune_inventory_changes', interactive=False)
     
 # update the GeoIP database every first day of the month
 @kronos.register("12 4 1 * *")
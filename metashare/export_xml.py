@@ -76,15 +76,21 @@ if __name__ == "__main__":
     ERRONEOUS_EXPORTS = 0
     RESOURCE_NO = 0
     from metashare.repository.models import resourceInfoType_model
+    from metashare.repository.supermodel import batch_export
     from metashare.xml_utils import to_xml_string
     with ZipFile(sys.argv[1], 'w') as out:
-        for resource in resourceInfoType_model.objects.all():
-            # skip rsources marked as deleted
-            if resource.storage_object.deleted == True:
+        # skip resources marked as deleted; the object graphs of the resources
+        # are loaded in batches, so that the number of database queries does
+        # not depend on the number of resources
+        for resource, root_node in batch_export(resourceInfoType_model.objects \
+                .exclude(storage_object__deleted=True).order_by('id')):
+            RESOURCE_NO += 1
+            if root_node is None:
+                # the error has already been logged by batch_export()
+                ERRONEOUS_EXPORTS += 1
+                print 'Could not export resource id={0}!'.format(resource.id)
                 continue
             try:
-                RESOURCE_NO += 1
-                root_node = resource.export_to_elementtree()
                 xml_string = to_xml_string(
                   root_node, encoding="utf-8").encode('utf-8')
                 resource_filename = 'resource-{0}.xml'.format(RESOURCE_NO)
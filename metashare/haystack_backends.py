@@ -0,0 +1,57 @@
+from haystack.backends.solr_backend import SolrEngine, SolrSearchBackend
+
+
+# the name of the cache generation of the search index
+INDEX_GENERATION_NAME = 'search_index'
+
+
+def get_index_generation():
+    """
+    Returns the current generation of the search index.
+
+    The generation changes with every write to the search index, so that it
+    can be used in the keys of cached search results. It is kept in the
+    database, as the index is usually written by the `process_index_queue`
+    job and not by the processes which serve the search results.
+    """
+    # only import on demand, so that loading the search backend does not load
+    # the models
+    from metashare.repository.models import get_cache_generation
+    return get_cache_generation(INDEX_GENERATION_NAME)
+
+
+def bump_index_generation():
+    """
+    Starts a new generation of the search index.
+    """
+    from metashare.repository.models import bump_cache_generation
+    bump_cache_generation(INDEX_GENERATION_NAME)
+
+
+class MetashareSolrSearchBackend(SolrSearchBackend):
+    """
+    A Solr search backend which starts a new generation of the search index
+    with every successful write to the index.
+    """
+    def update(self, index, iterable, commit=True):
+        super(MetashareSolrSearchBackend, self).update(index, iterable,
+                                                       commit=commit)
+        bump_index_generation()
+
+    def remove(self, obj_or_string, commit=True):
+        super(MetashareSolrSearchBackend, self).remove(obj_or_string,
+                                                       commit=commit)
+        bump_index_generation()
+
+    # pylint: disable-msg=W0102
+    def clear(self, models=[], commit=True):
+        super(MetashareSolrSearchBackend, self).clear(models=models,
+                                                      commit=commit)
+        bump_index_generation()
+
+
+class MetashareSolrEngine(SolrEngine):
+    """
+    The Solr search engine with the `MetashareSolrSearchBackend`.
+    """
+    backend = MetashareSolrSearchBackend
@@ -26,9 +26,16 @@ except ImportError:
 
 
 def print_usage():
-    print "\n\tusage: {0} [--id-file=idfile] <file.xml|archive.zip> [<file.xml|archive." \
+    print "\n\tusage: {0} [--id-file=idfile] [--bulk [--processes=n] " \
+      "[--batch-size=n]] <file.xml|archive.zip> [<file.xml|archive." \
       "zip> ...]\n".format(sys.argv[0])
     print "  --id-file=idfile : print identifier of imported resources in idfile"
+    print "  --bulk : parse the XML files in parallel, write the resources in " \
+      "batches and\n    only index the imported resources"
+    print "  --processes=n : number of parsing processes in bulk mode " \
+      "(default: number of CPUs)"
+    print "  --batch-size=n : number of resources per database transaction " \
+      "in bulk mode"
     return
 
 if __name__ == "__main__":
@@ -41,21 +48,35 @@ if __name__ == "__main__":
         print_usage()
         sys.exit(-1)
     
-    # Check command line options for --id-file
+    # Check command line options
     id_filename = None
+    bulk_mode = False
+    bulk_options = {}
     arg_num=1
-    if sys.argv[arg_num].startswith("--id-file="):
-        opt_len = len("--id-file=")
-        id_filename = sys.argv[arg_num][opt_len:]
+    while arg_num < len(sys.argv) and sys.argv[arg_num].startswith("--"):
+        option = sys.argv[arg_num]
         arg_num = arg_num + 1
-        if len(id_filename) == 0:
+        try:
+            if option.startswith("--id-file="):
+                id_filename = option[len("--id-file="):]
+                if len(id_filename) == 0:
+                    raise ValueError(option)
+            elif option == "--bulk":
+                bulk_mode = True
+            elif option.startswith("--processes="):
+                bulk_options['processes'] = int(option[len("--processes="):])
+            elif option.startswith("--batch-size="):
+                bulk_options['batch_size'] = int(option[len("--batch-size="):])
+            else:
+                raise ValueError(option)
+        except ValueError:
             print "Incorrect option"
             print_usage()
             sys.exit(-1)
-        if len(sys.argv) < 3:
-            print_usage()
-            sys.exit(-1)
-        
+    if arg_num >= len(sys.argv) or (bulk_options and not bulk_mode):
+        print_usage()
+        sys.exit(-1)
+
 
     # Check that SOLR is running, or else all resources will stay at status INTERNAL:
     from metashare.repository import verify_at_startup
@@ -63,23 +84,38 @@ if __name__ == "__main__":
 
     # Disable verbose debug output for the import process...
     settings.DEBUG = False
-    os.environ['DISABLE_INDEXING_DURING_IMPORT'] = 'True'
+    # ... and real-time indexing; in bulk mode the imported resources are
+    # indexed in batches, otherwise the whole index is rebuilt at the end
+    os.environ['DISABLE_INDEXING_DURING_IMPORT'] = str(not bulk_mode)
     
     successful_imports = []
     erroneous_imports = []
-    from metashare.xml_utils import import_from_file
+    from metashare.xml_utils import import_from_file, bulk_import_from_files, \
+      BULK_IMPORT_STAGES
     from metashare.storage.models import PUBLISHED, MASTER
     from metashare.repository.supermodel import OBJECT_XML_CACHE
     
     # Clean cache before starting the import process.
     OBJECT_XML_CACHE.clear()
     
-    for filename in sys.argv[arg_num:]:
-        temp_file = open(filename, 'rb')
-        success, failure = import_from_file(temp_file, filename, PUBLISHED, MASTER)
-        successful_imports += success
-        erroneous_imports += failure
-        temp_file.close()
+    if bulk_mode:
+        from metashare.repository.models import resourceInfoType_model
+        imported_ids, erroneous_imports, timings = bulk_import_from_files(
+          sys.argv[arg_num:], PUBLISHED, MASTER, **bulk_options)
+        successful_imports = resourceInfoType_model.objects \
+          .filter(id__in=imported_ids).select_related('storage_object')
+        print "Imported {0} resources in {1:.1f} seconds ({2:.1f} " \
+          "resources/s).".format(len(imported_ids), timings['total'],
+            len(imported_ids) / max(timings['total'], 0.001))
+        for stage in BULK_IMPORT_STAGES:
+            print "\t{0}: {1:.1f} seconds".format(stage, timings[stage])
+    else:
+        for filename in sys.argv[arg_num:]:
+            temp_file = open(filename, 'rb')
+            success, failure = import_from_file(temp_file, filename, PUBLISHED, MASTER)
+            successful_imports += success
+            erroneous_imports += failure
+            temp_file.close()
     
     print "Done.  Successfully imported {0} files into the database, errors " \
       "occurred in {1} cases.".format(len(successful_imports), len(erroneous_imports))
@@ -103,8 +139,11 @@ if __name__ == "__main__":
 
     # Be nice and cleanup cache...
     _cache_size = sum([len(x) for x in OBJECT_XML_CACHE.values()])
+    print "OBJECT_XML_CACHE statistics: {} hits, {} misses".format(
+      OBJECT_XML_CACHE.hits, OBJECT_XML_CACHE.misses)
     OBJECT_XML_CACHE.clear()
     print "Cleared OBJECT_XML_CACHE ({} bytes)".format(_cache_size)
     
-    from django.core.management import call_command
-    call_command('rebuild_index', interactive=False)
+    if not bulk_mode:
+        from django.core.management import call_command
+        call_command('rebuild_index', interactive=False)
@@ -4,7 +4,7 @@ to invalid documents.
 """
 from django.core.management.base import BaseCommand
 from metashare.recommendations.recommendations import repair_recommendations
-from metashare.utils import Lock
+from metashare.utils import get_storage_lock
 
 
 class Command(BaseCommand):
@@ -19,7 +19,7 @@ class Command(BaseCommand):
             # before starting, make sure to lock the storage so that any other
             # processes with heavy/frequent operations on the storage don't get
             # in our way
-            lock = Lock('storage')
+            lock = get_storage_lock()
             lock.acquire()
 
             repair_recommendations()
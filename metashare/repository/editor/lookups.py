@@ -1,6 +1,9 @@
 '''
 This file contains the lookup logic for ajax-based editor search widgets.
 '''
+from operator import or_
+
+from django.db.models import Q
 from django.utils.translation import ungettext
 
 from selectable.base import ModelLookup
@@ -12,11 +15,12 @@ from metashare.repository.models import personInfoType_model, \
     targetResourceInfoType_model, languageVarietyInfoType_model, \
     sizeInfoType_model, annotationInfoType_model, videoFormatInfoType_model, \
     imageFormatInfoType_model, resolutionInfoType_model, \
-    audioSizeInfoType_model
+    audioSizeInfoType_model, get_search_key_matches, get_searchable_fields, \
+    get_lookup_index_models, LABEL_FIELD_NAME
 from metashare.storage.models import MASTER
 import logging
 from metashare.settings import LOG_HANDLER
-from metashare.repository.model_utils import get_root_resources
+from metashare.repository.model_utils import get_lookup_index_entry
 
 # Setup logging support.
 LOGGER = logging.getLogger(__name__)
@@ -35,74 +39,79 @@ def print_query_results(results):
             LOGGER.debug(u'No results')
     return
 
+def format_indexed_item(lookup, item, label=None):
+    """
+    Formats the given item of the given lookup with the display label and the
+    resource count from the lookup index, i.e., without computing them.
+
+    A given label is shown instead of the indexed one.
+    """
+    entry = get_lookup_index_entry(item)
+    return {
+        'id': lookup.get_item_id(item),
+        'value': entry.label,
+        'label': ungettext(_AUTO_SUGGEST_SG_TPL, _AUTO_SUGGEST_PL_TPL,
+            entry.resource_count) % {'label': label or entry.label,
+                                     'count': entry.resource_count},
+        'cls': entry.model_name.lower(),
+    }
+
+def get_field_matches(model, term):
+    """
+    Returns a queryset of the ids of the master copies of the given model whose
+    searchable fields have a word starting with the given term.
+    """
+    return get_search_key_matches(model, term, get_searchable_fields(model))
+
 class PersonLookup(ModelLookup):
     model = personInfoType_model
 
     def get_query(self, request, term):
         #results = super(PersonLookup, self).get_query(request, term)
-        # Since MultiTextFields cannot be searched using query sets (they are base64-encoded and pickled),
-        # we must do the searching by hand.
-        # Note: this is inefficient, but in practice fast enough it seems (tested with >1000 resources)
-        lcterm = term.lower()
-        def matches(person):
-            'Helper function to group the search code for a person'
-            for multifield in (person.surname, person.givenName):
-                for field in multifield.itervalues():
-                    if lcterm in field.lower():
-                        return True
-            return False
+        # Since DictFields cannot be searched using query sets (they are base64-encoded and pickled),
+        # the names are matched against their indexed search keys.
         persons = self.get_queryset().filter(copy_status = MASTER)
         if term == '*':
             results = persons
         else:
-            results = [p for p in persons if matches(p)]
+            results = persons.filter(
+                id__in=get_field_matches(personInfoType_model, term))
         print_query_results(results)
         return results
 
     def format_item(self, item):
-        fmt_item = super(PersonLookup, self).format_item(item)
-        count = get_root_resources(item).__len__()
-        lab = fmt_item['label']
-        fmt_item['label'] = ungettext(_AUTO_SUGGEST_SG_TPL,
-            _AUTO_SUGGEST_PL_TPL, count) % {'label': lab, 'count': count}
+        fmt_item = format_indexed_item(self, item)
+        del fmt_item['cls']
         return fmt_item
 
 class GenericUnicodeLookup(ModelLookup):
     '''
-    A reusable base class for lookups that have to be carried out by hand
-    (rather than using querysets to do an efficient database search),
-    doing string matching on the unicode string representing a database item.
+    A reusable base class for lookups that do string matching on the unicode
+    string representing a database item.
+    
+    The unicode strings are kept as display labels in the lookup index, so that
+    their words can be searched using an efficient database query.
     '''
     def get_query(self, request, term):
-        # Since Subclassables and some other classes cannot be searched using query sets,
-        # we must do the searching by hand.
-        # Note: this is inefficient, but in practice fast enough it seems (tested with >1000 resources)
-        lcterm = term.lower()
-        def matches(item):
-            'Helper function to group the search code for a database item'
-            if hasattr(item, 'as_subclass'):
-                if hasattr(item.as_subclass(), 'copy_status'):
-                    if item.as_subclass().copy_status != MASTER:
-                        return False 
-            return lcterm in unicode(item).lower()
-        
         items = self.get_queryset()
         if term == '*':
-            results = items
+            results = self.filter_results(items)
         else:
-            results = [p for p in items if matches(p)]
-        results = self.filter_results(results)
+            matches = []
+            for model in get_lookup_index_models(self.model):
+                model_matches = model.objects.filter(pk__in=
+                    get_search_key_matches(model, term, [LABEL_FIELD_NAME]))
+                if 'copy_status' in model._meta.get_all_field_names():
+                    model_matches = model_matches.filter(copy_status=MASTER)
+                matches.append(Q(pk__in=model_matches.values('pk')))
+            results = items.filter(reduce(or_, matches))
         print_query_results(results)
         return results
     
     def format_item(self, item):
-        fmt_item = super(GenericUnicodeLookup, self).format_item(item)
-        count = get_root_resources(item).__len__()
-        lab = fmt_item['label']
-        fmt_item['label'] = ungettext(_AUTO_SUGGEST_SG_TPL,
-            _AUTO_SUGGEST_PL_TPL, count) % {'label': lab, 'count': count}
-        if hasattr(item, 'as_subclass'):
-            fmt_item['cls'] = item.as_subclass().__class__.__name__.lower()
+        fmt_item = format_indexed_item(self, item)
+        if not hasattr(item, 'as_subclass'):
+            del fmt_item['cls']
         return fmt_item
     
     def filter_results(self, results):
@@ -189,21 +198,12 @@ class ProjectLookup(ModelLookup):
     filters = {}
     
     def get_query(self, request, term):
-        lcterm = term.lower()
-        
-        def matches(project):
-            'Helper function to group the search code for a project'
-            for multifield in (project.projectName, project.projectShortName):
-                for field in multifield.itervalues():
-                    if lcterm in field.lower():
-                        return True
-            return False
-        
         projects = self.get_queryset().filter(copy_status = MASTER)
         if term == '*':
             results = projects
         else:
-            results = [p for p in projects if matches(p)]
+            results = projects.filter(
+                id__in=get_field_matches(projectInfoType_model, term))
         print_query_results(results)
         return results
     
@@ -217,33 +217,22 @@ class ProjectLookup(ModelLookup):
         return item.id
 
     def format_item(self, item):
-        fmt_item = super(ProjectLookup, self).format_item(item)
-        count = get_root_resources(item).__len__()
-        lab = fmt_item['label']
-        fmt_item['label'] = ungettext(_AUTO_SUGGEST_SG_TPL,
-            _AUTO_SUGGEST_PL_TPL, count) % {'label': lab, 'count': count}
+        fmt_item = format_indexed_item(self, item, self.get_item_label(item))
+        del fmt_item['cls']
         return fmt_item
     
 class OrganizationLookup(ModelLookup):
     model = organizationInfoType_model
     
     def get_query(self, request, term):
-        # Since MultiTextFields cannot be searched using query sets (they are base64-encoded and pickled),
-        # we must do the searching by hand.
-        # Note: this is inefficient, but in practice fast enough it seems (tested with >1000 resources)
-        lcterm = term.lower()
-        def matches(org):
-            'Helper function to group the search code for a person'
-            for multifield in (org.organizationShortName, org.organizationName):
-                for field in multifield.itervalues():
-                    if lcterm in field.lower():
-                        return True
-            return False
+        # Since DictFields cannot be searched using query sets (they are base64-encoded and pickled),
+        # the names are matched against their indexed search keys.
         orgs = self.get_queryset().filter(copy_status = MASTER)
         if term == '*':
             results = orgs
         else:
-            results = [p for p in orgs if matches(p)]
+            results = orgs.filter(id__in=
+                get_field_matches(organizationInfoType_model, term))
         print_query_results(results)
         return results
 
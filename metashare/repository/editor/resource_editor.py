@@ -1,4 +1,5 @@
 import datetime
+import logging
 
 from django import forms
 from django.contrib import admin, messages
@@ -38,9 +39,14 @@ from metashare.repository.supermodel import SchemaModel
 from metashare.stats.model_utils import saveLRStats, UPDATE_STAT, INGEST_STAT, DELETE_STAT
 from metashare.storage.models import PUBLISHED, INGESTED, INTERNAL, \
     ALLOWED_ARCHIVE_EXTENSIONS
-from metashare.utils import verify_subclass, create_breadcrumb_template_params
+from metashare.utils import verify_subclass, create_breadcrumb_template_params, \
+    StreamBuffer
 
 
+# Setup logging support.
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(settings.LOG_HANDLER)
+
 csrf_protect_m = method_decorator(csrf_protect)
 
 
@@ -342,34 +348,37 @@ class ResourceModelAdmin(SchemaModelAdmin):
     ingest_action.short_description = _("Ingest selected internal resources")
 
     def export_xml_action(self, request, queryset):
-        from StringIO import StringIO
         from zipfile import ZipFile
+        from metashare.repository.supermodel import batch_export
         from metashare.xml_utils import to_xml_string
         from django import http
 
-        zipfilename = "resources_export.zip"
-        in_memory = StringIO()
-        with ZipFile(in_memory, 'w') as zipfile:
-            for obj in queryset:
-                try:
-                    xml_string = to_xml_string(obj.export_to_elementtree(),
-                                               encoding="utf-8").encode("utf-8")
+        def zip_stream_generator():
+            # the resources are exported in batches with prefetched object
+            # graphs and each zip entry is yielded as soon as it is written, so
+            # that the memory consumption does not depend on the number of
+            # exported resources
+            stream = StreamBuffer()
+            with ZipFile(stream, 'w') as zipfile:
+                for obj, root_node in batch_export(
+                        queryset.select_related('storage_object')):
+                    if root_node is None:
+                        # the response has already been started, so a failed
+                        # export (which has been logged) can only be left out
+                        continue
+                    xml_string = to_xml_string(root_node,
+                                    encoding="utf-8").encode("utf-8")
                     resource_filename = \
                         'resource-{0}.xml'.format(obj.storage_object.id)
                     zipfile.writestr(resource_filename, xml_string)
+                    yield stream.pop()
+            yield stream.pop()
 
-                except Exception:
-                    raise Http404(_('Could not export resource "%(name)s" '
-                        'with primary key %(key)s.') \
-                            % {'name': force_unicode(obj),
-                               'key': escape(obj.storage_object.id)})
-            zipfile.close()
-
-        response = http.HttpResponse(mimetype='application/zip')
+        zipfilename = "resources_export.zip"
+        response = http.HttpResponse(zip_stream_generator(),
+                                     mimetype='application/zip')
         response['Content-Disposition'] = \
             'attachment; filename=%s' % (zipfilename)
-        in_memory.seek(0)
-        response.write(in_memory.read())  
         return response
 
     export_xml_action.short_description = \
@@ -297,6 +297,9 @@ class SchemaModelAdmin(admin.ModelAdmin, RelatedAdminMixin, SchemaModelLookup):
                 # storage object to the storage folder
                 if self.model.__schema_name__ == "resourceInfo":
                     new_object.storage_object.update_storage()
+                # the saved object may have been added to or removed from
+                # parts of resources
+                model_utils.update_root_resources(new_object)
                 #### end modification ####
 
                 self.log_addition(request, new_object)
@@ -455,6 +458,9 @@ class SchemaModelAdmin(admin.ModelAdmin, RelatedAdminMixin, SchemaModelLookup):
                 # storage object to the storage folder
                 if self.model.__schema_name__ == "resourceInfo":
                     new_object.storage_object.update_storage()
+                # the saved object may have been added to or removed from
+                # parts of resources
+                model_utils.update_root_resources(new_object)
                 #### end modification ####
 
                 change_message = self.construct_change_message(request, form, formsets)
@@ -72,7 +72,9 @@ class MultiTextField(models.Field):
     
     If you need to work on MultiTextField instances for filtering, etc. you
     have to retrieve the "real" object instances and check the respective
-    fields of type MultiTextField using "obj.attr" field access.
+    fields of type MultiTextField using "obj.attr" field access. Alternatively,
+    the values of a MultiTextField with `searchable=True` are additionally
+    kept as lowercase search keys in the indexed `FieldSearchKey` table.
     
     Django will auto-magically convert the raw database representation of the
     MultiTextField value(s) to a Python list of Strings during runtime.
@@ -98,6 +100,9 @@ class MultiTextField(models.Field):
         if 'label' in kwargs:
             self.label = kwargs.pop('label')
 
+        # whether the values are kept as search keys in the side table
+        self.searchable = kwargs.pop('searchable', False)
+
         super(MultiTextField, self).__init__(*args, **kwargs)
 
     def validate(self, value, model_instance):
@@ -406,6 +411,11 @@ class DictField(models.Field):
     string if the dictionary is empty. You may override the mechanism which
     determines the default value; see the constructor documentation for more
     information.
+    
+    As the dictionary is stored in a Base64-encoded, pickle'd format, its values
+    cannot be accessed in QuerySet operations. The values of a `DictField` with
+    `searchable=True` are additionally kept as lowercase search keys in the
+    indexed `FieldSearchKey` table, though.
     """
     __metaclass__ = models.SubfieldBase
     default_error_messages = {
@@ -431,9 +441,12 @@ class DictField(models.Field):
         length of a dictionary entry key/value (there isno maximum length by
         default). Any `blank_keys`/`blank_values` arguments denote whether
         keys/values may be empty/None (both must not be empty by default).
+        A `searchable` argument denotes whether the dictionary values are kept
+        as search keys in the `FieldSearchKey` table (not by default).
         """
         kwargs['null'] = True
         self.label = kwargs.pop('label', None)
+        self.searchable = kwargs.pop('searchable', False)
         self.max_key_length = kwargs.pop('max_key_length', None)
         self.max_val_length = kwargs.pop('max_val_length', None)
         self.blank_keys = kwargs.pop('blank_keys', False)
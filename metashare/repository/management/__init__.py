@@ -7,7 +7,9 @@ from django.core.exceptions import ObjectDoesNotExist
 from metashare.utils import get_class_by_name
 from metashare.repository.models import organizationInfoType_model, \
     projectInfoType_model, targetResourceInfoType_model, personInfoType_model, \
-    documentInfoType_model, documentationInfoType_model, actorInfoType_model
+    documentInfoType_model, documentationInfoType_model, actorInfoType_model, \
+    RootResourceEntry, rebuild_root_resource_index, LookupIndexEntry, \
+    FieldSearchKey, rebuild_lookup_index
 
 GROUP_GLOBAL_EDITORS = 'globaleditors'
 
@@ -96,6 +98,29 @@ def set_site_from_django_url(app, created_models, verbosity, **kwargs):
         site.name = 'META-SHARE'
         site.save()
 
+def build_root_resource_index(app, created_models, verbosity, **kwargs):
+    '''
+    Build the root resource index of the existing resources when the index
+    table has just been created, e.g., when upgrading an existing node.
+    '''
+    if RootResourceEntry in created_models:
+        _count = rebuild_root_resource_index()
+        if verbosity >= 1 and _count:
+            print 'Built the root resource index of {0} resources.' \
+                .format(_count)
+
+def build_lookup_index(app, created_models, verbosity, **kwargs):
+    '''
+    Build the editor lookup index and search keys of the existing reusable
+    entities when their tables have just been created, e.g., when upgrading
+    an existing node.
+    '''
+    if LookupIndexEntry in created_models or FieldSearchKey in created_models:
+        for _model_name, _count in rebuild_lookup_index():
+            if verbosity >= 1 and _count:
+                print 'Built the lookup index of {0} {1} instances.' \
+                    .format(_count, _model_name)
+
 
 
 
@@ -111,3 +136,9 @@ signals.post_syncdb.connect(setup_group_global_editors,
 
 signals.post_syncdb.connect(set_site_from_django_url,
     sender=repository_models, dispatch_uid = "metashare.repository.management.set_site_from_django_url")
+
+signals.post_syncdb.connect(build_root_resource_index,
+    sender=repository_models, dispatch_uid = "metashare.repository.management.build_root_resource_index")
+
+signals.post_syncdb.connect(build_lookup_index,
+    sender=repository_models, dispatch_uid = "metashare.repository.management.build_lookup_index")
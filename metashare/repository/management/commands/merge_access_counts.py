@@ -0,0 +1,20 @@
+"""
+Management utility to merge the changed download and view counts of the
+resources into the search index.
+"""
+from django.core.management.base import BaseCommand
+from metashare.repository.search_indexes import merge_access_counts
+
+
+class Command(BaseCommand):
+
+    help = 'Updates the search index entries of all resources whose ' \
+        'download or view count has changed'
+
+    def handle(self, *args, **options):
+        """
+        Merge the changed access counts.
+        """
+        _merged = merge_access_counts()
+        if int(options.get('verbosity', 1)) >= 2:
+            print 'Merged the access counts of {0} resources.'.format(_merged)
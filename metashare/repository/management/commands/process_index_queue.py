@@ -0,0 +1,25 @@
+"""
+Management utility to update the search index entries of the queued resources.
+"""
+from django.core.management.base import BaseCommand
+from metashare.repository.search_indexes import process_index_update_queue
+from metashare.utils import Lock
+
+
+class Command(BaseCommand):
+
+    help = 'Updates the search index entries of all queued resources'
+
+    def handle(self, *args, **options):
+        """
+        Process the index update queue.
+        """
+        # make sure that the queue is never processed by two concurrent jobs
+        lock = Lock('index_queue')
+        try:
+            lock.acquire()
+            _processed = process_index_update_queue()
+            if int(options.get('verbosity', 1)) >= 2:
+                print 'Processed {0} queued index updates.'.format(_processed)
+        finally:
+            lock.release()
@@ -0,0 +1,181 @@
+"""
+Management utility to rebuild the search index of the language resources in
+parallel.
+"""
+import json
+import logging
+import os
+import time
+from bisect import bisect_right
+from multiprocessing import Pool
+from optparse import make_option
+
+from django import db
+from django.core.management.base import BaseCommand
+from haystack import connections as haystack_connections, \
+    connection_router as haystack_connection_router
+
+from metashare import settings
+from metashare.repository.models import resourceInfoType_model
+from metashare.repository.search_indexes import INDEX_SNAPSHOT_FIELDS
+from metashare.repository.supermodel import prefetch_export_graph
+
+
+# Setup logging support.
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(settings.LOG_HANDLER)
+
+# the default number of resources which are indexed with a single request to
+# the search backend
+DEFAULT_BATCH_SIZE = 100
+
+# the file in which the progress of an interrupted rebuild is kept
+CHECKPOINT_FILE = os.path.join(settings.STORAGE_PATH,
+                               'rebuild_resource_index.json')
+
+
+def load_checkpoint(filename=CHECKPOINT_FILE):
+    """
+    Returns the sorted list of the (first id, last id) ranges of resources
+    which have already been indexed according to the given checkpoint file, or
+    None if there is no valid checkpoint.
+    """
+    try:
+        with open(filename) as _file:
+            return sorted(tuple(_range) for _range in json.load(_file)['done'])
+    except (IOError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_checkpoint(done_ranges, filename=CHECKPOINT_FILE):
+    """
+    Writes the given (first id, last id) ranges of indexed resources to the
+    given checkpoint file.
+
+    The file is replaced atomically, so that a crash while writing never
+    leaves a corrupt checkpoint behind.
+    """
+    _tmp_filename = '{0}.tmp'.format(filename)
+    with open(_tmp_filename, 'w') as _file:
+        json.dump({'done': sorted(done_ranges)}, _file)
+    os.rename(_tmp_filename, filename)
+
+
+def get_pending_batches(resource_ids, done_ranges, batch_size):
+    """
+    Returns the list of batches of the given sorted resource ids which are not
+    covered by any of the given sorted (first id, last id) ranges of already
+    indexed resources.
+
+    Each batch is a list of at most `batch_size` consecutive resource ids.
+    """
+    _starts = [_range[0] for _range in done_ranges]
+    _pending = []
+    for _id in resource_ids:
+        _pos = bisect_right(_starts, _id) - 1
+        if _pos < 0 or _id > done_ranges[_pos][1]:
+            _pending.append(_id)
+    return [_pending[i:i + batch_size]
+            for i in range(0, len(_pending), batch_size)]
+
+
+def _index_batch(job):
+    """
+    Indexes the published ones of the resources with the given ids.
+
+    Runs in a worker process with its own database connection. Returns a
+    triple of the first and the last given resource id and the number of
+    indexed resources.
+    """
+    using, resource_ids = job
+    _index = haystack_connections[using].get_unified_index() \
+        .get_index(resourceInfoType_model)
+    # the publication status may have changed since the ids were collected
+    _resources = list(_index.index_queryset().filter(id__in=resource_ids) \
+                      .select_related('storage_object'))
+    if _resources:
+        # the object graphs of all resources of the batch are loaded at once,
+        # so that the preparation of the index documents does not query the
+        # database
+        prefetch_export_graph(_resources, INDEX_SNAPSHOT_FIELDS)
+        haystack_connections[using].get_backend().update(_index, _resources)
+    # clear out the queries of the connection as they bloat up RAM
+    db.reset_queries()
+    return resource_ids[0], resource_ids[-1], len(_resources)
+
+
+class Command(BaseCommand):
+
+    option_list = BaseCommand.option_list + (
+        make_option('-p', '--processes', action='store', dest='processes',
+                    type='int', default=None, help='the number of worker ' \
+                    'processes; defaults to the number of CPUs'),
+        make_option('-b', '--batch-size', action='store', dest='batch_size',
+                    type='int', default=DEFAULT_BATCH_SIZE,
+                    help='the number of resources indexed per request'),
+        make_option('-r', '--resume', action='store_true', dest='resume',
+                    default=False, help='continue an interrupted rebuild ' \
+                    'instead of starting from scratch'),
+        make_option('-u', '--using', action='store', dest='using',
+                    default=None, help='the search backend connection to use'),
+    )
+
+    help = 'Rebuilds the search index of the published resources in parallel'
+
+    def handle(self, *args, **options):
+        """
+        Rebuilds the search index of the published resources.
+
+        The published resource ids are split into batches which are prepared
+        and indexed by a pool of worker processes. The completed batches are
+        recorded in a checkpoint file, so that an interrupted rebuild can be
+        continued with the `--resume` option.
+        """
+        _using = options.get('using') or haystack_connection_router.for_write()
+        _batch_size = max(1, options.get('batch_size') or DEFAULT_BATCH_SIZE)
+        _verbosity = int(options.get('verbosity', 1))
+        _index = haystack_connections[_using].get_unified_index() \
+            .get_index(resourceInfoType_model)
+
+        _done_ranges = None
+        if options.get('resume'):
+            _done_ranges = load_checkpoint()
+            if _done_ranges is None:
+                print 'No checkpoint of an interrupted rebuild found, ' \
+                    'starting from scratch.'
+        if _done_ranges is None:
+            haystack_connections[_using].get_backend() \
+                .clear(models=[resourceInfoType_model])
+            _done_ranges = []
+            save_checkpoint(_done_ranges)
+
+        _ids = list(_index.index_queryset().order_by('id') \
+                    .values_list('id', flat=True))
+        _batches = get_pending_batches(_ids, _done_ranges, _batch_size)
+        _total = sum(len(_batch) for _batch in _batches)
+        if _verbosity >= 1:
+            print 'Indexing {0} of {1} published resources.'.format(_total,
+                                                                     len(_ids))
+
+        # the workers must not share the database connection of this process
+        db.close_connection()
+        _indexed = 0
+        _start = time.time()
+        pool = Pool(options.get('processes'))
+        try:
+            for _first, _last, _count in pool.imap_unordered(_index_batch,
+                    [(_using, _batch) for _batch in _batches]):
+                _done_ranges.append((_first, _last))
+                save_checkpoint(_done_ranges)
+                _indexed += _count
+                if _verbosity >= 1:
+                    print 'Indexed {0} resources ({1:.1f} documents/s).' \
+                        .format(_indexed, _indexed / (time.time() - _start))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+        os.remove(CHECKPOINT_FILE)
+        LOGGER.info('Rebuilt the search index of {0} resources in {1:.1f}s.' \
+                    .format(_indexed, time.time() - _start))
@@ -0,0 +1,25 @@
+"""
+Management utility to rebuild the index which maps the model instances of all
+resources to the resources which contain them.
+"""
+from django.core.management.base import BaseCommand
+
+from metashare.repository.models import rebuild_root_resource_index
+
+
+class Command(BaseCommand):
+
+    help = 'Rebuilds the root resource index of all existing resources'
+
+    def handle(self, *args, **options):
+        """
+        Updates the root resource index entries of all resources.
+
+        Each resource is updated (and committed) on its own, so that the index
+        stays usable while it is rebuilt.
+        """
+        _verbosity = int(options.get('verbosity', 1))
+        _count = rebuild_root_resource_index()
+        if _verbosity >= 1:
+            print 'Updated the root resource index entries of {0} ' \
+                'resources.'.format(_count)
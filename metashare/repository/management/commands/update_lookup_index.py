@@ -0,0 +1,24 @@
+"""
+Management utility to (re-)create the lookup index entries and the search keys
+of all existing model instances which can be looked up in the editor.
+"""
+from django.core.management.base import BaseCommand
+
+from metashare.repository.models import rebuild_lookup_index
+
+
+class Command(BaseCommand):
+
+    help = 'Creates the lookup index entries and the search keys of all ' \
+      + 'existing model instances which can be looked up in the editor'
+
+    def handle(self, *args, **options):
+        """
+        Update the lookup index entries of all instances of the lookup index
+        models.
+        """
+        _verbosity = int(options.get('verbosity', 1))
+        for _model_name, _count in rebuild_lookup_index():
+            if _verbosity >= 1:
+                print 'Updated the lookup index entries of {0} {1} ' \
+                    'instances.'.format(_count, _model_name)
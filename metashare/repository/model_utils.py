@@ -4,13 +4,16 @@ Methods for model data conversion between different representations.
 
 import logging
 
-from django.db.models import OneToOneField, Sum
+from django.db.models import OneToOneField
 
 from metashare.repository.models import resourceInfoType_model, \
     corpusInfoType_model, lexicalConceptualResourceInfoType_model, \
-    languageDescriptionInfoType_model, toolServiceInfoType_model
+    languageDescriptionInfoType_model, toolServiceInfoType_model, \
+    LookupIndexEntry, LOOKUP_INDEX_MODELS, get_lookup_index_models, \
+    update_lookup_index, \
+    update_root_resource_index, get_indexed_root_resource_ids
 from metashare.settings import LOG_HANDLER
-from metashare.stats.models import LRStats
+from metashare.stats.models import get_lr_counter
 
 
 # Setup logging support.
@@ -59,14 +62,31 @@ def get_root_resources(*instances):
     If any of the given instances is a `resourceInfoType_model` itself, then
     this instance will be in the returned set, too. The returned set can be
     empty.
+
+    The root resources are looked up in the root resource index with a single
+    query. The root resources of instances without index entries, e.g., of
+    instances which have been added to a resource outside of the editor, are
+    found by walking the object graph backwards.
     """
-    return _get_root_resources(set(), *instances)
+    result = set(instance for instance in instances
+                 if isinstance(instance, resourceInfoType_model))
+    others = [instance for instance in instances
+              if not isinstance(instance, resourceInfoType_model)]
+    resource_ids, indexed_keys = get_indexed_root_resource_ids(others)
+    if resource_ids:
+        result.update(resourceInfoType_model.objects.filter(
+            id__in=resource_ids))
+    unindexed = [instance for instance in others if instance
+                 and (type(instance).__name__, instance.pk) not in indexed_keys]
+    if unindexed:
+        result.update(_get_root_resources(set(), *unindexed))
+    return result
 
 
 def _get_root_resources(ignore, *instances):
     """
     Returns the set of `resourceInfoType_model` instances which somewhere
-    contain the given model instances.
+    contain the given model instances by walking the object graph backwards.
     
     If any of the given instances is a `resourceInfoType_model` itself, then
     this instance will be in the returned set, too. The returned set can be
@@ -120,6 +140,51 @@ def _get_root_resources(ignore, *instances):
     return result
 
 
+def update_root_resources(*instances):
+    """
+    Brings the root resource index entries of all resources which contain the
+    given model instances up-to-date, e.g., after the instances have been
+    edited.
+
+    Newly created instances are not yet contained in the index; for these, the
+    resources of the instances to which they are attached via "back_to_"
+    foreign keys are updated.
+    """
+    parents = [getattr(instance, rel) for instance in instances if instance
+               for rel in instance._meta.get_all_field_names()
+               if rel.startswith('back_to_')]
+    for resource in get_root_resources(*(list(instances) + parents)):
+        update_root_resource_index(resource)
+
+
+def get_lookup_index_entry(instance):
+    """
+    Returns the lookup index entry of the given instance of a model of the
+    lookup index (or of a superclass of such a model) with an up-to-date
+    resource count.
+
+    The resource count is only determined here if it has not been counted
+    yet; afterwards, it is kept up-to-date with the root resource index.
+    """
+    _entries = LookupIndexEntry.objects.filter(object_id=instance.pk,
+        model_name__in=[_model.__name__ for _model
+                        in get_lookup_index_models(type(instance))])[:1]
+    # the resource count is determined for the most specific instance
+    if type(instance) not in LOOKUP_INDEX_MODELS \
+            and (not _entries or _entries[0].resource_count is None):
+        instance = instance.as_subclass()
+    if _entries:
+        _entry = _entries[0]
+    else:
+        # the instance has not been indexed, yet
+        _entry = update_lookup_index(instance)
+    if _entry.resource_count is None:
+        _entry.resource_count = len(get_root_resources(instance))
+        LookupIndexEntry.objects.filter(id=_entry.id).update(
+            resource_count=_entry.resource_count)
+    return _entry
+
+
 def get_resource_linguality_infos(res_obj):
     """
     Returns a list of all linguality types of the given language resource
@@ -130,13 +195,13 @@ def get_resource_linguality_infos(res_obj):
 
     if isinstance(corpus_media, corpusInfoType_model):
         media_type = corpus_media.corpusMediaType
-        for corpus_info in media_type.corpustextinfotype_model_set.all():
+        for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
             result.append(corpus_info.lingualityInfo
                           .get_lingualityType_display())
         if media_type.corpusAudioInfo:
             result.append(media_type.corpusAudioInfo.lingualityInfo \
                           .get_lingualityType_display())
-        for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+        for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
             if corpus_info.lingualityInfo:
                 result.append(corpus_info.lingualityInfo \
                               .get_lingualityType_display())
@@ -195,7 +260,7 @@ def get_resource_license_types(res_obj):
     available.
     """
     return [licence for licence_info in
-            res_obj.distributionInfo.licenceinfotype_model_set.all()
+            res_obj.distributionInfo.get_related_set('licenceinfotype_model_set')
             for licence in licence_info.get_licence_display_list()]
 
 
@@ -208,11 +273,11 @@ def get_resource_media_types(res_obj):
 
     if isinstance(corpus_media, corpusInfoType_model):
         media_type = corpus_media.corpusMediaType
-        for corpus_info in media_type.corpustextinfotype_model_set.all():
+        for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
             result.append(corpus_info.mediaType)
         if media_type.corpusAudioInfo:
             result.append(media_type.corpusAudioInfo.mediaType)
-        for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+        for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
             result.append(corpus_info.mediaType)
         if media_type.corpusTextNgramInfo:
             result.append(media_type.corpusTextNgramInfo.mediaType)
@@ -265,14 +330,7 @@ def get_lr_stat_action_count(obj_identifier, stats_action):
     
     The obj_identifier is the identifier from the storage object.
     """
-    result = LRStats.objects.filter(lrid=obj_identifier, action=stats_action) \
-        .aggregate(Sum('count'))['count__sum']
-    # `result` may be None in case the filter doesn't match any LRStats for the
-    # specified resource and action
-    if result is not None:
-        return result
-    else:
-        return 0
+    return get_lr_counter(obj_identifier, stats_action)
 
 def get_lr_master_url(resource):
     """
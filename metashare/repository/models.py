@@ -1,17 +1,26 @@
 # pylint: disable-msg=C0302
 import logging
+import re
+import unicodedata
+from operator import or_
+from uuid import uuid4
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q, Count
+from django.db.models.signals import post_save, post_delete, pre_delete, \
+    m2m_changed
 from django.template.defaultfilters import slugify
+from django.utils.encoding import force_unicode
 
 from metashare.accounts.models import EditorGroup
 # pylint: disable-msg=W0611
 from metashare.repository.supermodel import SchemaModel, SubclassableModel, \
   _make_choices_from_list, InvisibleStringModel, \
   REQUIRED, OPTIONAL, RECOMMENDED, \
-  _make_choices_from_int_list
+  _make_choices_from_int_list, OBJECT_XML_CACHE, prefetch_export_graph, \
+  bulk_delete_deep, post_bulk_delete, delete_rows, get_chunks
 from metashare.repository.editor.widgets import MultiFieldWidget
 from metashare.repository.fields import MultiTextField, MetaBooleanField, \
   MultiSelectField, DictField, XmlCharField, best_lang_value_retriever
@@ -19,8 +28,10 @@ from metashare.repository.validators import validate_lang_code_keys, \
   validate_dict_values, validate_xml_schema_year, \
   validate_matches_xml_char_production
 from metashare.settings import DJANGO_BASE, LOG_HANDLER, DJANGO_URL
-from metashare.stats.model_utils import saveLRStats, DELETE_STAT, UPDATE_STAT
+from metashare.stats.model_utils import saveLRStats, DELETE_STAT, UPDATE_STAT, \
+  delete_lr_stats
 from metashare.storage.models import StorageObject, MASTER, COPY_CHOICES
+from metashare.utils import bulk_insert
 from metashare.recommendations.models import ResourceCountPair, \
     ResourceCountDict
 
@@ -232,6 +243,28 @@ class resourceInfoType_model(SchemaModel):
         # Call delete() method from super class with all arguments but keep_stats
         super(resourceInfoType_model, self).delete(*args, **kwargs)
 
+    def delete_deep(self, keep_stats=False):
+        """
+        Overrides the inherited deep deletion to delete the statistics and
+        recommendations, too; use keep_stats optional parameter to suppress
+        deletion of statistics and recommendations.
+        """
+        delete_resources_deep([self], keep_stats)
+
+    @classmethod
+    def import_from_elementtree(cls, element_tree, cleanup=True, parent=None,
+                                copy_status=MASTER):
+        """
+        Overrides the inherited import to add the object graph of the imported
+        resource to the root resource index.
+        """
+        result = super(resourceInfoType_model, cls).import_from_elementtree(
+            element_tree, cleanup, parent, copy_status)
+        if result[0]:
+            update_root_resource_index(result[0])
+            transaction.commit_unless_managed()
+        return result
+
     def get_absolute_url(self):
         return '/{0}{1}'.format(DJANGO_BASE, self.get_relative_url())
         
@@ -2609,6 +2642,7 @@ class organizationInfoType_model(actorInfoType_model):
 
     organizationName = DictField(validators=[validate_lang_code_keys, validate_dict_values],
       default_retriever=best_lang_value_retriever, 
+      searchable=True, 
       verbose_name='Organization name', 
       max_val_length=100, 
       help_text='The full name of an organization',
@@ -2616,6 +2650,7 @@ class organizationInfoType_model(actorInfoType_model):
 
     organizationShortName = DictField(validators=[validate_lang_code_keys, validate_dict_values],
       default_retriever=best_lang_value_retriever, 
+      searchable=True, 
       verbose_name='Organization short name', 
       max_val_length=100, 
       help_text='The short name (abbreviation, acronym etc.) used for an' \
@@ -2684,6 +2719,7 @@ class personInfoType_model(actorInfoType_model):
 
     surname = DictField(validators=[validate_lang_code_keys, validate_dict_values],
       default_retriever=best_lang_value_retriever, 
+      searchable=True, 
       verbose_name='Surname', 
       max_val_length=100, 
       help_text='The surname (family name) of a person related to the re' \
@@ -2692,6 +2728,7 @@ class personInfoType_model(actorInfoType_model):
 
     givenName = DictField(validators=[validate_lang_code_keys, validate_dict_values],
       default_retriever=best_lang_value_retriever, 
+      searchable=True, 
       verbose_name='Given name', 
       max_val_length=100, 
       help_text='The given name (first name) of a person related to the ' \
@@ -3455,6 +3492,7 @@ class projectInfoType_model(SchemaModel):
 
     projectName = DictField(validators=[validate_lang_code_keys, validate_dict_values],
       default_retriever=best_lang_value_retriever, 
+      searchable=True, 
       verbose_name='Project name', 
       max_val_length=500, 
       help_text='The full name of a project related to the resource',
@@ -3462,6 +3500,7 @@ class projectInfoType_model(SchemaModel):
 
     projectShortName = DictField(validators=[validate_lang_code_keys, validate_dict_values],
       default_retriever=best_lang_value_retriever, 
+      searchable=True, 
       verbose_name='Project short name', 
       max_val_length=500, 
       help_text='A short name or abbreviation of a project related to th' \
@@ -7911,3 +7950,859 @@ class documentUnstructuredString_model(InvisibleStringModel, documentationInfoTy
             # pylint: disable-msg=W0201
             self.id = _compute_documentationInfoType_key()
         super(documentUnstructuredString_model, self).save(*args, **kwargs)
+
+
+class ObjectStructureHash(models.Model):
+    """
+    Stores the structural hash of a reusable object, i.e., of an instance of
+    one of the STRUCTURE_HASHED_MODELS, so that the check for duplicate
+    instances during imports can look up the matching objects in the index.
+    """
+    model_name = models.CharField(max_length=64)
+
+    object_id = models.IntegerField()
+
+    value = models.CharField(max_length=32, db_index=True)
+
+    class Meta:
+        unique_together = ('model_name', 'object_id')
+
+
+# reusable objects whose structural hashes are stored in ObjectStructureHash
+STRUCTURE_HASHED_MODELS = (personInfoType_model, organizationInfoType_model,
+                           projectInfoType_model, documentInfoType_model)
+
+
+# maps the models of the (nested) parts of the STRUCTURE_HASHED_MODELS to the
+# (owner model, field name) pairs of the relations between the parts and their
+# owners; "back_to_" foreign keys are fields of the parts, all other relations
+# are fields of the owners
+_STRUCTURE_PART_RELATIONS = {}
+
+
+def _invalidate_structure_hashes_of_containers(model, ids, created=False):
+    """
+    Removes the stored structural hashes and the cached serializations of the
+    given instances of the given model and of all reusable objects which
+    contain them, as their serializations may have changed, too.
+
+    Newly created instances can only be contained in the owners to which they
+    refer themselves via "back_to_" foreign keys.
+    """
+    _pending = [(model, set(ids))]
+    _seen = set()
+    while _pending:
+        _model, _ids = _pending.pop()
+        _ids = set(_id for _id in _ids
+                   if _id is not None and (_model, _id) not in _seen)
+        if not _ids:
+            continue
+        _seen.update((_model, _id) for _id in _ids)
+        _models = [_model] + list(_model._meta.get_parent_list())
+        for _id in _ids:
+            for _cls in _models:
+                OBJECT_XML_CACHE.pop('{}_{}'.format(_cls.__name__.lower(), _id))
+        _hashed = [_cls.__name__ for _cls in STRUCTURE_HASHED_MODELS
+                   if issubclass(_cls, _model) or issubclass(_model, _cls)]
+        if _hashed:
+            ObjectStructureHash.objects.filter(model_name__in=_hashed,
+                                               object_id__in=_ids).delete()
+        for _cls in _models:
+            for _owner, _field_name in _STRUCTURE_PART_RELATIONS.get(_cls, ()):
+                if _field_name.startswith('back_to_'):
+                    _owner_ids = _cls.objects.filter(pk__in=_ids) \
+                        .values_list(_field_name, flat=True)
+                elif created:
+                    continue
+                else:
+                    _owner_ids = _owner.objects.filter(
+                        **{'{}__in'.format(_field_name): _ids}) \
+                        .values_list('pk', flat=True)
+                _pending.append((_owner, _owner_ids))
+        created = False
+
+def _structure_part_saved(sender, instance, created, **kwargs):
+    """
+    Removes the stored structural hashes of the reusable objects which contain
+    the given saved model instance.
+    """
+    _invalidate_structure_hashes_of_containers(sender, [instance.pk], created)
+
+def _structure_part_deleted(sender, instance, **kwargs):
+    """
+    Removes the stored structural hashes of the reusable objects which contain
+    the given model instance which is about to be deleted.
+    """
+    _invalidate_structure_hashes_of_containers(sender, [instance.pk])
+
+def _structure_part_relations_changed(sender, instance, action, **kwargs):
+    """
+    Removes the stored structural hashes of the reusable objects which contain
+    the given model instance whose many-to-many relations change.
+    """
+    # removed relations have to be followed before they are removed
+    if action in ('post_add', 'pre_remove', 'pre_clear'):
+        _invalidate_structure_hashes_of_containers(type(instance),
+                                                   [instance.pk])
+
+def _invalidate_structure_hashes(sender, ids, **kwargs):
+    """
+    Removes the stored structural hashes and the cached serializations of the
+    given bulk deleted reusable objects.
+    """
+    for _chunk in get_chunks(ids):
+        ObjectStructureHash.objects.filter(model_name=sender.__name__,
+                                           object_id__in=_chunk).delete()
+    for _id in ids:
+        OBJECT_XML_CACHE.pop('{}_{}'.format(sender.__name__.lower(), _id))
+
+def _connect_structure_hash_signals():
+    """
+    Keeps the stored structural hashes up-to-date with changed and deleted
+    reusable objects and with their changed and deleted (nested) parts.
+    """
+    _pending = list(STRUCTURE_HASHED_MODELS)
+    _parts = set(_pending)
+    while _pending:
+        _owner = _pending.pop()
+        # the containers of an owner are not part of its structure
+        _relations = [(_field.rel.to, _field.name) for _field
+                      in _owner._meta.fields + _owner._meta.many_to_many
+                      if _field.rel and not _field.name.startswith('back_to_')
+                      and not getattr(_field.rel, 'parent_link', False)] \
+            + [(_rel.model, _rel.field.name) for _rel
+               in _owner._meta.get_all_related_objects()
+               if _rel.field.name.startswith('back_to_')]
+        for _part, _field_name in _relations:
+            if not issubclass(_part, SchemaModel):
+                continue
+            _STRUCTURE_PART_RELATIONS.setdefault(_part, []) \
+                .append((_owner, _field_name))
+            # instances of subclasses may be referred to, too
+            _subclasses = [_part]
+            while _subclasses:
+                _cls = _subclasses.pop()
+                _subclasses.extend(_cls.__subclasses__())
+                if _cls not in _parts:
+                    _parts.add(_cls)
+                    _pending.append(_cls)
+    for _model in _parts:
+        post_save.connect(_structure_part_saved, sender=_model,
+            dispatch_uid='{}_structure_part_saved'.format(_model.__name__))
+        pre_delete.connect(_structure_part_deleted, sender=_model,
+            dispatch_uid='{}_structure_part_deleted'.format(_model.__name__))
+        for _field in _model._meta.local_many_to_many:
+            m2m_changed.connect(_structure_part_relations_changed,
+                sender=_field.rel.through,
+                dispatch_uid='{}_{}_structure_part_relations_changed' \
+                    .format(_model.__name__, _field.name))
+    for _model in STRUCTURE_HASHED_MODELS:
+        post_bulk_delete.connect(_invalidate_structure_hashes, sender=_model,
+            dispatch_uid='{}_invalidate_structure_hashes' \
+                .format(_model.__name__))
+
+_connect_structure_hash_signals()
+
+
+class CacheGeneration(models.Model):
+    """
+    The current generation of a group of cache entries, e.g., of the cached
+    search results pages.
+
+    The generation is part of the cache keys of the group. As it is kept in the
+    database, a new generation invalidates the entries of the group in the
+    caches of all processes, even with a process-local cache backend.
+    """
+    name = models.CharField(max_length=64, unique=True)
+
+    value = models.CharField(max_length=32)
+
+
+def get_cache_generation(name):
+    """
+    Returns the current value of the cache generation with the given name.
+    """
+    _values = CacheGeneration.objects.filter(name=name) \
+        .values_list('value', flat=True)[:1]
+    if _values:
+        return _values[0]
+    return bump_cache_generation(name)
+
+
+def bump_cache_generation(name):
+    """
+    Starts a new cache generation with the given name and returns its value.
+    """
+    # the value is returned as it is read from the database
+    _value = unicode(uuid4().hex)
+    _generations = CacheGeneration.objects.filter(name=name)
+    if not _generations.update(value=_value):
+        # a concurrent request may have created the generation in the meantime
+        _savepoint = transaction.savepoint()
+        try:
+            CacheGeneration.objects.create(name=name, value=_value)
+            transaction.savepoint_commit(_savepoint)
+        except IntegrityError:
+            transaction.savepoint_rollback(_savepoint)
+            _generations.update(value=_value)
+    return _value
+
+
+def _get_resource_view_generation_name(storage_object_id):
+    """
+    Returns the name of the cache generation of the single resource view of the
+    resource with the given storage object id.
+    """
+    return 'resource_view_{}'.format(storage_object_id)
+
+def get_resource_view_cache_key(storage_object):
+    """
+    Returns the cache key of the single resource view template context of the
+    resource with the given storage object.
+
+    The key contains the cache generation of the resource view, so that cached
+    views are invalidated in all processes when the storage object or one of
+    the reusable entities of the resource changes.
+    """
+    return 'resource_view_{}_{}_{}'.format(storage_object.identifier,
+        storage_object.revision,
+        get_cache_generation(_get_resource_view_generation_name(
+            storage_object.pk)))
+
+def _invalidate_resource_view(sender, instance, **kwargs):
+    """
+    Invalidates the cached single resource view of the resource with the given
+    changed storage object.
+    """
+    bump_cache_generation(_get_resource_view_generation_name(instance.pk))
+
+def _remove_resource_view_generation(sender, instance, **kwargs):
+    """
+    Removes the cache generation of the single resource view of the resource
+    with the given deleted storage object.
+    """
+    CacheGeneration.objects.filter(
+        name=_get_resource_view_generation_name(instance.pk)).delete()
+
+def _invalidate_resource_views_of_containers(instance):
+    """
+    Invalidates the cached single resource views of all resources which
+    contain the given model instance according to the root resource index.
+    """
+    _resource_ids = get_indexed_root_resource_ids([instance])[0]
+    if _resource_ids:
+        for _id in resourceInfoType_model.objects \
+                .filter(pk__in=_resource_ids) \
+                .values_list('storage_object_id', flat=True):
+            bump_cache_generation(_get_resource_view_generation_name(_id))
+
+def _shared_instance_saved(sender, instance, created, **kwargs):
+    """
+    Invalidates the cached single resource views of the resources which
+    contain the given saved reusable entity (or part of one).
+    """
+    # a new instance is not yet part of any cached view
+    if not created:
+        _invalidate_resource_views_of_containers(instance)
+
+def _shared_instance_deleted(sender, instance, **kwargs):
+    """
+    Invalidates the cached single resource views of the resources which
+    contain the given reusable entity (or part of one) which is about to be
+    deleted.
+    """
+    _invalidate_resource_views_of_containers(instance)
+
+def _shared_instance_relations_changed(sender, instance, action, **kwargs):
+    """
+    Invalidates the cached single resource views of the resources which
+    contain the given model instance whose many-to-many relations changed.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _invalidate_resource_views_of_containers(instance)
+
+post_save.connect(_invalidate_resource_view, sender=StorageObject,
+    dispatch_uid='storageobject_invalidate_resource_view')
+post_delete.connect(_remove_resource_view_generation, sender=StorageObject,
+    dispatch_uid='storageobject_invalidate_resource_view_on_delete')
+
+
+class PendingIndexUpdate(models.Model):
+    """
+    An entry of the queue of resources whose search index documents have to
+    be updated or removed.
+
+    There is at most one entry per resource, so that repeated changes of a
+    resource are coalesced into a single index update. The revision of the
+    entry is increased whenever the resource is queued again, so that an entry
+    is only removed if the resource has not been queued again while it was
+    indexed.
+    """
+    resource_id = models.IntegerField(unique=True)
+
+    queued = models.DateTimeField(db_index=True)
+
+    revision = models.PositiveIntegerField(default=1)
+
+
+class RootResourceEntry(models.Model):
+    """
+    An entry of the index which maps the model instances of the object graphs
+    of resources to the resources which contain them.
+
+    Each resource has an entry for every instance of its object graph,
+    including itself. Instances of multi-table subclasses have entries for
+    their parent models, too, so that the root resources of both the subclass
+    and the superclass instance can be looked up.
+    """
+    model_name = models.CharField(max_length=64)
+
+    object_id = models.IntegerField()
+
+    resource_id = models.IntegerField(db_index=True)
+
+    class Meta:
+        unique_together = ('model_name', 'object_id', 'resource_id')
+
+
+# the number of obsolete root resource index entries removed with one query
+ROOT_RESOURCE_BATCH_SIZE = 500
+
+
+def _get_object_graph_keys(resource):
+    """
+    Returns the set of (model name, object id) tuples of all instances of the
+    current object graph of the given resource.
+    """
+    # the object graph is loaded for a fresh instance, so that the given
+    # instance is not left with a (later on outdated) prefetched object graph
+    _loaded = prefetch_export_graph(
+        [resourceInfoType_model.objects.get(pk=resource.pk)])
+    _keys = set()
+    for _cls, _pk in _loaded:
+        for _model in [_cls] + list(_cls._meta.get_parent_list()):
+            _keys.add((_model.__name__, _pk))
+    return _keys
+
+
+def update_root_resource_index(resource):
+    """
+    Brings the root resource index entries of the given resource up-to-date
+    with its current object graph.
+    """
+    _keys = _get_object_graph_keys(resource)
+    _obsolete = []
+    _obsolete_keys = []
+    for _id, _model_name, _object_id in RootResourceEntry.objects \
+            .filter(resource_id=resource.pk) \
+            .values_list('id', 'model_name', 'object_id'):
+        if (_model_name, _object_id) in _keys:
+            _keys.remove((_model_name, _object_id))
+        else:
+            _obsolete.append(_id)
+            _obsolete_keys.append((_model_name, _object_id))
+    for _start in range(0, len(_obsolete), ROOT_RESOURCE_BATCH_SIZE):
+        RootResourceEntry.objects.filter(
+            id__in=_obsolete[_start:_start + ROOT_RESOURCE_BATCH_SIZE]).delete()
+    bulk_insert(RootResourceEntry, ('model_name', 'object_id', 'resource_id'),
+        [(_model_name, _object_id, resource.pk)
+         for _model_name, _object_id in _keys])
+    # the resource counts of the lookup index are based on the root resources
+    update_lookup_resource_counts(_obsolete_keys + list(_keys))
+    # the raw queries are left to the transaction management of the caller
+    if transaction.is_managed():
+        transaction.set_dirty()
+
+
+def rebuild_root_resource_index():
+    """
+    Updates the root resource index entries of all resources and removes the
+    entries of removed resources.
+
+    Each resource is updated (and committed) on its own, so that the index
+    stays usable while it is rebuilt. Returns the number of resources.
+    """
+    RootResourceEntry.objects.exclude(
+        resource_id__in=resourceInfoType_model.objects.values('pk')).delete()
+    _count = 0
+    for _id in resourceInfoType_model.objects.order_by('pk') \
+            .values_list('pk', flat=True):
+        update_root_resource_index(resourceInfoType_model(pk=_id))
+        transaction.commit_unless_managed()
+        _count += 1
+    return _count
+
+
+def get_indexed_root_resource_ids(instances):
+    """
+    Returns the set of ids of the resources which contain the given model
+    instances according to the root resource index, together with the set of
+    (model name, object id) keys of the given instances which have entries in
+    the index.
+    """
+    _ids_by_model = {}
+    for _instance in instances:
+        # an instance may be None, in which case we ignore it
+        if _instance and _instance.pk is not None:
+            _ids_by_model.setdefault(type(_instance).__name__, set()) \
+                .add(_instance.pk)
+    _resource_ids = set()
+    _keys = set()
+    if _ids_by_model:
+        for _model_name, _object_id, _resource_id in RootResourceEntry.objects \
+                .filter(reduce(or_, [Q(model_name=_model_name,
+                                       object_id__in=_ids) for _model_name, _ids
+                                     in _ids_by_model.iteritems()])) \
+                .values_list('model_name', 'object_id', 'resource_id'):
+            _resource_ids.add(_resource_id)
+            _keys.add((_model_name, _object_id))
+    return _resource_ids, _keys
+
+
+def _update_root_resources_of_relation(sender, instance, action, reverse,
+                                       model, pk_set, **kwargs):
+    """
+    Keeps the root resource index up-to-date with changed many-to-many
+    relations between indexed model instances, e.g., with a person added to
+    the contact persons of a resource.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse and action != 'post_clear':
+        _owners = model.objects.filter(pk__in=pk_set or ())
+    else:
+        # the resources which contained the former owners after a reverse
+        # clear are the ones which still contain the instance in the index
+        _owners = [instance]
+    for _id in get_indexed_root_resource_ids(_owners)[0]:
+        update_root_resource_index(resourceInfoType_model(pk=_id))
+
+
+def _remove_root_resource_entries(sender, instance, **kwargs):
+    """
+    Removes the root resource index entries of the given deleted resource or
+    other model instance.
+    """
+    if isinstance(instance, resourceInfoType_model):
+        _entries = RootResourceEntry.objects.filter(resource_id=instance.pk)
+        _keys = list(_entries.filter(model_name__in=[_model.__name__
+                for _model in LOOKUP_INDEX_MODELS]) \
+            .values_list('model_name', 'object_id'))
+        _entries.delete()
+        update_lookup_resource_counts(_keys)
+    else:
+        RootResourceEntry.objects.filter(model_name=sender.__name__,
+                                         object_id=instance.pk).delete()
+
+def _remove_bulk_deleted_root_resource_entries(sender, ids, **kwargs):
+    """
+    Removes the root resource index entries of the given bulk deleted
+    resources or other model instances.
+    """
+    if issubclass(sender, resourceInfoType_model):
+        _keys = set()
+        for _chunk in get_chunks(ids):
+            _keys.update(RootResourceEntry.objects.filter(
+                resource_id__in=_chunk, model_name__in=[_model.__name__
+                    for _model in LOOKUP_INDEX_MODELS]) \
+                .values_list('model_name', 'object_id'))
+        delete_rows(RootResourceEntry, 'resource_id', ids)
+        update_lookup_resource_counts(_keys)
+    else:
+        for _chunk in get_chunks(ids):
+            RootResourceEntry.objects.filter(model_name=sender.__name__,
+                                             object_id__in=_chunk).delete()
+
+
+def _connect_root_resource_signals():
+    """
+    Keeps the root resource index up-to-date with the deleted instances of
+    schema models and with the changed many-to-many relations between them.
+    """
+    _models = [SchemaModel]
+    while _models:
+        _model = _models.pop()
+        _models.extend(_model.__subclasses__())
+        if not _model._meta.abstract:
+            post_delete.connect(_remove_root_resource_entries, sender=_model,
+                dispatch_uid='{}_remove_root_resource_entries' \
+                    .format(_model.__name__))
+        for _field in _model._meta.local_many_to_many:
+            if issubclass(_field.rel.to, SchemaModel):
+                m2m_changed.connect(_update_root_resources_of_relation,
+                    sender=_field.rel.through,
+                    dispatch_uid='{}_{}_update_root_resources_of_relation' \
+                        .format(_model.__name__, _field.name))
+
+_connect_root_resource_signals()
+post_bulk_delete.connect(_remove_bulk_deleted_root_resource_entries,
+    dispatch_uid='schemamodel_remove_bulk_deleted_root_resource_entries')
+
+
+@transaction.commit_on_success
+def delete_resources_deep(resources, keep_stats=False,
+                          delete_storage_objects=False):
+    """
+    Deletes the given resources and all their non-reusable parts in bulk (see
+    `bulk_delete_deep()`).
+
+    Includes deletion of statistics and recommendations; use keep_stats
+    optional parameter to suppress deletion of statistics and recommendations.
+    Use delete_storage_objects to delete the storage objects of the resources
+    in the same transaction.
+    """
+    _storage_object_ids = [res.storage_object_id for res in resources]
+    if not keep_stats:
+        _lrids = list(StorageObject.objects.filter(
+            resourceinfotype_model__in=resources) \
+            .values_list('identifier', flat=True))
+        delete_lr_stats(_lrids)
+        ResourceCountPair.objects.filter(lrid__in=_lrids).delete()
+        ResourceCountDict.objects.filter(lrid__in=_lrids).delete()
+    bulk_delete_deep(resources)
+    if delete_storage_objects:
+        StorageObject.objects.filter(pk__in=_storage_object_ids).delete()
+
+
+# the maximum length of a search key; longer values are truncated
+SEARCH_KEY_LENGTH = 100
+
+# matches the words of a value; search keys start at each word
+_SEARCH_KEY_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class FieldSearchKey(models.Model):
+    """
+    A lowercase search key of a value of a searchable `DictField` or
+    `MultiTextField` of a model instance.
+
+    There is a search key for each word of a value, consisting of the rest of
+    the value from that word on, so that an indexed prefix query finds all
+    values with a word starting with the query term.
+    """
+    # the class name of the model of the instance
+    model_name = models.CharField(max_length=64)
+
+    object_id = models.IntegerField(db_index=True)
+
+    field_name = models.CharField(max_length=64)
+
+    key = models.CharField(max_length=SEARCH_KEY_LENGTH, db_index=True)
+
+
+def get_searchable_fields(model):
+    """
+    Returns the names of the searchable fields of the given model.
+    """
+    return [_field.name for _field in model._meta.fields
+            if getattr(_field, 'searchable', False)]
+
+
+def normalize_search_term(value):
+    """
+    Returns the given value in lowercase and without any diacritics.
+    """
+    return u''.join(_char for _char
+                    in unicodedata.normalize('NFKD', force_unicode(value))
+                    if not unicodedata.combining(_char)).lower()
+
+
+def _get_search_keys(value):
+    """
+    Returns the set of search keys for the given field value.
+    """
+    if isinstance(value, dict):
+        value = value.values()
+    _keys = set()
+    for _value in value or ():
+        _value = normalize_search_term(_value)
+        _starts = [0] + [_match.start() for _match
+                         in _SEARCH_KEY_WORD_RE.finditer(_value)]
+        _keys.update(_value[_start:_start + SEARCH_KEY_LENGTH]
+                     for _start in _starts)
+    _keys.discard(u'')
+    return _keys
+
+
+def update_search_keys(instance, label=None):
+    """
+    Brings the search keys of the given model instance up-to-date with the
+    values of its searchable fields and with the given lookup label.
+    """
+    _model_name = type(instance).__name__
+    _keys = set((_field_name, _key)
+                for _field_name in get_searchable_fields(type(instance))
+                for _key in _get_search_keys(getattr(instance, _field_name)))
+    if label is not None:
+        _keys.update((LABEL_FIELD_NAME, _key)
+                     for _key in _get_search_keys([label]))
+    for _id, _field_name, _key in FieldSearchKey.objects.filter(
+            model_name=_model_name, object_id=instance.pk) \
+            .values_list('id', 'field_name', 'key'):
+        if (_field_name, _key) in _keys:
+            _keys.remove((_field_name, _key))
+        else:
+            FieldSearchKey.objects.filter(id=_id).delete()
+    for _field_name, _key in _keys:
+        FieldSearchKey.objects.create(model_name=_model_name,
+            object_id=instance.pk, field_name=_field_name, key=_key)
+
+
+def remove_search_keys(instance):
+    """
+    Removes the search keys of the given model instance.
+    """
+    FieldSearchKey.objects.filter(model_name=type(instance).__name__,
+                                  object_id=instance.pk).delete()
+
+
+def get_search_key_matches(model, term, field_names=None):
+    """
+    Returns a queryset of the ids of the instances of the given model which
+    have a search key with a word starting with the given term, optionally
+    restricted to the search keys of the given fields.
+
+    The term is compared case-insensitively and without diacritics with the
+    first SEARCH_KEY_LENGTH characters of the search keys.
+    """
+    _matches = FieldSearchKey.objects.filter(model_name=model.__name__,
+        key__startswith=normalize_search_term(term)[:SEARCH_KEY_LENGTH])
+    if field_names is not None:
+        _matches = _matches.filter(field_name__in=field_names)
+    return _matches.values_list('object_id', flat=True)
+
+
+# the pseudo field name of the search keys of lookup labels
+LABEL_FIELD_NAME = '__label__'
+
+
+class LookupIndexEntry(models.Model):
+    """
+    The precomputed editor lookup data of an instance of a reusable entity
+    model, i.e., its display label and the number of resources using it.
+
+    The search keys of the label are kept as `FieldSearchKey`s with the field
+    name LABEL_FIELD_NAME.
+    """
+    # the class name of the model of the instance
+    model_name = models.CharField(max_length=64)
+
+    object_id = models.IntegerField()
+
+    label = models.TextField(blank=True)
+
+    # the number of resources which contain the instance; it is counted on
+    # first access and then kept up-to-date with the root resource index
+    resource_count = models.IntegerField(null=True)
+
+    class Meta:
+        unique_together = ('model_name', 'object_id')
+
+
+def update_lookup_resource_counts(keys):
+    """
+    Recounts the resources which contain the instances of the lookup index
+    models with the given (model name, object id) keys according to the root
+    resource index; keys of other models are ignored.
+    """
+    _lookup_model_names = [_model.__name__ for _model in LOOKUP_INDEX_MODELS]
+    _ids_by_model = {}
+    for _model_name, _object_id in keys:
+        if _model_name in _lookup_model_names:
+            _ids_by_model.setdefault(_model_name, set()).add(_object_id)
+    for _model_name, _ids in _ids_by_model.iteritems():
+        for _chunk in get_chunks(list(_ids)):
+            _counts = dict((_id, 0) for _id in _chunk)
+            for _row in RootResourceEntry.objects.filter(
+                    model_name=_model_name, object_id__in=_chunk) \
+                    .values('object_id').annotate(_count=Count('resource_id')):
+                _counts[_row['object_id']] = _row['_count']
+            # the entries with the same count are updated together
+            _ids_by_count = {}
+            for _id, _count in _counts.iteritems():
+                _ids_by_count.setdefault(_count, []).append(_id)
+            for _count, _count_ids in _ids_by_count.iteritems():
+                LookupIndexEntry.objects.filter(model_name=_model_name,
+                    object_id__in=_count_ids).update(resource_count=_count)
+
+
+def _get_lookup_label(instance):
+    """
+    Returns the up-to-date display label of the given model instance.
+    """
+    try:
+        # unlike `unicode(instance)`, this is not cached
+        return instance.real_unicode_()
+    # pylint: disable-msg=W0703
+    except Exception:
+        return unicode(instance)
+
+
+def update_lookup_index(instance):
+    """
+    Brings the lookup index entry and the search keys of the given model
+    instance up-to-date.
+
+    Returns the lookup index entry.
+    """
+    _label = _get_lookup_label(instance)
+    update_search_keys(instance, _label)
+    _model_name = type(instance).__name__
+    _entries = LookupIndexEntry.objects.filter(model_name=_model_name,
+                                               object_id=instance.pk)
+    if _entries.update(label=_label):
+        return _entries[0]
+    # a concurrent request may have created the entry in the meantime
+    _savepoint = transaction.savepoint()
+    try:
+        _entry = LookupIndexEntry.objects.create(model_name=_model_name,
+            object_id=instance.pk, label=_label)
+        transaction.savepoint_commit(_savepoint)
+        return _entry
+    except IntegrityError:
+        transaction.savepoint_rollback(_savepoint)
+    return _entries[0]
+
+
+def remove_from_lookup_index(instance):
+    """
+    Removes the lookup index entry and the search keys of the given model
+    instance.
+    """
+    remove_search_keys(instance)
+    LookupIndexEntry.objects.filter(model_name=type(instance).__name__,
+                                    object_id=instance.pk).delete()
+
+
+@transaction.commit_on_success
+def rebuild_lookup_index():
+    """
+    Updates the lookup index entries and the search keys of all instances of
+    the lookup index models and removes the ones of removed instances.
+
+    Returns a list of (model name, number of instances) tuples.
+    """
+    _counts = []
+    for _model in LOOKUP_INDEX_MODELS:
+        # the entries and search keys of removed instances are dropped
+        _filter = {'model_name': _model.__name__}
+        FieldSearchKey.objects.filter(**_filter) \
+            .exclude(object_id__in=_model.objects.values('pk')).delete()
+        LookupIndexEntry.objects.filter(**_filter) \
+            .exclude(object_id__in=_model.objects.values('pk')).delete()
+        _keys = []
+        for _instance in _model.objects.all().iterator():
+            update_lookup_index(_instance)
+            _keys.append((_model.__name__, _instance.pk))
+        update_lookup_resource_counts(_keys)
+        _counts.append((_model.__name__, len(_keys)))
+    return _counts
+
+
+def get_lookup_index_models(model):
+    """
+    Returns the models of the lookup index which are the given model or one of
+    its subclasses.
+    """
+    return [_model for _model in LOOKUP_INDEX_MODELS
+            if issubclass(_model, model)]
+
+
+def _lookup_instance_saved(sender, instance, **kwargs):
+    """
+    Keeps the lookup index up-to-date with saved model instances.
+    """
+    update_lookup_index(instance)
+
+
+def _lookup_instance_deleted(sender, instance, **kwargs):
+    """
+    Removes deleted model instances from the lookup index.
+    """
+    remove_from_lookup_index(instance)
+
+
+def _lookup_instances_bulk_deleted(sender, ids, **kwargs):
+    """
+    Removes bulk deleted model instances from the lookup index.
+    """
+    for _chunk in get_chunks(ids):
+        FieldSearchKey.objects.filter(model_name=sender.__name__,
+                                      object_id__in=_chunk).delete()
+        LookupIndexEntry.objects.filter(model_name=sender.__name__,
+                                        object_id__in=_chunk).delete()
+
+
+def _lookup_instance_relations_changed(sender, instance, action, reverse,
+                                       **kwargs):
+    """
+    Keeps the lookup labels up-to-date with the changed many-to-many relations
+    of model instances.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            for _instance in kwargs['model'].objects.filter(
+                    pk__in=kwargs['pk_set'] or ()):
+                update_lookup_index(_instance)
+        else:
+            update_lookup_index(instance)
+
+
+def _lookup_related_instance_saved(sender, instance, **kwargs):
+    """
+    Keeps the lookup labels up-to-date with the saved model instances which
+    they refer to.
+    """
+    for _model, _field_name in _LOOKUP_LABEL_RELATIONS.get(sender, ()):
+        for _instance in _model.objects.filter(**{_field_name: instance}):
+            update_lookup_index(_instance)
+
+
+# the models of reusable entities which can be looked up in the editor; the
+# models with searchable fields are a subset of these
+LOOKUP_INDEX_MODELS = (personInfoType_model, organizationInfoType_model,
+                       projectInfoType_model, documentInfoType_model,
+                       targetResourceInfoType_model)
+SEARCHABLE_MODELS = (personInfoType_model, organizationInfoType_model,
+                     projectInfoType_model)
+
+# maps models to the (lookup index model, field name) pairs of the foreign
+# keys which refer to them from the lookup index models
+_LOOKUP_LABEL_RELATIONS = {}
+
+for _model in LOOKUP_INDEX_MODELS:
+    post_save.connect(_lookup_instance_saved, sender=_model,
+        dispatch_uid="metashare.repository.models._lookup_instance_saved")
+    post_delete.connect(_lookup_instance_deleted, sender=_model,
+        dispatch_uid="metashare.repository.models._lookup_instance_deleted")
+    post_bulk_delete.connect(_lookup_instances_bulk_deleted, sender=_model,
+        dispatch_uid="metashare.repository.models." \
+            "_lookup_instances_bulk_deleted")
+    for _field in _model._meta.local_many_to_many:
+        m2m_changed.connect(_lookup_instance_relations_changed,
+            sender=_field.rel.through, dispatch_uid="metashare.repository." \
+                "models._lookup_instance_relations_changed")
+    for _field in _model._meta.local_fields:
+        # the containers of an instance do not contribute to its label
+        if _field.rel and not _field.rel.parent_link \
+                and not _field.name.startswith('back_to_'):
+            _LOOKUP_LABEL_RELATIONS.setdefault(_field.rel.to, []) \
+                .append((_model, _field.name))
+for _model in _LOOKUP_LABEL_RELATIONS:
+    post_save.connect(_lookup_related_instance_saved, sender=_model,
+        dispatch_uid="metashare.repository.models." \
+            "_lookup_related_instance_saved")
+# the single resource views show the reusable entities with their (nested)
+# parts, which are edited independently of the resources
+for _model in set(LOOKUP_INDEX_MODELS) | set(_STRUCTURE_PART_RELATIONS):
+    post_save.connect(_shared_instance_saved, sender=_model,
+        dispatch_uid="{}_shared_instance_saved".format(_model.__name__))
+    pre_delete.connect(_shared_instance_deleted, sender=_model,
+        dispatch_uid="{}_shared_instance_deleted".format(_model.__name__))
+    for _field in _model._meta.local_many_to_many:
+        m2m_changed.connect(_shared_instance_relations_changed,
+            sender=_field.rel.through,
+            dispatch_uid="{}_{}_shared_instance_relations_changed" \
+                .format(_model.__name__, _field.name))
+# the loop variables must not be mistaken for schema models
+del _model, _field
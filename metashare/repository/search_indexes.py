@@ -1,44 +1,244 @@
 import logging
 import os
 import re
+from datetime import datetime
 
+from haystack.constants import ID
 from haystack.indexes import CharField, IntegerField, RealTimeSearchIndex
+from haystack.utils import get_identifier
 from haystack import indexes, connections as haystack_connections, \
     connection_router as haystack_connection_router
 
-from django.db.models import signals
+from django.db import transaction, IntegrityError
+from django.db.models import signals, F
 from django.utils.translation import ugettext as _
 from unidecode import unidecode
 
+from metashare import settings
+from metashare.haystack_backends import bump_index_generation
 from metashare.repository import model_utils
-from metashare.repository.models import resourceInfoType_model, \
+from metashare.repository.models import PendingIndexUpdate, \
+    resourceInfoType_model, \
     corpusInfoType_model, \
     toolServiceInfoType_model, lexicalConceptualResourceInfoType_model, \
     languageDescriptionInfoType_model
 from metashare.repository.search_fields import LabeledCharField, \
     LabeledMultiValueField
+from metashare.repository.supermodel import prefetch_export_graph, \
+    post_bulk_delete
 from metashare.storage.models import StorageObject, INGESTED, PUBLISHED
 from metashare.settings import LOG_HANDLER
 from metashare.stats.model_utils import DOWNLOAD_STAT, VIEW_STAT
+from metashare.stats.models import LRCounter
 
 
 # Setup logging support.
 LOGGER = logging.getLogger(__name__)
 LOGGER.addHandler(LOG_HANDLER)
 
+# the relations of the resource object graph which are read when preparing the
+# index documents; only these are loaded into the snapshot of a resource
+INDEX_SNAPSHOT_FIELDS = frozenset((
+    'annotationinfotype_model_set', 'audioContentInfo',
+    'audioclassificationinfotype_model_set', 'audioformatinfotype_model_set',
+    'corpusAudioInfo', 'corpusImageInfo', 'corpusMediaType',
+    'corpusTextNgramInfo', 'corpusTextNumericalInfo',
+    'corpustextinfotype_model_set', 'corpusvideoinfotype_model_set',
+    'distributionInfo', 'domaininfotype_model_set',
+    'foreseenuseinfotype_model_set', 'geographiccoverageinfotype_model_set',
+    'identificationInfo', 'imageContentInfo',
+    'imageclassificationinfotype_model_set', 'imageformatinfotype_model_set',
+    'inputInfo', 'languageDescriptionEncodingInfo',
+    'languageDescriptionImageInfo', 'languageDescriptionMediaType',
+    'languageDescriptionTextInfo', 'languageDescriptionVideoInfo',
+    'languageVarietyInfo', 'languageinfotype_model_set',
+    'lexicalConceptualResourceAudioInfo',
+    'lexicalConceptualResourceEncodingInfo',
+    'lexicalConceptualResourceImageInfo', 'lexicalConceptualResourceMediaType',
+    'lexicalConceptualResourceTextInfo', 'lexicalConceptualResourceVideoInfo',
+    'licenceinfotype_model_set', 'lingualityInfo', 'modalityInfo',
+    'modalityinfotype_model_set', 'ngramInfo', 'outputInfo',
+    'resourceComponentType', 'settingInfo', 'textNumericalContentInfo',
+    'textclassificationinfotype_model_set', 'textformatinfotype_model_set',
+    'timecoverageinfotype_model_set', 'toolServiceEvaluationInfo',
+    'usageInfo', 'validationinfotype_model_set', 'videoContentInfo',
+    'videoclassificationinfotype_model_set', 'videoformatinfotype_model_set',
+))
+
 
 def update_lr_index_entry(res_obj):
     """
     Updates/creates the search index entry for the given language resource
     object.
     
-    The appropriate search index is automatically chosen.
+    The appropriate search index is automatically chosen. If index updates
+    are queued, then the resource is only added to the index update queue.
     """
+    if settings.QUEUE_INDEX_UPDATES:
+        enqueue_index_update(res_obj.id)
+        return
     haystack_connections[haystack_connection_router.for_write()] \
         .get_unified_index().get_index(resourceInfoType_model) \
         .update_object(res_obj)
 
 
+def update_lr_index_entries(res_objs):
+    """
+    Updates/creates the search index entries for the published ones of the
+    given language resource objects with a single request to the search
+    backend.
+    
+    The appropriate search index is automatically chosen.
+    """
+    _using = haystack_connection_router.for_write()
+    _index = haystack_connections[_using].get_unified_index() \
+        .get_index(resourceInfoType_model)
+    _published = [res_obj for res_obj in res_objs
+        if res_obj.storage_object.publication_status == PUBLISHED]
+    if _published:
+        # the object graphs of all resources are loaded at once, so that the
+        # preparation of the index documents does not query the database
+        prefetch_export_graph(_published, INDEX_SNAPSHOT_FIELDS)
+        haystack_connections[_using].get_backend().update(_index, _published)
+        bump_index_generation()
+
+
+def enqueue_index_update(resource_id):
+    """
+    Adds the language resource with the given id to the index update queue
+    unless it is already queued.
+    """
+    if PendingIndexUpdate.objects.filter(resource_id=resource_id) \
+            .update(queued=datetime.now(), revision=F('revision') + 1):
+        return
+    # a concurrent request may have queued the resource in the meantime
+    _savepoint = transaction.savepoint()
+    try:
+        PendingIndexUpdate.objects.create(resource_id=resource_id,
+                                          queued=datetime.now())
+        transaction.savepoint_commit(_savepoint)
+    except IntegrityError:
+        transaction.savepoint_rollback(_savepoint)
+
+
+def merge_access_counts():
+    """
+    Updates the search index entries of all language resources whose download
+    or view count has changed since it has last been merged into the index and
+    returns the number of these resources.
+
+    If index updates are queued, then the resources are only added to the
+    index update queue.
+    """
+    _counters = list(LRCounter.objects \
+        .filter(action__in=(DOWNLOAD_STAT, VIEW_STAT)) \
+        .exclude(count=F('indexed_count')).values_list('id', 'lrid', 'count'))
+    _lrids = sorted(set(_lrid for _, _lrid, _ in _counters))
+    for i in range(0, len(_lrids), settings.INDEX_QUEUE_BATCH_SIZE):
+        _batch = set(_lrids[i:i + settings.INDEX_QUEUE_BATCH_SIZE])
+        _resources = list(resourceInfoType_model.objects.filter(
+                storage_object__identifier__in=_batch) \
+            .select_related('storage_object'))
+        if settings.QUEUE_INDEX_UPDATES:
+            for _resource in _resources:
+                enqueue_index_update(_resource.id)
+        else:
+            update_lr_index_entries(_resources)
+        # the counters are only marked as merged once the index entries have
+        # been updated (or queued); only the counts read above are marked, so
+        # that later increments are merged again the next time
+        _merged = {}
+        for _id, _lrid, _count in _counters:
+            if _lrid in _batch:
+                _merged.setdefault(_count, []).append(_id)
+        for _count, _ids in _merged.iteritems():
+            LRCounter.objects.filter(id__in=_ids).update(indexed_count=_count)
+    return len(_lrids)
+
+
+def process_index_update_queue(batch_size=None):
+    """
+    Updates the search index entries of all language resources in the index
+    update queue and returns the number of processed queue entries.
+
+    The queued resources are handled in batches, so that each batch is
+    indexed with a single request to the search backend. Resources which are
+    not published (anymore) or which do not exist anymore are removed from
+    the index. The queue entries are only removed after the search backend
+    has been updated successfully.
+
+    If a batch cannot be indexed, then its resources are indexed one by one.
+    The entries of resources which still cannot be indexed are moved to the
+    end of the queue and retried the next time the queue is processed.
+    """
+    batch_size = batch_size or settings.INDEX_QUEUE_BATCH_SIZE
+    _using = haystack_connection_router.for_write()
+    _index = haystack_connections[_using].get_unified_index() \
+        .get_index(resourceInfoType_model)
+    _backend = haystack_connections[_using].get_backend()
+    _processed = 0
+    _failed = set()
+    while True:
+        # entries which have failed in this run are not tried again
+        _queue = PendingIndexUpdate.objects.order_by('queued')
+        if _failed:
+            _queue = _queue.exclude(resource_id__in=_failed)
+        _revisions = dict(_queue.values_list('resource_id',
+                                             'revision')[:batch_size])
+        if not _revisions:
+            break
+        try:
+            _update_queued_index_entries(_index, _backend, _revisions.keys())
+            _indexed = _revisions.keys()
+        except:
+            LOGGER.warn('Could not update the index entries of the queued ' \
+                'resources {0}; trying one by one.'.format(_revisions.keys()),
+                exc_info=True)
+            _indexed = []
+            for _id in _revisions.keys():
+                try:
+                    _update_queued_index_entries(_index, _backend, [_id])
+                    _indexed.append(_id)
+                except:
+                    LOGGER.error('Could not update the index entry of the ' \
+                        'queued resource #{0}; it will be retried later.' \
+                        .format(_id), exc_info=True)
+                    _failed.add(_id)
+            PendingIndexUpdate.objects.filter(resource_id__in=_failed) \
+                .update(queued=datetime.now())
+        if not _indexed:
+            continue
+        bump_index_generation()
+        # entries of resources which have been queued again in the meantime
+        # have a new revision and are kept for the next batch
+        _ids_by_revision = {}
+        for _id in _indexed:
+            _ids_by_revision.setdefault(_revisions[_id], []).append(_id)
+        for _revision, _revision_ids in _ids_by_revision.iteritems():
+            PendingIndexUpdate.objects.filter(resource_id__in=_revision_ids,
+                                              revision=_revision).delete()
+        _processed += len(_indexed)
+    return _processed
+
+
+def _update_queued_index_entries(index, backend, ids):
+    """
+    Updates the search index entries of the language resources with the given
+    ids with the given search index and backend; the entries of resources
+    which are not published (anymore) or which do not exist anymore are
+    removed.
+    """
+    _meta = resourceInfoType_model._meta
+    _published = list(index.index_queryset().filter(id__in=ids) \
+                      .select_related('storage_object'))
+    if _published:
+        prefetch_export_graph(_published, INDEX_SNAPSHOT_FIELDS)
+        backend.update(index, _published)
+    for _id in set(ids).difference(res.id for res in _published):
+        backend.remove('{0}.{1}.{2}'.format(_meta.app_label,
+                                            _meta.module_name, _id))
+
+
 class PatchedRealTimeSearchIndex(RealTimeSearchIndex):
     """
     A patched version of the `RealTimeSearchIndex` which works around Haystack
@@ -352,7 +552,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
                     # resourceInfoType_model
                     return
                 related_resource = related_resource_qs.iterator().next()
-                if instance.deleted:
+                if instance.deleted and not settings.QUEUE_INDEX_UPDATES:
                     # if the resource has been flagged for deletion, then we
                     # don't want to keep/have it in the index
                     LOGGER.info("Resource #{0} scheduled for deletion from " \
@@ -364,6 +564,13 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
                 assert False, "Unexpected sender: {0}".format(kwargs["sender"])
                 LOGGER.error("Unexpected sender: {0}".format(kwargs["sender"]))
                 return
+            # the index entry is updated (or removed) later on when the index
+            # update queue is processed
+            if settings.QUEUE_INDEX_UPDATES:
+                LOGGER.debug("Resource #{0} queued for reindexing." \
+                             .format(instance.id))
+                enqueue_index_update(instance.id)
+                return
         # we better recreate our resource instance from the DB as otherwise it
         # has happened for some reason that the instance was not up-to-date
         instance = self.get_model().objects.get(pk=instance.id)
@@ -373,6 +580,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
                         .format(instance.id))
             super(resourceInfoType_modelIndex, self) \
                 .update_object(instance, using=using, **kwargs)
+            bump_index_generation()
         # make sure that there are no index entries for ingested/unpublished
         # resources
         elif instance.storage_object.publication_status == INGESTED:
@@ -380,6 +588,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
                         "index if it is currently indexed.".format(instance.id))
             super(resourceInfoType_modelIndex, self) \
                 .remove_object(instance, using=using, **kwargs)
+            bump_index_generation()
 
     def _setup_save(self):
         """
@@ -416,9 +625,81 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
             # set by Django's post_delete signal dispatcher has a different
             # meaning that we need to overwrite
             using = None
+            if settings.QUEUE_INDEX_UPDATES:
+                enqueue_index_update(instance.id)
+                return
         super(resourceInfoType_modelIndex, self).remove_object(instance,
                                                                using=using,
                                                                **kwargs)
+        bump_index_generation()
+
+    def _setup_delete(self):
+        """
+        A hook for controlling what happens when the registered model is
+        deleted.
+
+        In this implementation we additionally connect to the bulk deletions
+        of resources by `bulk_delete_deep()`.
+        """
+        if super(resourceInfoType_modelIndex, self)._setup_delete():
+            return True
+        post_bulk_delete.connect(self.remove_objects, sender=self.get_model())
+        return False
+
+    def _teardown_delete(self):
+        """
+        A hook for removing the behavior when the registered model is deleted.
+
+        In this implementation we additionally disconnect from the bulk
+        deletions of resources by `bulk_delete_deep()`.
+        """
+        if super(resourceInfoType_modelIndex, self)._teardown_delete():
+            return True
+        post_bulk_delete.disconnect(self.remove_objects,
+                                    sender=self.get_model())
+        return False
+
+    def remove_objects(self, sender, ids, **kwargs):
+        """
+        Removes the bulk deleted resources with the given ids from the index.
+        """
+        if os.environ.get('DISABLE_INDEXING_DURING_IMPORT', False) == 'True':
+            return
+        for _id in sorted(ids):
+            # the index entry is removed later on when the index update queue
+            # is processed
+            if settings.QUEUE_INDEX_UPDATES:
+                enqueue_index_update(_id)
+            else:
+                super(resourceInfoType_modelIndex, self) \
+                    .remove_object(sender(id=_id), using=None)
+        if not settings.QUEUE_INDEX_UPDATES:
+            bump_index_generation()
+
+    def prepare(self, obj):
+        """
+        Fetches and adds/alters data before indexing.
+
+        The object graph of the given resource is bulk-loaded first (unless
+        this has already been done for a whole batch of resources), so that
+        all filter and sort fields are computed from the same in-memory
+        snapshot instead of walking the graph with individual queries.
+        """
+        if getattr(obj, '_export_cache', None) is None:
+            prefetch_export_graph([obj], INDEX_SNAPSHOT_FIELDS)
+        return super(resourceInfoType_modelIndex, self).prepare(obj)
+
+    def _get_prepared_filter(self, obj, filter_name):
+        """
+        Returns the values of the filter with the given name for the given
+        resource, reusing them if they have already been prepared for the
+        current index document.
+        """
+        _prepared_data = getattr(self, 'prepared_data', None) or {}
+        if _prepared_data.get(ID) == get_identifier(obj) \
+                and filter_name in _prepared_data:
+            return _prepared_data[filter_name]
+        return getattr(self, 'prepare_{}'.format(filter_name))(obj)
 
     def prepare_dl_count(self, obj):
         """
@@ -453,7 +734,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         Collect the data to sort the Resource Types
         """
         # get the list of Resource Types
-        resourceTypeSort = self.prepare_resourceTypeFilter(obj)
+        resourceTypeSort = self._get_prepared_filter(obj, 'resourceTypeFilter')
         # render unique list of Resource Types
         resourceTypeSort = list(set(resourceTypeSort))
         # sort Resource Types
@@ -472,7 +753,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         Collect the data to sort the Media Types
         """
         # get the list of Media Types
-        mediaTypeSort = self.prepare_mediaTypeFilter(obj)
+        mediaTypeSort = self._get_prepared_filter(obj, 'mediaTypeFilter')
         # render unique list of Media Types
         mediaTypeSort = list(set(mediaTypeSort))
         # sort Media Types
@@ -491,7 +772,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         Collect the data to sort the Language Names
         """
         # get the list of languages
-        languageNameSort = self.prepare_languageNameFilter(obj)
+        languageNameSort = self._get_prepared_filter(obj, 'languageNameFilter')
         # render unique list of languages
         languageNameSort = list(set(languageNameSort))
         # sort languages
@@ -514,48 +795,48 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
 
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 result.extend([lang.languageName for lang in
-                               corpus_info.languageinfotype_model_set.all()])
+                               corpus_info.get_related_set('languageinfotype_model_set')])
             if media_type.corpusAudioInfo:
                 result.extend([lang.languageName for lang in
-                               media_type.corpusAudioInfo.languageinfotype_model_set.all()])
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+                               media_type.corpusAudioInfo.get_related_set('languageinfotype_model_set')])
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 result.extend([lang.languageName for lang in
-                               corpus_info.languageinfotype_model_set.all()])
+                               corpus_info.get_related_set('languageinfotype_model_set')])
             if media_type.corpusTextNgramInfo:
                 result.extend([lang.languageName for lang in
-                            media_type.corpusTextNgramInfo.languageinfotype_model_set.all()])
+                            media_type.corpusTextNgramInfo.get_related_set('languageinfotype_model_set')])
             if media_type.corpusImageInfo:
                 result.extend([lang.languageName for lang in
-                               media_type.corpusImageInfo.languageinfotype_model_set.all()])
+                               media_type.corpusImageInfo.get_related_set('languageinfotype_model_set')])
 
         elif isinstance(corpus_media, lexicalConceptualResourceInfoType_model):
             lcr_media_type = corpus_media.lexicalConceptualResourceMediaType
             if lcr_media_type.lexicalConceptualResourceAudioInfo:
                 result.extend([lang.languageName for lang in lcr_media_type \
-                        .lexicalConceptualResourceAudioInfo.languageinfotype_model_set.all()])
+                        .lexicalConceptualResourceAudioInfo.get_related_set('languageinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceTextInfo:
                 result.extend([lang.languageName for lang in lcr_media_type \
-                        .lexicalConceptualResourceTextInfo.languageinfotype_model_set.all()])
+                        .lexicalConceptualResourceTextInfo.get_related_set('languageinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceVideoInfo:
                 result.extend([lang.languageName for lang in lcr_media_type \
-                        .lexicalConceptualResourceVideoInfo.languageinfotype_model_set.all()])
+                        .lexicalConceptualResourceVideoInfo.get_related_set('languageinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceImageInfo:
                 result.extend([lang.languageName for lang in lcr_media_type \
-                        .lexicalConceptualResourceImageInfo.languageinfotype_model_set.all()])
+                        .lexicalConceptualResourceImageInfo.get_related_set('languageinfotype_model_set')])
 
         elif isinstance(corpus_media, languageDescriptionInfoType_model):
             ld_media_type = corpus_media.languageDescriptionMediaType
             if ld_media_type.languageDescriptionTextInfo:
                 result.extend([lang.languageName for lang in ld_media_type \
-                            .languageDescriptionTextInfo.languageinfotype_model_set.all()])
+                            .languageDescriptionTextInfo.get_related_set('languageinfotype_model_set')])
             if ld_media_type.languageDescriptionVideoInfo:
                 result.extend([lang.languageName for lang in ld_media_type \
-                            .languageDescriptionVideoInfo.languageinfotype_model_set.all()])
+                            .languageDescriptionVideoInfo.get_related_set('languageinfotype_model_set')])
             if ld_media_type.languageDescriptionImageInfo:
                 result.extend([lang.languageName for lang in ld_media_type \
-                            .languageDescriptionImageInfo.languageinfotype_model_set.all()])
+                            .languageDescriptionImageInfo.get_related_set('languageinfotype_model_set')])
 
         elif isinstance(corpus_media, toolServiceInfoType_model):
             if corpus_media.inputInfo:
@@ -597,7 +878,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         Collect the data to filter the resources on Restrictions Of USe
         """
         return [restr for licence_info in
-                obj.distributionInfo.licenceinfotype_model_set.all()
+                obj.distributionInfo.get_related_set('licenceinfotype_model_set')
                 for restr in licence_info.get_restrictionsOfUse_display_list()]
 
     def prepare_validatedFilter(self, obj):
@@ -605,7 +886,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         Collect the data to filter the resources on Validated
         """
         return [validation_info.validated for validation_info in
-                obj.validationinfotype_model_set.all()]
+                obj.get_related_set('validationinfotype_model_set')]
 
     def prepare_foreseenUseFilter(self, obj):
         """
@@ -613,7 +894,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         """
         if obj.usageInfo:
             return [use_info.get_foreseenUse_display() for use_info in
-                    obj.usageInfo.foreseenuseinfotype_model_set.all()]
+                    obj.usageInfo.get_related_set('foreseenuseinfotype_model_set')]
         return []
 
     def prepare_useNlpSpecificFilter(self, obj):
@@ -622,7 +903,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         """
         if obj.usageInfo:
             return [use for use_info in
-                    obj.usageInfo.foreseenuseinfotype_model_set.all()
+                    obj.usageInfo.get_related_set('foreseenuseinfotype_model_set')
                     for use in use_info.get_useNLPSpecific_display_list()]
         return []
 
@@ -641,7 +922,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
 
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 mtf = corpus_info.lingualityInfo \
                   .get_multilingualityType_display()
                 if mtf != '':
@@ -651,7 +932,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
                   .get_multilingualityType_display()
                 if mtf != '':
                     result.append(mtf)
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 if corpus_info.lingualityInfo:
                     mtf = corpus_info.lingualityInfo \
                   .get_multilingualityType_display()
@@ -729,15 +1010,15 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
 
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 result.extend([mt for modalityInfo in
-                        corpus_info.modalityinfotype_model_set.all() for mt in
+                        corpus_info.get_related_set('modalityinfotype_model_set') for mt in
                         modalityInfo.get_modalityType_display_list()])
             if media_type.corpusAudioInfo:
                 result.extend([mt for modalityInfo in
-                        media_type.corpusAudioInfo.modalityinfotype_model_set.all()
+                        media_type.corpusAudioInfo.get_related_set('modalityinfotype_model_set')
                         for mt in modalityInfo.get_modalityType_display_list()])
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 if corpus_info.modalityInfo:
                     result.extend(corpus_info.modalityInfo \
                                   .get_modalityType_display_list())
@@ -747,31 +1028,31 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
                               .get_modalityType_display_list())
             if media_type.corpusImageInfo:
                 result.extend([mt for modalityInfo in
-                               media_type.corpusImageInfo.modalityinfotype_model_set.all()
+                               media_type.corpusImageInfo.get_related_set('modalityinfotype_model_set')
                                for mt in
                                modalityInfo.get_modalityType_display_list()])
             if media_type.corpusTextNumericalInfo:
                 result.extend([mt for modalityInfo in
-                        media_type.corpusTextNumericalInfo.modalityinfotype_model_set.all()
+                        media_type.corpusTextNumericalInfo.get_related_set('modalityinfotype_model_set')
                         for mt in modalityInfo.get_modalityType_display_list()])
 
         elif isinstance(corpus_media, lexicalConceptualResourceInfoType_model):
             lcr_media_type = corpus_media.lexicalConceptualResourceMediaType
             if lcr_media_type.lexicalConceptualResourceTextInfo:
                 result.extend([mt for modalityInfo in lcr_media_type \
-                        .lexicalConceptualResourceTextInfo.modalityinfotype_model_set.all()
+                        .lexicalConceptualResourceTextInfo.get_related_set('modalityinfotype_model_set')
                         for mt in modalityInfo.get_modalityType_display_list()])
             if lcr_media_type.lexicalConceptualResourceAudioInfo:
                 result.extend([mt for modalityInfo in lcr_media_type \
-                        .lexicalConceptualResourceAudioInfo.modalityinfotype_model_set.all()
+                        .lexicalConceptualResourceAudioInfo.get_related_set('modalityinfotype_model_set')
                         for mt in modalityInfo.get_modalityType_display_list()])
             if lcr_media_type.lexicalConceptualResourceVideoInfo:
                 result.extend([mt for modalityInfo in lcr_media_type \
-                        .lexicalConceptualResourceVideoInfo.modalityinfotype_model_set.all()
+                        .lexicalConceptualResourceVideoInfo.get_related_set('modalityinfotype_model_set')
                         for mt in modalityInfo.get_modalityType_display_list()])
             if lcr_media_type.lexicalConceptualResourceImageInfo:
                 result.extend([mt for modalityInfo in lcr_media_type \
-                        .lexicalConceptualResourceImageInfo.modalityinfotype_model_set.all()
+                        .lexicalConceptualResourceImageInfo.get_related_set('modalityinfotype_model_set')
                         for mt in modalityInfo.get_modalityType_display_list()])
 
         elif isinstance(corpus_media, languageDescriptionInfoType_model):
@@ -782,11 +1063,11 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
                               .modalityInfo.get_modalityType_display_list())
             if ld_media_type.languageDescriptionVideoInfo:
                 result.extend([mt for modalityInfo in ld_media_type \
-                        .languageDescriptionVideoInfo.modalityinfotype_model_set.all()
+                        .languageDescriptionVideoInfo.get_related_set('modalityinfotype_model_set')
                         for mt in modalityInfo.get_modalityType_display_list()])
             if ld_media_type.languageDescriptionImageInfo:
                 result.extend([mt for modalityInfo in ld_media_type \
-                        .languageDescriptionImageInfo.modalityinfotype_model_set.all()
+                        .languageDescriptionImageInfo.get_related_set('modalityinfotype_model_set')
                         for mt in modalityInfo.get_modalityType_display_list()])
 
         elif isinstance(corpus_media, toolServiceInfoType_model):
@@ -808,55 +1089,55 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
 
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 mimeType_list.extend([mimeType.mimeType for mimeType in
-                                      corpus_info.textformatinfotype_model_set.all()])
+                                      corpus_info.get_related_set('textformatinfotype_model_set')])
             if media_type.corpusAudioInfo:
                 mimeType_list.extend([mimeType.mimeType for mimeType in
-                        media_type.corpusAudioInfo.audioformatinfotype_model_set.all()])
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+                        media_type.corpusAudioInfo.get_related_set('audioformatinfotype_model_set')])
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 mimeType_list.extend([mimeType.mimeType for mimeType in
-                                      corpus_info.videoformatinfotype_model_set.all()])
+                                      corpus_info.get_related_set('videoformatinfotype_model_set')])
             if media_type.corpusTextNgramInfo:
                 mimeType_list.extend([mimeType.mimeType for mimeType in
-                        media_type.corpusTextNgramInfo.textformatinfotype_model_set.all()])
+                        media_type.corpusTextNgramInfo.get_related_set('textformatinfotype_model_set')])
             if media_type.corpusImageInfo:
                 mimeType_list.extend([mimeType.mimeType for mimeType in
-                        media_type.corpusImageInfo.imageformatinfotype_model_set.all()])
+                        media_type.corpusImageInfo.get_related_set('imageformatinfotype_model_set')])
 
         elif isinstance(corpus_media, lexicalConceptualResourceInfoType_model):
             lcr_media_type = corpus_media.lexicalConceptualResourceMediaType
             if lcr_media_type.lexicalConceptualResourceTextInfo:
                 mimeType_list.extend([mimeType.mimeType for mimeType in
                         lcr_media_type.lexicalConceptualResourceTextInfo \
-                            .textformatinfotype_model_set.all()])
+                            .get_related_set('textformatinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceAudioInfo:
                 mimeType_list.extend([mimeType.mimeType for mimeType in
                         lcr_media_type.lexicalConceptualResourceAudioInfo \
-                            .audioformatinfotype_model_set.all()])
+                            .get_related_set('audioformatinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceVideoInfo:
                 mimeType_list.extend([mimeType.mimeType for mimeType in
                         lcr_media_type.lexicalConceptualResourceVideoInfo \
-                            .videoformatinfotype_model_set.all()])
+                            .get_related_set('videoformatinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceImageInfo:
                 mimeType_list.extend([mimeType.mimeType for mimeType in
                         lcr_media_type.lexicalConceptualResourceImageInfo \
-                            .imageformatinfotype_model_set.all()])
+                            .get_related_set('imageformatinfotype_model_set')])
 
         elif isinstance(corpus_media, languageDescriptionInfoType_model):
             ld_media_type = corpus_media.languageDescriptionMediaType
             if ld_media_type.languageDescriptionTextInfo:
                 mimeType_list.extend([mimeType.mimeType for mimeType in
                         ld_media_type.languageDescriptionTextInfo \
-                            .textformatinfotype_model_set.all()])
+                            .get_related_set('textformatinfotype_model_set')])
             if ld_media_type.languageDescriptionVideoInfo:
                 mimeType_list.extend([mimeType.mimeType for mimeType in
                         ld_media_type.languageDescriptionVideoInfo \
-                            .videoformatinfotype_model_set.all()])
+                            .get_related_set('videoformatinfotype_model_set')])
             if ld_media_type.languageDescriptionImageInfo:
                 mimeType_list.extend([mimeType.mimeType for mimeType in
                         ld_media_type.languageDescriptionImageInfo \
-                            .imageformatinfotype_model_set.all()])
+                            .get_related_set('imageformatinfotype_model_set')])
 
         elif isinstance(corpus_media, toolServiceInfoType_model):
             if corpus_media.inputInfo:
@@ -875,23 +1156,23 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
 
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
-                for annotation_info in corpus_info.annotationinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
+                for annotation_info in corpus_info.get_related_set('annotationinfotype_model_set'):
                     result.extend(annotation_info.get_conformanceToStandardsBestPractices_display_list())
             if media_type.corpusAudioInfo:
-                for annotation_info in media_type.corpusAudioInfo.annotationinfotype_model_set.all():
+                for annotation_info in media_type.corpusAudioInfo.get_related_set('annotationinfotype_model_set'):
                     result.extend(annotation_info.get_conformanceToStandardsBestPractices_display_list())
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
-                for annotation_info in corpus_info.annotationinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
+                for annotation_info in corpus_info.get_related_set('annotationinfotype_model_set'):
                     result.extend(annotation_info.get_conformanceToStandardsBestPractices_display_list())
             if media_type.corpusTextNgramInfo:
-                for annotation_info in media_type.corpusTextNgramInfo.annotationinfotype_model_set.all():
+                for annotation_info in media_type.corpusTextNgramInfo.get_related_set('annotationinfotype_model_set'):
                     result.extend(annotation_info.get_conformanceToStandardsBestPractices_display_list())
             if media_type.corpusImageInfo:
-                for annotation_info in media_type.corpusImageInfo.annotationinfotype_model_set.all():
+                for annotation_info in media_type.corpusImageInfo.get_related_set('annotationinfotype_model_set'):
                     result.extend(annotation_info.get_conformanceToStandardsBestPractices_display_list())
             if media_type.corpusTextNumericalInfo:
-                for annotation_info in media_type.corpusTextNumericalInfo.annotationinfotype_model_set.all():
+                for annotation_info in media_type.corpusTextNumericalInfo.get_related_set('annotationinfotype_model_set'):
                     result.extend(annotation_info.get_conformanceToStandardsBestPractices_display_list())
 
         elif isinstance(corpus_media, lexicalConceptualResourceInfoType_model):
@@ -923,55 +1204,55 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
 
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 result.extend([domain_info.domain for domain_info in
-                               corpus_info.domaininfotype_model_set.all()])
+                               corpus_info.get_related_set('domaininfotype_model_set')])
             if media_type.corpusAudioInfo:
                 result.extend([domain_info.domain for domain_info in
-                               media_type.corpusAudioInfo.domaininfotype_model_set.all()])
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+                               media_type.corpusAudioInfo.get_related_set('domaininfotype_model_set')])
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 result.extend([domain_info.domain for domain_info in
-                               corpus_info.domaininfotype_model_set.all()])
+                               corpus_info.get_related_set('domaininfotype_model_set')])
             if media_type.corpusTextNgramInfo:
                 result.extend([domain_info.domain for domain_info in
-                               media_type.corpusTextNgramInfo.domaininfotype_model_set.all()])
+                               media_type.corpusTextNgramInfo.get_related_set('domaininfotype_model_set')])
             if media_type.corpusImageInfo:
                 result.extend([domain_info.domain for domain_info in
-                               media_type.corpusImageInfo.domaininfotype_model_set.all()])
+                               media_type.corpusImageInfo.get_related_set('domaininfotype_model_set')])
 
         elif isinstance(corpus_media, lexicalConceptualResourceInfoType_model):
             lcr_media_type = corpus_media.lexicalConceptualResourceMediaType
             if lcr_media_type.lexicalConceptualResourceTextInfo:
                 result.extend([domain_info.domain for domain_info in
                         lcr_media_type.lexicalConceptualResourceTextInfo \
-                                .domaininfotype_model_set.all()])
+                                .get_related_set('domaininfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceAudioInfo:
                 result.extend([domain_info.domain for domain_info in
                         lcr_media_type.lexicalConceptualResourceAudioInfo \
-                                .domaininfotype_model_set.all()])
+                                .get_related_set('domaininfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceVideoInfo:
                 result.extend([domain_info.domain for domain_info in
                         lcr_media_type.lexicalConceptualResourceVideoInfo \
-                                .domaininfotype_model_set.all()])
+                                .get_related_set('domaininfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceImageInfo:
                 result.extend([domain_info.domain for domain_info in
                         lcr_media_type.lexicalConceptualResourceImageInfo \
-                                .domaininfotype_model_set.all()])
+                                .get_related_set('domaininfotype_model_set')])
 
         elif isinstance(corpus_media, languageDescriptionInfoType_model):
             ld_media_type = corpus_media.languageDescriptionMediaType
             if ld_media_type.languageDescriptionTextInfo:
                 result.extend([domain_info.domain for domain_info in
                                ld_media_type.languageDescriptionTextInfo \
-                                    .domaininfotype_model_set.all()])
+                                    .get_related_set('domaininfotype_model_set')])
             if ld_media_type.languageDescriptionVideoInfo:
                 result.extend([domain_info.domain for domain_info in
                                ld_media_type.languageDescriptionVideoInfo \
-                                    .domaininfotype_model_set.all()])
+                                    .get_related_set('domaininfotype_model_set')])
             if ld_media_type.languageDescriptionImageInfo:
                 result.extend([domain_info.domain for domain_info in
                                ld_media_type.languageDescriptionImageInfo \
-                                    .domaininfotype_model_set.all()])
+                                    .get_related_set('domaininfotype_model_set')])
 
         return result
 
@@ -984,58 +1265,58 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
 
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 result.extend([gc_info.geographicCoverage for gc_info in
-                               corpus_info.geographiccoverageinfotype_model_set.all()])
+                               corpus_info.get_related_set('geographiccoverageinfotype_model_set')])
             if media_type.corpusAudioInfo:
                 result.extend([gc_info.geographicCoverage for gc_info in
                                media_type.corpusAudioInfo \
-                                    .geographiccoverageinfotype_model_set.all()])
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+                                    .get_related_set('geographiccoverageinfotype_model_set')])
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 result.extend([gc_info.geographicCoverage for gc_info in
-                               corpus_info.geographiccoverageinfotype_model_set.all()])
+                               corpus_info.get_related_set('geographiccoverageinfotype_model_set')])
             if media_type.corpusTextNgramInfo:
                 result.extend([gc_info.geographicCoverage for gc_info in
                                media_type.corpusTextNgramInfo \
-                                    .geographiccoverageinfotype_model_set.all()])
+                                    .get_related_set('geographiccoverageinfotype_model_set')])
             if media_type.corpusImageInfo:
                 result.extend([gc_info.geographicCoverage for gc_info in
                                media_type.corpusImageInfo \
-                                    .geographiccoverageinfotype_model_set.all()])
+                                    .get_related_set('geographiccoverageinfotype_model_set')])
 
         elif isinstance(corpus_media, lexicalConceptualResourceInfoType_model):
             lcr_media_type = corpus_media.lexicalConceptualResourceMediaType
             if lcr_media_type.lexicalConceptualResourceTextInfo:
                 result.extend([gc_info.geographicCoverage for gc_info in
                         lcr_media_type.lexicalConceptualResourceTextInfo \
-                            .geographiccoverageinfotype_model_set.all()])
+                            .get_related_set('geographiccoverageinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceAudioInfo:
                 result.extend([gc_info.geographicCoverage for gc_info in
                         lcr_media_type.lexicalConceptualResourceAudioInfo \
-                            .geographiccoverageinfotype_model_set.all()])
+                            .get_related_set('geographiccoverageinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceVideoInfo:
                 result.extend([gc_info.geographicCoverage for gc_info in
                         lcr_media_type.lexicalConceptualResourceVideoInfo \
-                            .geographiccoverageinfotype_model_set.all()])
+                            .get_related_set('geographiccoverageinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceImageInfo:
                 result.extend([gc_info.geographicCoverage for gc_info in
                         lcr_media_type.lexicalConceptualResourceImageInfo \
-                            .geographiccoverageinfotype_model_set.all()])
+                            .get_related_set('geographiccoverageinfotype_model_set')])
 
         elif isinstance(corpus_media, languageDescriptionInfoType_model):
             ld_media_type = corpus_media.languageDescriptionMediaType
             if ld_media_type.languageDescriptionTextInfo:
                 result.extend([gc_info.geographicCoverage for gc_info in
                                ld_media_type.languageDescriptionTextInfo \
-                                    .geographiccoverageinfotype_model_set.all()])
+                                    .get_related_set('geographiccoverageinfotype_model_set')])
             if ld_media_type.languageDescriptionVideoInfo:
                 result.extend([gc_info.geographicCoverage for gc_info in
                                ld_media_type.languageDescriptionVideoInfo \
-                                    .geographiccoverageinfotype_model_set.all()])
+                                    .get_related_set('geographiccoverageinfotype_model_set')])
             if ld_media_type.languageDescriptionImageInfo:
                 result.extend([gc_info.geographicCoverage for gc_info in
                                ld_media_type.languageDescriptionImageInfo \
-                                    .geographiccoverageinfotype_model_set.all()])
+                                    .get_related_set('geographiccoverageinfotype_model_set')])
 
         return result
 
@@ -1048,55 +1329,55 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
 
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 result.extend([timeCoverage.timeCoverage for timeCoverage in
-                               corpus_info.timecoverageinfotype_model_set.all()])
+                               corpus_info.get_related_set('timecoverageinfotype_model_set')])
             if media_type.corpusAudioInfo:
                 result.extend([timeCoverage.timeCoverage for timeCoverage in
-                        media_type.corpusAudioInfo.timecoverageinfotype_model_set.all()])
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+                        media_type.corpusAudioInfo.get_related_set('timecoverageinfotype_model_set')])
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 result.extend([timeCoverage.timeCoverage for timeCoverage in
-                               corpus_info.timecoverageinfotype_model_set.all()])
+                               corpus_info.get_related_set('timecoverageinfotype_model_set')])
             if media_type.corpusTextNgramInfo:
                 result.extend([timeCoverage.timeCoverage for timeCoverage in
-                        media_type.corpusTextNgramInfo.timecoverageinfotype_model_set.all()])
+                        media_type.corpusTextNgramInfo.get_related_set('timecoverageinfotype_model_set')])
             if media_type.corpusImageInfo:
                 result.extend([timeCoverage.timeCoverage for timeCoverage in
-                        media_type.corpusImageInfo.timecoverageinfotype_model_set.all()])
+                        media_type.corpusImageInfo.get_related_set('timecoverageinfotype_model_set')])
 
         elif isinstance(corpus_media, lexicalConceptualResourceInfoType_model):
             lcr_media_type = corpus_media.lexicalConceptualResourceMediaType
             if lcr_media_type.lexicalConceptualResourceTextInfo:
                 result.extend([timeCoverage.timeCoverage for timeCoverage in
                             lcr_media_type.lexicalConceptualResourceTextInfo \
-                                .timecoverageinfotype_model_set.all()])
+                                .get_related_set('timecoverageinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceAudioInfo:
                 result.extend([timeCoverage.timeCoverage for timeCoverage in
                             lcr_media_type.lexicalConceptualResourceAudioInfo \
-                                .timecoverageinfotype_model_set.all()])
+                                .get_related_set('timecoverageinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceVideoInfo:
                 result.extend([timeCoverage.timeCoverage for timeCoverage in
                             lcr_media_type.lexicalConceptualResourceVideoInfo \
-                                .timecoverageinfotype_model_set.all()])
+                                .get_related_set('timecoverageinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceImageInfo:
                 result.extend([timeCoverage.timeCoverage for timeCoverage in
                             lcr_media_type.lexicalConceptualResourceImageInfo \
-                                .timecoverageinfotype_model_set.all()])
+                                .get_related_set('timecoverageinfotype_model_set')])
 
         elif isinstance(corpus_media, languageDescriptionInfoType_model):
             ld_media_type = corpus_media.languageDescriptionMediaType
             if ld_media_type.languageDescriptionTextInfo:
                 result.extend([timeCoverage.timeCoverage for timeCoverage in
                         ld_media_type.languageDescriptionTextInfo \
-                            .timecoverageinfotype_model_set.all()])
+                            .get_related_set('timecoverageinfotype_model_set')])
             if ld_media_type.languageDescriptionVideoInfo:
                 result.extend([timeCoverage.timeCoverage for timeCoverage in
                         ld_media_type.languageDescriptionVideoInfo \
-                            .timecoverageinfotype_model_set.all()])
+                            .get_related_set('timecoverageinfotype_model_set')])
             if ld_media_type.languageDescriptionImageInfo:
                 result.extend([timeCoverage.timeCoverage for timeCoverage in
                         ld_media_type.languageDescriptionImageInfo \
-                            .timecoverageinfotype_model_set.all()])
+                            .get_related_set('timecoverageinfotype_model_set')])
 
         return result
 
@@ -1109,31 +1390,31 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
 
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 sf = [class_info.subject_topic for class_info in
-                    corpus_info.textclassificationinfotype_model_set.all()]
+                    corpus_info.get_related_set('textclassificationinfotype_model_set')]
                 if sf != ['']:
                     result.extend(sf)
             if media_type.corpusAudioInfo:
                 sf = [class_info.subject_topic for class_info in
-                    media_type.corpusAudioInfo.audioclassificationinfotype_model_set.all()]
+                    media_type.corpusAudioInfo.get_related_set('audioclassificationinfotype_model_set')]
                 if sf != ['']:
                     result.extend(sf)
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 sf = [class_info.subject_topic for class_info in
-                        corpus_info.videoclassificationinfotype_model_set.all()]
+                        corpus_info.get_related_set('videoclassificationinfotype_model_set')]
                 if sf != ['']:
                     result.extend(sf)
             if media_type.corpusTextNgramInfo:
                 sf = [class_info.subject_topic for class_info in
                         media_type.corpusTextNgramInfo \
-                            .textclassificationinfotype_model_set.all()]
+                            .get_related_set('textclassificationinfotype_model_set')]
                 if sf != ['']:
                     result.extend(sf)
             if media_type.corpusImageInfo:
                 sf = [class_info.subject_topic for class_info in
                         media_type.corpusImageInfo \
-                            .imageclassificationinfotype_model_set.all()]
+                            .get_related_set('imageclassificationinfotype_model_set')]
                 if sf != ['']:
                     result.extend(sf)
 
@@ -1150,23 +1431,23 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         # Filter for corpus
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
-                for annotation_info in corpus_info.annotationinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
+                for annotation_info in corpus_info.get_related_set('annotationinfotype_model_set'):
                     result.append(annotation_info.get_annotationType_display())
             if media_type.corpusAudioInfo:
-                for annotation_info in media_type.corpusAudioInfo.annotationinfotype_model_set.all():
+                for annotation_info in media_type.corpusAudioInfo.get_related_set('annotationinfotype_model_set'):
                     result.append(annotation_info.get_annotationType_display())
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
-                for annotation_info in corpus_info.annotationinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
+                for annotation_info in corpus_info.get_related_set('annotationinfotype_model_set'):
                     result.append(annotation_info.get_annotationType_display())
             if media_type.corpusTextNgramInfo:
-                for annotation_info in media_type.corpusTextNgramInfo.annotationinfotype_model_set.all():
+                for annotation_info in media_type.corpusTextNgramInfo.get_related_set('annotationinfotype_model_set'):
                     result.append(annotation_info.get_annotationType_display())
             if media_type.corpusImageInfo:
-                for annotation_info in media_type.corpusImageInfo.annotationinfotype_model_set.all():
+                for annotation_info in media_type.corpusImageInfo.get_related_set('annotationinfotype_model_set'):
                     result.append(annotation_info.get_annotationType_display())
             if media_type.corpusTextNumericalInfo:
-                for annotation_info in media_type.corpusTextNumericalInfo.annotationinfotype_model_set.all():
+                for annotation_info in media_type.corpusTextNumericalInfo.get_related_set('annotationinfotype_model_set'):
                     result.append(annotation_info.get_annotationType_display())
 
         return result
@@ -1182,23 +1463,23 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         # Filter for corpus
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
-                for annotation_info in corpus_info.annotationinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
+                for annotation_info in corpus_info.get_related_set('annotationinfotype_model_set'):
                     result.append(annotation_info.annotationFormat)
             if media_type.corpusAudioInfo:
-                for annotation_info in media_type.corpusAudioInfo.annotationinfotype_model_set.all():
+                for annotation_info in media_type.corpusAudioInfo.get_related_set('annotationinfotype_model_set'):
                     result.append(annotation_info.annotationFormat)
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
-                for annotation_info in corpus_info.annotationinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
+                for annotation_info in corpus_info.get_related_set('annotationinfotype_model_set'):
                     result.append(annotation_info.annotationFormat)
             if media_type.corpusTextNgramInfo:
-                for annotation_info in media_type.corpusTextNgramInfo.annotationinfotype_model_set.all():
+                for annotation_info in media_type.corpusTextNgramInfo.get_related_set('annotationinfotype_model_set'):
                     result.append(annotation_info.annotationFormat)
             if media_type.corpusImageInfo:
-                for annotation_info in media_type.corpusImageInfo.annotationinfotype_model_set.all():
+                for annotation_info in media_type.corpusImageInfo.get_related_set('annotationinfotype_model_set'):
                     result.append(annotation_info.annotationFormat)
             if media_type.corpusTextNumericalInfo:
-                for annotation_info in media_type.corpusTextNumericalInfo.annotationinfotype_model_set.all():
+                for annotation_info in media_type.corpusTextNumericalInfo.get_related_set('annotationinfotype_model_set'):
                     result.append(annotation_info.annotationFormat)
 
         return result
@@ -1420,9 +1701,9 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         # Filter for corpus
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 result.extend([text_classification_info.textGenre \
-                  for text_classification_info in corpus_info.textclassificationinfotype_model_set.all()])
+                  for text_classification_info in corpus_info.get_related_set('textclassificationinfotype_model_set')])
 
         return result
 
@@ -1437,9 +1718,9 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         # Filter for corpus
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 result.extend([text_classification_info.textType \
-                  for text_classification_info in corpus_info.textclassificationinfotype_model_set.all()])
+                  for text_classification_info in corpus_info.get_related_set('textclassificationinfotype_model_set')])
 
         return result
     
@@ -1454,9 +1735,9 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         # Filter for corpus
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 result.extend([text_classification_info.register \
-                  for text_classification_info in corpus_info.textclassificationinfotype_model_set.all()])
+                  for text_classification_info in corpus_info.get_related_set('textclassificationinfotype_model_set')])
 
         return result
     
@@ -1473,7 +1754,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
             media_type = corpus_media.corpusMediaType
             if media_type.corpusAudioInfo:
                 result.extend([audio_classification_info.get_audioGenre_display() \
-                  for audio_classification_info in media_type.corpusAudioInfo.audioclassificationinfotype_model_set.all()])
+                  for audio_classification_info in media_type.corpusAudioInfo.get_related_set('audioclassificationinfotype_model_set')])
 
         return result
     
@@ -1490,7 +1771,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
             media_type = corpus_media.corpusMediaType
             if media_type.corpusAudioInfo:
                 result.extend([audio_classification_info.get_speechGenre_display() 
-                  for audio_classification_info in media_type.corpusAudioInfo.audioclassificationinfotype_model_set.all()])
+                  for audio_classification_info in media_type.corpusAudioInfo.get_related_set('audioclassificationinfotype_model_set')])
 
         return result
     
@@ -1507,7 +1788,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
             media_type = corpus_media.corpusMediaType
             if media_type.corpusAudioInfo:
                 result.extend([audio_classification_info.register \
-                  for audio_classification_info in media_type.corpusAudioInfo.audioclassificationinfotype_model_set.all()])
+                  for audio_classification_info in media_type.corpusAudioInfo.get_related_set('audioclassificationinfotype_model_set')])
 
         return result
     
@@ -1597,11 +1878,11 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         # Filter for corpus
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 if corpus_info.videoclassificationinfotype_model_set:
                     result.extend([video_classification_info.videoGenre
                         for video_classification_info
-                        in corpus_info.videoclassificationinfotype_model_set.all()
+                        in corpus_info.get_related_set('videoclassificationinfotype_model_set')
                         if video_classification_info.videoGenre])
 
         return result
@@ -1617,7 +1898,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         # Filter for corpus
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 if corpus_info.videoContentInfo:
                     result.extend(corpus_info.videoContentInfo \
                                   .typeOfVideoContent)
@@ -1651,7 +1932,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         # Filter for corpus
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 if corpus_info.settingInfo:
                     result.append(corpus_info.settingInfo.get_naturality_display())
 
@@ -1668,7 +1949,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         # Filter for corpus
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 if corpus_info.settingInfo:
                     result.append(corpus_info.settingInfo.get_conversationalType_display())
 
@@ -1685,7 +1966,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
         # Filter for corpus
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 if corpus_info.settingInfo:
                     result.append(corpus_info.settingInfo.get_scenarioType_display())
 
@@ -1704,7 +1985,7 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
             media_type = corpus_media.corpusMediaType
             if media_type.corpusImageInfo:
                 for image_classification_info in media_type.corpusImageInfo \
-                        .imageclassificationinfotype_model_set.all():
+                        .get_related_set('imageclassificationinfotype_model_set'):
                     if image_classification_info.imageGenre:
                         result.append(image_classification_info.imageGenre)
 
@@ -1793,67 +2074,67 @@ class resourceInfoType_modelIndex(PatchedRealTimeSearchIndex,
 
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
-                for lang in corpus_info.languageinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
+                for lang in corpus_info.get_related_set('languageinfotype_model_set'):
                     result.extend([variety.languageVarietyName for variety in
-                               lang.languageVarietyInfo.all()])
+                               lang.get_related_set('languageVarietyInfo')])
             if media_type.corpusAudioInfo:
-                for lang in media_type.corpusAudioInfo.languageinfotype_model_set.all():
+                for lang in media_type.corpusAudioInfo.get_related_set('languageinfotype_model_set'):
                     result.extend([variety.languageVarietyName for variety in
-                               lang.languageVarietyInfo.all()])
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
-                for lang in corpus_info.languageinfotype_model_set.all():
+                               lang.get_related_set('languageVarietyInfo')])
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
+                for lang in corpus_info.get_related_set('languageinfotype_model_set'):
                     result.extend([variety.languageVarietyName for variety in
-                               lang.languageVarietyInfo.all()])
+                               lang.get_related_set('languageVarietyInfo')])
             if media_type.corpusTextNgramInfo:
-                for lang in media_type.corpusTextNgramInfo.languageinfotype_model_set.all():
+                for lang in media_type.corpusTextNgramInfo.get_related_set('languageinfotype_model_set'):
                     result.extend([variety.languageVarietyName for variety in
-                               lang.languageVarietyInfo.all()])
+                               lang.get_related_set('languageVarietyInfo')])
             if media_type.corpusImageInfo:
-                for lang in media_type.corpusImageInfo.languageinfotype_model_set.all():
+                for lang in media_type.corpusImageInfo.get_related_set('languageinfotype_model_set'):
                     result.extend([variety.languageVarietyName for variety in
-                               lang.languageVarietyInfo.all()])
+                               lang.get_related_set('languageVarietyInfo')])
 
         elif isinstance(corpus_media, lexicalConceptualResourceInfoType_model):
             lcr_media_type = corpus_media.lexicalConceptualResourceMediaType
             if lcr_media_type.lexicalConceptualResourceAudioInfo:
                 for lang in lcr_media_type.lexicalConceptualResourceAudioInfo. \
-                  languageinfotype_model_set.all():
+                  get_related_set('languageinfotype_model_set'):
                     result.extend([variety.languageVarietyName for variety in
-                               lang.languageVarietyInfo.all()])
+                               lang.get_related_set('languageVarietyInfo')])
             if lcr_media_type.lexicalConceptualResourceTextInfo:
                 for lang in lcr_media_type.lexicalConceptualResourceTextInfo. \
-                  languageinfotype_model_set.all():
+                  get_related_set('languageinfotype_model_set'):
                     result.extend([variety.languageVarietyName for variety in
-                               lang.languageVarietyInfo.all()])
+                               lang.get_related_set('languageVarietyInfo')])
             if lcr_media_type.lexicalConceptualResourceVideoInfo:
                 for lang in lcr_media_type.lexicalConceptualResourceVideoInfo. \
-                  languageinfotype_model_set.all():
+                  get_related_set('languageinfotype_model_set'):
                     result.extend([variety.languageVarietyName for variety in
-                               lang.languageVarietyInfo.all()])
+                               lang.get_related_set('languageVarietyInfo')])
             if lcr_media_type.lexicalConceptualResourceImageInfo:
                 for lang in lcr_media_type.lexicalConceptualResourceImageInfo. \
-                  languageinfotype_model_set.all():
+                  get_related_set('languageinfotype_model_set'):
                     result.extend([variety.languageVarietyName for variety in
-                               lang.languageVarietyInfo.all()])
+                               lang.get_related_set('languageVarietyInfo')])
 
         elif isinstance(corpus_media, languageDescriptionInfoType_model):
             ld_media_type = corpus_media.languageDescriptionMediaType
             if ld_media_type.languageDescriptionTextInfo:
                 for lang in ld_media_type.languageDescriptionTextInfo. \
-                  languageinfotype_model_set.all():
+                  get_related_set('languageinfotype_model_set'):
                     result.extend([variety.languageVarietyName for variety in
-                               lang.languageVarietyInfo.all()])
+                               lang.get_related_set('languageVarietyInfo')])
             if ld_media_type.languageDescriptionVideoInfo:
                 for lang in ld_media_type.languageDescriptionVideoInfo. \
-                  languageinfotype_model_set.all():
+                  get_related_set('languageinfotype_model_set'):
                     result.extend([variety.languageVarietyName for variety in
-                               lang.languageVarietyInfo.all()])
+                               lang.get_related_set('languageVarietyInfo')])
             if ld_media_type.languageDescriptionImageInfo:
                 for lang in ld_media_type.languageDescriptionImageInfo. \
-                  languageinfotype_model_set.all():
+                  get_related_set('languageinfotype_model_set'):
                     result.extend([variety.languageVarietyName for variety in
-                               lang.languageVarietyInfo.all()])
+                               lang.get_related_set('languageVarietyInfo')])
 
         elif isinstance(corpus_media, toolServiceInfoType_model):
             if corpus_media.inputInfo:
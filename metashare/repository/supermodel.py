@@ -2,7 +2,8 @@ import datetime
 import logging
 import re
 import urllib
-from Queue import Queue
+from collections import defaultdict, OrderedDict
+from hashlib import md5
 from traceback import format_exc
 from xml.etree.ElementTree import Element, fromstring, tostring
 
@@ -10,7 +11,8 @@ from django import db
 from django.core.cache import cache
 from django.core.exceptions import ValidationError, ObjectDoesNotExist, \
     ImproperlyConfigured
-from django.db import models, IntegrityError
+from django.db import models, IntegrityError, connection, transaction
+from django.dispatch import Signal
 from django.db.models.fields import related
 from django.db.models.fields.related import ForeignRelatedObjectsDescriptor, \
     OneToOneField
@@ -19,9 +21,10 @@ import metashare.repository.models
 from metashare.repository.fields import MultiSelectField, MultiTextField, \
     MetaBooleanField, DictField
 from metashare.settings import LOG_HANDLER, \
-    CHECK_FOR_DUPLICATE_INSTANCES
+    CHECK_FOR_DUPLICATE_INSTANCES, OBJECT_XML_CACHE_SIZE
 from metashare.storage.models import MASTER
-from metashare.utils import SimpleTimezone, prettify_camel_case_string
+from metashare.utils import SimpleTimezone, prettify_camel_case_string, \
+    LRUCache
 
 
 # Setup logging support.
@@ -47,7 +50,24 @@ SCHEMA_URL = 'http://metashare.ilsp.gr/META-XMLSchema/v{0}/' \
 METASHARE_ID_REGEXP = re.compile('<metashareId>.+</metashareId>',
   re.I|re.S|re.U)
 
-OBJECT_XML_CACHE = {}
+# cache for the serializations which are compared by the check for duplicate
+# instances
+OBJECT_XML_CACHE = LRUCache(OBJECT_XML_CACHE_SIZE)
+
+# number of instances whose object graphs are loaded together by batch_export()
+EXPORT_BATCH_SIZE = 100
+
+# maximum number of values in a single bulk query of the export prefetching;
+# SQLite does not support more than 999 parameters per query
+EXPORT_PREFETCH_CHUNK_SIZE = 500
+
+# key of the subclass instance in the export cache of SubclassableModels
+SUBCLASS_CACHE_KEY = '__subclass__'
+
+# sent by bulk_delete_deep() once per model class instead of the post_delete
+# signals of the single instances; `ids` is the set of primary keys of the
+# deleted instances of the sender class
+post_bulk_delete = Signal(providing_args=['ids'])
 
 # This import is required for at least an `eval` in the `_classify` function:
 # pylint: disable-msg=W0611
@@ -65,6 +85,35 @@ def _remove_namespace_from_tags(element_tree):
     
     return element_tree
 
+def _get_duplicate_check_string(obj):
+    """
+    Returns the serialized XML String of the given object without any
+    META-SHARE related id, as it is compared by the check for duplicates.
+    """
+    cache_key = '{}_{}'.format(type(obj).__name__.lower(), obj.id)
+    _value = OBJECT_XML_CACHE.get(cache_key)
+    if _value is None:
+        _value = tostring(obj.export_to_elementtree())
+        _value = METASHARE_ID_REGEXP.sub('', _value)
+        OBJECT_XML_CACHE[cache_key] = _value
+    return _value
+
+def _get_structure_hash(obj):
+    """
+    Returns the structural hash of the given object, i.e., the MD5 hash of
+    its serialization for the check for duplicates, and stores it in the
+    database if this has not been done yet.
+    """
+    _hashes = metashare.repository.models.ObjectStructureHash.objects
+    try:
+        return _hashes.get(model_name=type(obj).__name__,
+                           object_id=obj.id).value
+    except ObjectDoesNotExist:
+        _value = md5(_get_duplicate_check_string(obj)).hexdigest()
+        _hashes.create(model_name=type(obj).__name__, object_id=obj.id,
+                       value=_value)
+        return _value
+
 def _classify(class_name):
     """
     Converts the given class name into the corresponding class type object.
@@ -369,8 +418,8 @@ class SchemaModel(models.Model):
         # Then, we loop over all schema fields, retrieve their values and put
         # XML-ified versions of these values into the XML tree.
         for _xsd_field, _model_field, _not_used in self.__schema_fields__:
-            # Try to retrieve the value via getattr().
-            _value = getattr(self, _model_field, None)
+            # Try to retrieve the value via the export cache or getattr().
+            _value = self._get_export_value(_model_field)
 
             if _value is not None and _value != "":
                 _model_set_value = _model_field.endswith('_model_set')
@@ -505,6 +554,33 @@ class SchemaModel(models.Model):
         # using: xml.etree.ElementTree.tostring(_root, encoding="utf-8")
         return _root
 
+    def get_related_set(self, field_name):
+        """
+        Returns the objects of the reverse foreign key or many-to-many field
+        with the given name.
+
+        Objects which have been bulk-loaded by prefetch_export_graph() are
+        taken from the export cache of this instance, so that code which walks
+        the object graph of a prefetched resource does not query the database.
+        """
+        _export_cache = getattr(self, '_export_cache', None)
+        if _export_cache is not None and field_name in _export_cache:
+            return _export_cache[field_name]
+        return getattr(self, field_name).all()
+
+    def _get_export_value(self, model_field):
+        """
+        Returns the value of the given model field for the export.
+
+        Related objects which have been bulk-loaded by prefetch_export_graph()
+        are taken from the export cache of this instance; all other values are
+        retrieved via getattr().
+        """
+        _export_cache = getattr(self, '_export_cache', None)
+        if _export_cache is not None and model_field in _export_cache:
+            return _export_cache[model_field]
+        return getattr(self, model_field, None)
+
     @classmethod
     def _check_for_duplicates(cls, _object):
         """
@@ -611,18 +687,22 @@ class SchemaModel(models.Model):
         if query_set.count() > 1:
             # We now know that there may exist at least one duplicate for the
             # given _object;  we have to check the related objects to be sure.
-            
+
+            # For reusable objects, only the candidates with the same stored
+            # structural hash are checked;  the hashes of candidates which
+            # have not been hashed yet are computed once beforehand.
+            if cls in metashare.repository.models.STRUCTURE_HASHED_MODELS:
+                _hashes = metashare.repository.models.ObjectStructureHash \
+                  .objects.filter(model_name=cls.__name__)
+                for _candidate in query_set.exclude(
+                  id__in=_hashes.values('object_id')).iterator():
+                    _get_structure_hash(_candidate)
+                query_set = query_set.filter(id__in=_hashes.filter(
+                  value=_get_structure_hash(_object)).values('object_id'))
+
             # Convert the current object into its serialised XML String and
             # remove any META-SHARE related id from this String.
-            cache_key = '{}_{}'.format(type(_object).__name__.lower(),
-              _object.id)
-            if OBJECT_XML_CACHE.has_key(cache_key):
-                _obj_value = OBJECT_XML_CACHE[cache_key]
-            
-            else:
-                _obj_value = tostring(_object.export_to_elementtree())
-                _obj_value = METASHARE_ID_REGEXP.sub('', _obj_value)
-                OBJECT_XML_CACHE[cache_key] = _obj_value
+            _obj_value = _get_duplicate_check_string(_object)
 
             # Iterate over all potential duplicates, ordered by increasing id.
             for _candidate in query_set.iterator():
@@ -630,19 +710,8 @@ class SchemaModel(models.Model):
                 if _candidate == _object:
                     continue
 
-                # Convert candidate into XML String and remove META-SHARE id.
-                cache_key = '{}_{}'.format(type(_candidate).__name__.lower(),
-                  _candidate.id)
-                if OBJECT_XML_CACHE.has_key(cache_key):
-                    _check = OBJECT_XML_CACHE[cache_key]
-
-                else:
-                    _check = tostring(_candidate.export_to_elementtree())
-                    _check = METASHARE_ID_REGEXP.sub('', _check)
-                    OBJECT_XML_CACHE[cache_key] = _check
-
                 # If both XML Strings are equal, we have found a duplicate!
-                if _obj_value == _check:
+                if _obj_value == _get_duplicate_check_string(_candidate):
                     _duplicates.append(_candidate)
 
         return _duplicates
@@ -679,9 +748,7 @@ class SchemaModel(models.Model):
                     LOGGER.debug(u'Deleting object {0}'.format(obj))
                     cache_key = '{}_{}'.format(type(obj).__name__.lower(),
                       obj.id)
-
-                    if OBJECT_XML_CACHE.has_key(cache_key):
-                        OBJECT_XML_CACHE.pop(cache_key)
+                    OBJECT_XML_CACHE.pop(cache_key)
 
                     if obj.__schema_name__ == "resourceInfo":
                         storage_object = obj.storage_object
@@ -1289,44 +1356,18 @@ class SchemaModel(models.Model):
 
     def delete_deep(self, keep_stats=False):
         '''
-        Delete this resource, the corresponding storage object,
-        and all descendants connected through either a one-to-one
-        or a one-to-many relation (i.e., non-reusable information).
+        Delete this instance and all descendants connected through either a
+        one-to-one or a one-to-many relation (i.e., non-reusable information).
         This will leave many-to-one or many-to-many relations untouched.
         
-        Also includes deletion of statistics and recommendations; use keep_stats
-        optional parameter to suppress deletion of statistics and
-        recommendations.
+        The keep_stats parameter is only relevant for resources, which delete
+        their statistics and recommendations, too.
         
         This method is not automatically hooked into the default django
         delete mechanism; it needs to be called explicitly.
         '''
-        # Basic idea: do a breadth-first search, and delete each node when its children have ben enqueued.
-        to_delete = Queue()
-        to_delete.put(self)
-        while not to_delete.empty():
-            obj = to_delete.get()
-            if isinstance(obj, SubclassableModel):
-                obj = obj.as_subclass()
-            for fieldname in obj.get_fields_flat():
-                if fieldname.endswith("_set"):
-                    # a reverse foreign key
-                    related_mgr = getattr(obj, fieldname)
-                    for child in related_mgr.all():
-                        to_delete.put(child)
-                else:
-                    field = obj._meta.get_field(fieldname)
-                    if isinstance(field, OneToOneField):
-                        child = getattr(obj, fieldname)
-                        if child is not None:
-                            to_delete.put(child)
-            if obj.__class__.__name__ == 'resourceInfoType_model':
-                # if instance is a resource, pass the keep_stats parameter
-                obj.delete(keep_stats=keep_stats)
-            else:
-                # ignore keep_stats parameter for all other types
-                obj.delete()
-            
+        bulk_delete_deep([self])
+
 class SubclassableModel(SchemaModel):
     """
     Generic superclass for all models that want to allow getting a
@@ -1337,6 +1378,13 @@ class SubclassableModel(SchemaModel):
         return self.__class__.__name__
 
     def as_subclass(self):
+        # use the subclass instance from prefetch_export_graph(), if available
+        _export_cache = getattr(self, '_export_cache', None)
+        if _export_cache is not None and SUBCLASS_CACHE_KEY in _export_cache:
+            childinstance = _export_cache[SUBCLASS_CACHE_KEY]
+            if childinstance is self:
+                return self
+            return childinstance.as_subclass()
         # pylint: disable-msg=E1101
         subclasses = self.__class__.__subclasses__()
         for subclass in subclasses:
@@ -1371,3 +1419,370 @@ class InvisibleStringModel(SchemaModel):
         if not self.value:
             return u''
         return self.value
+
+
+def _load_in_bulk(model, field_name, values, loaded, new_objects):
+    """
+    Returns all instances of the given model whose field with the given name
+    has one of the given values, sorted by primary key.
+
+    Instances which have already been loaded are taken from the given `loaded`
+    dict, which maps (class, primary key) tuples to instances, so that each
+    object is only loaded and exported from a single instance. Instances which
+    have not been loaded before are added to both `loaded` and `new_objects`.
+    """
+    values = list(set(values))
+    _by_pk = field_name == 'pk'
+    if _by_pk:
+        _result = [loaded[(model, _pk)] for _pk in values
+                   if (model, _pk) in loaded]
+        values = [_pk for _pk in values if (model, _pk) not in loaded]
+    else:
+        _result = []
+    for _start in range(0, len(values), EXPORT_PREFETCH_CHUNK_SIZE):
+        _filter = {'{}__in'.format(field_name):
+                   values[_start:_start + EXPORT_PREFETCH_CHUNK_SIZE]}
+        for _obj in model.objects.filter(**_filter):
+            _key = (model, _obj.pk)
+            if _key in loaded:
+                _obj = loaded[_key]
+            else:
+                loaded[_key] = _obj
+                new_objects.append(_obj)
+            _result.append(_obj)
+    _result.sort(key=lambda obj: obj.pk)
+    return _result
+
+
+def _prefetch_relations(cls, instances, loaded, fields=None):
+    """
+    Bulk-loads the related objects which are required for the export of the
+    given instances of the given SchemaModel class; if a collection of model
+    field names is given, only these fields are followed.
+
+    Returns the list of newly loaded instances.
+    """
+    _new_objects = []
+    _ids = [_obj.pk for _obj in instances]
+    for _obj in instances:
+        if getattr(_obj, '_export_cache', None) is None:
+            _obj._export_cache = {}
+
+    # SubclassableModels are exported as their subclass instance
+    if issubclass(cls, SubclassableModel):
+        _children = {}
+        for _subclass in cls.__subclasses__():
+            for _child in _load_in_bulk(_subclass, 'pk', _ids, loaded,
+                                        _new_objects):
+                _children[_child.pk] = _child
+        for _obj in instances:
+            _obj._export_cache[SUBCLASS_CACHE_KEY] = \
+              _children.get(_obj.pk, _obj)
+
+    _done = set()
+    for _not_used, _model_field, _not_used in cls.__schema_fields__:
+        # choice fields appear several times in the schema fields
+        if _model_field in _done \
+                or (fields is not None and _model_field not in fields):
+            continue
+        _done.add(_model_field)
+
+        # reverse foreign keys
+        if _model_field.endswith('_model_set'):
+            _related = getattr(cls, _model_field).related
+            _values = defaultdict(list)
+            for _child in _load_in_bulk(_related.model, _related.field.name,
+                                        _ids, loaded, _new_objects):
+                _values[getattr(_child, _related.field.attname)].append(_child)
+            for _obj in instances:
+                _obj._export_cache[_model_field] = _values.get(_obj.pk, [])
+            continue
+
+        _field = cls._meta.get_field_by_name(_model_field)[0]
+        if isinstance(_field, models.ManyToManyField):
+            _source_name = _field.m2m_field_name()
+            _target_name = _field.m2m_reverse_field_name()
+            _target_ids = defaultdict(set)
+            for _start in range(0, len(_ids), EXPORT_PREFETCH_CHUNK_SIZE):
+                _filter = {'{}__in'.format(_source_name):
+                           _ids[_start:_start + EXPORT_PREFETCH_CHUNK_SIZE]}
+                for _source_id, _target_id in _field.rel.through.objects \
+                        .filter(**_filter) \
+                        .values_list(_source_name, _target_name):
+                    _target_ids[_source_id].add(_target_id)
+            _targets = dict((_target.pk, _target) for _target in _load_in_bulk(
+              _field.rel.to, 'pk', set().union(*_target_ids.values()),
+              loaded, _new_objects))
+            for _obj in instances:
+                _obj._export_cache[_model_field] = [_targets[_target_id]
+                  for _target_id in sorted(_target_ids.get(_obj.pk, ()))]
+
+        # forward foreign keys and one-to-one fields are put into the regular
+        # Django cache of the related object
+        elif isinstance(_field, models.ForeignKey):
+            _target_ids = [getattr(_obj, _field.attname) for _obj in instances]
+            _targets = dict((_target.pk, _target) for _target in _load_in_bulk(
+              _field.rel.to, 'pk', [_target_id for _target_id in _target_ids
+                                    if _target_id is not None],
+              loaded, _new_objects))
+            for _obj, _target_id in zip(instances, _target_ids):
+                if _target_id in _targets:
+                    setattr(_obj, _field.get_cache_name(), _targets[_target_id])
+
+    return _new_objects
+
+
+def prefetch_export_graph(objects, fields=None):
+    """
+    Bulk-loads the complete object graphs of the given SchemaModel instances
+    as required by export_to_elementtree(), so that their export does not
+    issue any further database queries.
+
+    The object graphs are planned from the `__schema_fields__` of the model
+    classes and loaded level by level, i.e., the number of queries only
+    depends on the number of model classes and relations, not on the number of
+    instances.
+
+    If a collection of model field names is given, only the parts of the
+    object graphs which are reachable via these fields are loaded.
+
+    Returns a dict which maps (class, primary key) tuples to all instances of
+    the loaded object graphs, including the given instances.
+    """
+    _loaded = dict(((type(_obj), _obj.pk), _obj) for _obj in objects)
+    _level = list(objects)
+    while _level:
+        _by_class = defaultdict(list)
+        for _obj in _level:
+            _by_class[type(_obj)].append(_obj)
+        _level = []
+        for _cls, _instances in _by_class.items():
+            _level.extend(_prefetch_relations(_cls, _instances, _loaded,
+                                              fields))
+    return _loaded
+
+
+def iterate_prefetched(queryset, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yields all instances of the given queryset of SchemaModels with their
+    export object graphs loaded by prefetch_export_graph().
+
+    The instances are loaded in batches of the given size, so that the memory
+    consumption does not depend on the size of the queryset.
+    """
+    _ids = list(queryset.values_list('pk', flat=True))
+    for _start in range(0, len(_ids), batch_size):
+        _batch_ids = _ids[_start:_start + batch_size]
+        _batch = queryset.in_bulk(_batch_ids)
+        _objects = [_batch[_id] for _id in _batch_ids if _id in _batch]
+        prefetch_export_graph(_objects)
+        for _obj in _objects:
+            yield _obj
+
+
+def batch_export(queryset, batch_size=EXPORT_BATCH_SIZE, pretty=False):
+    """
+    Exports all instances of the given queryset of SchemaModels to XML
+    ElementTrees with a bounded number of database queries.
+
+    Yields tuples of an instance and the root node of its exported
+    ElementTree; if the export of an instance fails, the error is logged and
+    None is yielded instead of the root node.
+    """
+    for _obj in iterate_prefetched(queryset, batch_size):
+        try:
+            _root = _obj.export_to_elementtree(pretty=pretty)
+        # pylint: disable-msg=W0703
+        except Exception:
+            LOGGER.error(u'Could not export {} with primary key {}.'.format(
+              type(_obj).__name__, _obj.pk), exc_info=True)
+            _root = None
+        yield _obj, _root
+
+
+def get_chunks(values):
+    """
+    Returns the given values in sorted chunks which can be used in a single
+    bulk query.
+    """
+    values = sorted(values)
+    return [values[_start:_start + EXPORT_PREFETCH_CHUNK_SIZE]
+            for _start in range(0, len(values), EXPORT_PREFETCH_CHUNK_SIZE)]
+
+
+def _collect_owned_ids(objects):
+    """
+    Returns an ordered dict which maps model classes to the sets of primary
+    keys of the given SchemaModel instances and of all instances which are
+    owned by them; the model classes are ordered from the owners down.
+
+    Owned instances are the ones which Django would delete along with their
+    owner, i.e., instances referring to an owner via a cascading foreign key
+    and multi-table parent/child instances, plus the targets of the one-to-one
+    fields of owners. The instances are collected level by level, i.e., the
+    number of queries only depends on the number of model classes and
+    relations, not on the number of instances.
+    """
+    _owned = OrderedDict()
+    _level = defaultdict(set)
+    for _obj in objects:
+        _level[type(_obj)].add(_obj.pk)
+    while _level:
+        _next_level = defaultdict(set)
+        for _cls, _ids in _level.items():
+            _ids = _ids - _owned.get(_cls, set())
+            if not _ids:
+                continue
+            _owned.setdefault(_cls, set()).update(_ids)
+            # multi-table parents share the primary keys of their children
+            for _parent in _cls._meta.get_parent_list():
+                _next_level[_parent].update(_ids)
+            for _rel in _cls._meta.get_all_related_objects(local_only=True):
+                if _rel.field.rel.on_delete is not models.CASCADE:
+                    continue
+                for _chunk in get_chunks(_ids):
+                    _next_level[_rel.model].update(_rel.model.objects.filter(
+                      **{'{}__in'.format(_rel.field.name): _chunk}) \
+                        .values_list('pk', flat=True))
+            if not issubclass(_cls, SchemaModel):
+                continue
+            for _field_name in _cls.get_fields_flat():
+                if _field_name.endswith('_set'):
+                    continue
+                _field = _cls._meta.get_field(_field_name)
+                if isinstance(_field, OneToOneField):
+                    for _chunk in get_chunks(_ids):
+                        _next_level[_field.rel.to].update(_target_id
+                          for _target_id in _cls.objects.filter(pk__in=_chunk) \
+                            .values_list(_field.attname, flat=True)
+                          if _target_id is not None)
+        _level = _next_level
+    return _owned
+
+
+def _execute_for_chunks(sql, values):
+    """
+    Executes the given SQL statement with a single `{}` placeholder for an
+    `IN` list once for each chunk of the given values.
+    """
+    _cursor = connection.cursor()
+    for _chunk in get_chunks(values):
+        _cursor.execute(sql.format(', '.join(['%s'] * len(_chunk))), _chunk)
+
+
+def delete_rows(model, column, values):
+    """
+    Deletes the rows of the given model whose given column has one of the given
+    values, without loading the instances and without sending any signals.
+    """
+    _qn = connection.ops.quote_name
+    _execute_for_chunks('DELETE FROM {0} WHERE {1} IN '.format(
+        _qn(model._meta.db_table), _qn(column)) + '({})', values)
+
+
+def _get_deletion_order(deleted):
+    """
+    Returns the model classes of the given dict of model classes and primary
+    keys of instances to delete, sorted like Django's deletion `Collector`
+    sorts them: the rows of a model class are deleted before the rows which
+    they refer to, e.g., owners before the targets of their one-to-one fields
+    and multi-table children before their parents.
+
+    References which form a cycle are cleared first, if they are nullable, so
+    that databases which check foreign keys immediately accept the deletion.
+    """
+    _qn = connection.ops.quote_name
+    # maps model classes to the foreign keys to other model classes to delete;
+    # like the `Collector`, rows referring to rows of the same table are
+    # deleted with them
+    _references = {}
+    for _cls in deleted:
+        for _field in _cls._meta.local_fields:
+            if _field.rel and _field.rel.to in deleted \
+                    and _field.rel.to is not _cls:
+                _references.setdefault(_cls, []).append(_field)
+    def _refers_to(source, target):
+        # whether the given pending class refers to the given class, maybe
+        # indirectly via other pending classes
+        _seen = set()
+        _todo = [source]
+        while _todo:
+            _cls = _todo.pop()
+            for _field in _references.get(_cls, ()):
+                if _field.rel.to is target:
+                    return True
+                if _field.rel.to in _pending and _field.rel.to not in _seen:
+                    _seen.add(_field.rel.to)
+                    _todo.append(_field.rel.to)
+        return False
+
+    _order = []
+    _pending = list(deleted)
+    while _pending:
+        # the classes which no pending class refers to can be deleted
+        _referred = set(_field.rel.to for _cls in _pending
+                        for _field in _references.get(_cls, ()))
+        _ready = [_cls for _cls in _pending if _cls not in _referred]
+        if not _ready:
+            _cleared = False
+            for _cls in _pending:
+                for _field in list(_references.get(_cls, ())):
+                    if _field.null and _field.rel.to in _pending \
+                            and _refers_to(_field.rel.to, _cls):
+                        _execute_for_chunks('UPDATE {0} SET {1} = NULL WHERE '
+                            '{2} IN '.format(_qn(_cls._meta.db_table),
+                                _qn(_field.column), _qn(_cls._meta.pk.column))
+                            + '({})', deleted[_cls])
+                        _references[_cls].remove(_field)
+                        _cleared = True
+            if _cleared:
+                continue
+            # like the `Collector`, give up on cycles which cannot be broken
+            _ready = _pending
+        _order.extend(_ready)
+        _pending = [_cls for _cls in _pending if _cls not in _ready]
+    return _order
+
+
+def bulk_delete_deep(objects):
+    """
+    Deletes the given SchemaModel instances and all instances owned by them
+    (see `SchemaModel.delete_deep()`) with a bounded number of queries.
+
+    The owned instances are collected first; then the rows are deleted table
+    by table with `IN` queries in a single transaction. Instead of the
+    post_delete signals of the single instances, one post_bulk_delete signal
+    is sent per model class.
+
+    Returns a dict which maps model classes to the sets of primary keys of
+    their deleted instances.
+    """
+    _qn = connection.ops.quote_name
+    _deleted = _collect_owned_ids(objects)
+    # referring rows are removed before the referred ones
+    _models = _get_deletion_order(_deleted)
+    for _cls in _models:
+        _ids = _deleted[_cls]
+        # references which are not cascaded are cleared
+        for _rel in _cls._meta.get_all_related_objects(local_only=True):
+            if _rel.field.rel.on_delete is models.SET_NULL:
+                _execute_for_chunks('UPDATE {0} SET {1} = NULL WHERE {1} IN '
+                    .format(_qn(_rel.model._meta.db_table),
+                            _qn(_rel.field.column)) + '({})', _ids)
+        # many-to-many relations in both directions
+        for _field in _cls._meta.local_many_to_many:
+            delete_rows(_field.rel.through, _field.m2m_column_name(), _ids)
+        for _rel in _cls._meta.get_all_related_many_to_many_objects(
+                local_only=True):
+            delete_rows(_rel.field.rel.through,
+                        _rel.field.m2m_reverse_name(), _ids)
+    for _cls in _models:
+        delete_rows(_cls, _cls._meta.pk.column, _deleted[_cls])
+    for _cls in _models:
+        post_bulk_delete.send(sender=_cls, ids=_deleted[_cls])
+    # the raw queries are committed (or left to the surrounding transaction
+    # management) like the ones of the ORM
+    if transaction.is_managed():
+        transaction.set_dirty()
+    transaction.commit_unless_managed()
+    return _deleted
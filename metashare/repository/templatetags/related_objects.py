@@ -0,0 +1,23 @@
+"""
+Provides access to the related objects of schema model instances in templates.
+"""
+
+from django import template
+
+from metashare.repository.supermodel import SchemaModel
+
+register = template.Library()
+
+
+def related_objects(value, field_name):
+    """
+    This template filter returns the objects of the reverse foreign key or
+    many-to-many field with the given name of the given schema model instance.
+    For instances with a prefetched object graph no database query is needed.
+    Es. {% for lang in info|related_objects:"languageinfotype_model_set" %}
+    """
+    if not isinstance(value, SchemaModel):
+        return []
+    return value.get_related_set(field_name)
+
+register.filter('related_objects', related_objects)
@@ -27,48 +27,48 @@ class ResourceLanguages(template.Node):
     
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 result.extend([lang.languageName for lang in
-                               corpus_info.languageinfotype_model_set.all()])
+                               corpus_info.get_related_set('languageinfotype_model_set')])
             if media_type.corpusAudioInfo:
                 result.extend([lang.languageName for lang in
-                               media_type.corpusAudioInfo.languageinfotype_model_set.all()])
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+                               media_type.corpusAudioInfo.get_related_set('languageinfotype_model_set')])
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 result.extend([lang.languageName for lang in
-                               corpus_info.languageinfotype_model_set.all()])
+                               corpus_info.get_related_set('languageinfotype_model_set')])
             if media_type.corpusTextNgramInfo:
                 result.extend([lang.languageName for lang in
-                            media_type.corpusTextNgramInfo.languageinfotype_model_set.all()])
+                            media_type.corpusTextNgramInfo.get_related_set('languageinfotype_model_set')])
             if media_type.corpusImageInfo:
                 result.extend([lang.languageName for lang in
-                               media_type.corpusImageInfo.languageinfotype_model_set.all()])
+                               media_type.corpusImageInfo.get_related_set('languageinfotype_model_set')])
 
         elif isinstance(corpus_media, lexicalConceptualResourceInfoType_model):
             lcr_media_type = corpus_media.lexicalConceptualResourceMediaType
             if lcr_media_type.lexicalConceptualResourceAudioInfo:
                 result.extend([lang.languageName for lang in lcr_media_type \
-                        .lexicalConceptualResourceAudioInfo.languageinfotype_model_set.all()])
+                        .lexicalConceptualResourceAudioInfo.get_related_set('languageinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceTextInfo:
                 result.extend([lang.languageName for lang in lcr_media_type \
-                        .lexicalConceptualResourceTextInfo.languageinfotype_model_set.all()])
+                        .lexicalConceptualResourceTextInfo.get_related_set('languageinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceVideoInfo:
                 result.extend([lang.languageName for lang in lcr_media_type \
-                        .lexicalConceptualResourceVideoInfo.languageinfotype_model_set.all()])
+                        .lexicalConceptualResourceVideoInfo.get_related_set('languageinfotype_model_set')])
             if lcr_media_type.lexicalConceptualResourceImageInfo:
                 result.extend([lang.languageName for lang in lcr_media_type \
-                        .lexicalConceptualResourceImageInfo.languageinfotype_model_set.all()])
+                        .lexicalConceptualResourceImageInfo.get_related_set('languageinfotype_model_set')])
 
         elif isinstance(corpus_media, languageDescriptionInfoType_model):
             ld_media_type = corpus_media.languageDescriptionMediaType
             if ld_media_type.languageDescriptionTextInfo:
                 result.extend([lang.languageName for lang in ld_media_type \
-                            .languageDescriptionTextInfo.languageinfotype_model_set.all()])
+                            .languageDescriptionTextInfo.get_related_set('languageinfotype_model_set')])
             if ld_media_type.languageDescriptionVideoInfo:
                 result.extend([lang.languageName for lang in ld_media_type \
-                            .languageDescriptionVideoInfo.languageinfotype_model_set.all()])
+                            .languageDescriptionVideoInfo.get_related_set('languageinfotype_model_set')])
             if ld_media_type.languageDescriptionImageInfo:
                 result.extend([lang.languageName for lang in ld_media_type \
-                            .languageDescriptionImageInfo.languageinfotype_model_set.all()])
+                            .languageDescriptionImageInfo.get_related_set('languageinfotype_model_set')])
 
         elif isinstance(corpus_media, toolServiceInfoType_model):
             if corpus_media.inputInfo:
@@ -28,11 +28,11 @@ class ResourceMediaTypes(template.Node):
     
         if isinstance(corpus_media, corpusInfoType_model):
             media_type = corpus_media.corpusMediaType
-            for corpus_info in media_type.corpustextinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpustextinfotype_model_set'):
                 result.append(corpus_info.mediaType)
             if media_type.corpusAudioInfo:
                 result.append(media_type.corpusAudioInfo.mediaType)
-            for corpus_info in media_type.corpusvideoinfotype_model_set.all():
+            for corpus_info in media_type.get_related_set('corpusvideoinfotype_model_set'):
                 result.append(corpus_info.mediaType)
             if media_type.corpusTextNgramInfo:
                 result.append(media_type.corpusTextNgramInfo.mediaType)
@@ -19,6 +19,8 @@ from metashare.repository import models
 from metashare.repository.editor.lookups import PersonLookup, ActorLookup, \
     DocumentationLookup, DocumentLookup, ProjectLookup, OrganizationLookup, \
     TargetResourceLookup
+from metashare.repository.management import build_lookup_index
+from metashare.repository.model_utils import get_lookup_index_entry
 from metashare.repository.models import languageDescriptionInfoType_model, \
     lexicalConceptualResourceInfoType_model, personInfoType_model,\
     resourceInfoType_model
@@ -901,6 +903,77 @@ class LookupTest(TestCase):
         self.assertContains(response, 'Nice project',
             msg_prefix='a superuser must see the lookup for TargetResource.')
 
+    def test_search_keys(self):
+        """
+        Verifies that the search keys of the searchable fields are kept
+        up-to-date and that the lookups match any word prefix.
+        """
+        person = models.personInfoType_model.objects.create(
+            surname={'en': u'Van Houten'}, givenName={'en': u'Milhouse'},
+            communicationInfo=models.communicationInfoType_model.objects \
+                .create(email=['milhouse@example.com']))
+        self.assertEqual(set([u'van houten', u'houten', u'milhouse']),
+            set(models.FieldSearchKey.objects.filter(object_id=person.pk,
+                model_name='personInfoType_model',
+                field_name__in=['surname', 'givenName']).values_list('key',
+                                                                     flat=True)))
+        self.assertIn(person, PersonLookup().get_query(None, 'HOUT'))
+        self.assertIn(person.pk, ActorLookup().get_query(None, 'hout') \
+                      .values_list('pk', flat=True))
+        self.assertNotIn(person, PersonLookup().get_query(None, 'outen'))
+        person.surname = {'en': u'Simpson'}
+        person.save()
+        self.assertNotIn(person, PersonLookup().get_query(None, 'hout'))
+        self.assertIn(person, PersonLookup().get_query(None, 'simp'))
+        person.delete()
+        self.assertFalse(models.FieldSearchKey.objects.filter(
+            object_id=person.pk, model_name='personInfoType_model').exists())
+
+    def test_lookup_index(self):
+        """
+        Verifies that the lookup index entries are kept up-to-date and that the
+        lookups match the display labels regardless of case and accents.
+        """
+        person = models.personInfoType_model.objects.create(
+            surname={'en': u'Lef\xe8vre'}, givenName={'en': u'Val\xe9rie'},
+            communicationInfo=models.communicationInfoType_model.objects \
+                .create(email=['valerie@example.com']))
+        entry = get_lookup_index_entry(person)
+        self.assertEqual(unicode(person), entry.label)
+        self.assertEqual(0, entry.resource_count)
+        self.assertIn(person, PersonLookup().get_query(None, 'VALE'))
+        self.assertIn(person.pk, ActorLookup().get_query(None, 'lefev') \
+                      .values_list('pk', flat=True))
+        self.assertNotIn(person.pk, ActorLookup().get_query(None, 'efev') \
+                         .values_list('pk', flat=True))
+        # the resource count is recomputed once the resources have changed
+        resource = test_utils.import_xml(TESTFIXTURE_XML)
+        resource.contactPerson.add(person)
+        resource.save()
+        self.assertEqual(1, get_lookup_index_entry(person).resource_count)
+        self.assertIn(u'(used 1 time)',
+                      PersonLookup().format_item(person)['label'])
+        person.givenName = {'en': u'Val'}
+        person.save()
+        self.assertEqual(unicode(person), get_lookup_index_entry(person).label)
+        # the index is built when its table is created on an upgraded node
+        models.LookupIndexEntry.objects.all().delete()
+        models.FieldSearchKey.objects.all().delete()
+        self.assertNotIn(person, PersonLookup().get_query(None, 'val'))
+        build_lookup_index(models, [models.LookupIndexEntry], 0)
+        self.assertIn(person, PersonLookup().get_query(None, 'val'))
+        self.assertIn(person.pk, ActorLookup().get_query(None, 'lefev') \
+                      .values_list('pk', flat=True))
+        # the stored resource count follows the changes of the resources
+        entries = models.LookupIndexEntry.objects.filter(
+            object_id=person.pk, model_name='personInfoType_model')
+        self.assertEqual(1, entries[0].resource_count)
+        resource.delete_deep()
+        self.assertEqual(0, entries[0].resource_count)
+        person.delete()
+        self.assertFalse(models.LookupIndexEntry.objects.filter(
+            object_id=person.pk, model_name='personInfoType_model').exists())
+
 
 class DataUploadTests(TestCase):
     """
@@ -2,14 +2,19 @@ import os
 import logging
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.test.client import Client
 
 from metashare import test_utils
 from metashare.accounts.models import EditorGroup
 from metashare.repository.models import documentUnstructuredString_model, \
-    documentInfoType_model
+    documentInfoType_model, resourceInfoType_model, personInfoType_model, \
+    ObjectStructureHash
+from metashare.repository.supermodel import _get_structure_hash
 from metashare.settings import DJANGO_BASE, ROOT_PATH, LOG_HANDLER
+from metashare.storage.models import PUBLISHED, MASTER
+from metashare.xml_utils import bulk_import_from_files, BULK_IMPORT_STAGES, \
+    import_from_string
 
 # Setup logging support.
 LOGGER = logging.getLogger(__name__)
@@ -92,6 +97,43 @@ class ImportTest(TestCase):
         self.assertEqual(1, len(failures), 'Could not import file {} -- successes is {}, failures is {}'.format(_currfile, successes, failures))
         self.assertEquals('broken.xml', failures[0][0])
 
+    def test_duplicate_persons_are_reused(self):
+        """
+        Asserts that the contact person of two imported resources is only
+        stored once and that its structural hash is stored.
+        """
+        with open('{}/repository/fixtures/testfixture.xml'.format(ROOT_PATH)) \
+                as _in:
+            _xml = _in.read()
+        import_from_string(_xml, PUBLISHED, MASTER)
+        _resources = resourceInfoType_model.objects.count()
+        _persons = personInfoType_model.objects.count()
+        import_from_string(_xml.replace('Italian TTS Speech Corpus',
+            'Another Italian TTS Speech Corpus'), PUBLISHED, MASTER)
+        self.assertEqual(_resources + 1, resourceInfoType_model.objects.count())
+        self.assertEqual(_persons, personInfoType_model.objects.count())
+        self.assertTrue(ObjectStructureHash.objects.filter(
+            model_name='personInfoType_model').count() > 0)
+
+    def test_nested_changes_invalidate_structure_hashes(self):
+        """
+        Asserts that the structural hash of a person is recomputed when its
+        nested communication info changes.
+        """
+        with open('{}/repository/fixtures/testfixture.xml'.format(ROOT_PATH)) \
+                as _in:
+            import_from_string(_in.read(), PUBLISHED, MASTER)
+        _person = personInfoType_model.objects \
+            .filter(communicationInfo__isnull=False)[0]
+        _hash = _get_structure_hash(_person)
+        _communication_info = _person.communicationInfo
+        _communication_info.email = [u'someone.else@example.org']
+        _communication_info.save()
+        self.assertFalse(ObjectStructureHash.objects.filter(
+            model_name='personInfoType_model', object_id=_person.id).exists())
+        self.assertNotEqual(_hash, _get_structure_hash(
+            personInfoType_model.objects.get(pk=_person.pk)))
+
     def test_import_bug_1(self):
         """
         This constellation caused an import error with a Postgres DB backend.
@@ -145,3 +187,45 @@ class ImportTest(TestCase):
           {'resource': resourcefile}, follow=True)
         self.assertNotContains(response, '<td>{}</td>'.format(ImportTest.test_editor_group.name),
           msg_prefix='expected the system to set None as editor group to the resource.')
+
+
+class BulkImportTest(TransactionTestCase):
+    """
+    Tests the bulk import procedure for resources; as the bulk import manages
+    its own database transactions, this is a `TransactionTestCase`.
+    """
+    @classmethod
+    def setUpClass(cls):
+        LOGGER.info("running '{}' tests...".format(cls.__name__))
+        test_utils.set_index_active(False)
+
+    @classmethod
+    def tearDownClass(cls):
+        test_utils.set_index_active(True)
+        LOGGER.info("finished '{}' tests".format(cls.__name__))
+
+    def setUp(self):
+        test_utils.setup_test_storage()
+
+    def tearDown(self):
+        test_utils.clean_resources_db()
+        test_utils.clean_storage()
+
+    def test_bulk_import(self):
+        _files = ['{}/repository/fixtures/{}'.format(ROOT_PATH, _file)
+                  for _file in ('ILSP10.xml', 'onegood_onebroken.zip',
+                                'roundtrip.xml')]
+        imported_ids, failures, timings = bulk_import_from_files(_files,
+            PUBLISHED, MASTER, processes=2, batch_size=2)
+        self.assertEqual(3, len(imported_ids), 'failures are {}'.format(failures))
+        # the failed first batch has been rolled back completely
+        self.assertEqual(3, resourceInfoType_model.objects.count())
+        self.assertEqual(1, len(failures))
+        self.assertEquals('broken.xml', failures[0][0])
+        for stage in BULK_IMPORT_STAGES + ('total',):
+            self.assertTrue(stage in timings)
+        # the deferred post-pass has serialized all imported resources
+        for resource in resourceInfoType_model.objects.filter(id__in=imported_ids):
+            self.assertEqual(PUBLISHED,
+                             resource.storage_object.publication_status)
+            self.assertIsNotNone(resource.storage_object.digest_checksum)
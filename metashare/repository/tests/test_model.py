@@ -3,15 +3,20 @@ import logging
 
 from difflib import unified_diff
 
+from django.core.management import call_command
 from django.test import TestCase
 
-from xml.etree.ElementTree import fromstring, register_namespace
+from xml.etree.ElementTree import fromstring, register_namespace, tostring
 
 from metashare import test_utils
 from metashare.repository.models import resourceInfoType_model, \
-    SCHEMA_NAMESPACE, lingualityInfoType_model
+    SCHEMA_NAMESPACE, lingualityInfoType_model, RootResourceEntry, \
+    delete_resources_deep
 from metashare.repository.model_utils import get_root_resources
+from metashare.repository.supermodel import batch_export, \
+    prefetch_export_graph, _collect_owned_ids, _get_deletion_order
 from metashare.settings import ROOT_PATH, LOG_HANDLER
+from metashare.storage.models import StorageObject
 from metashare.xml_utils import to_xml_string
 
 # Setup logging support.
@@ -142,6 +147,37 @@ class ModelTest(TestCase):
         _roundtrip = '{0}/repository/test_fixtures/published-lexConcept-Audio-EnglishGerman.xml'.format(ROOT_PATH)
         self.assert_import_equals_export(_roundtrip)
 
+    def test_prefetched_export(self):
+        """
+        Checks that the export of resources with prefetched object graphs
+        equals their regular export and does not query the database anymore.
+        """
+        for _fixture in ('repository/fixtures/roundtrip.xml',
+                         'repository/fixtures/ILSP10.xml',
+                         'repository/test_fixtures/'
+                            'published-lexConcept-Audio-EnglishGerman.xml'):
+            test_utils.import_xml('{0}/{1}'.format(ROOT_PATH, _fixture))
+        _expected = dict((_res.id, to_xml_string(_res.export_to_elementtree(),
+                                                 encoding="utf-8"))
+                         for _res in resourceInfoType_model.objects.all())
+        self.assertEqual(4, len(_expected))
+
+        _resources = list(resourceInfoType_model.objects.all())
+        prefetch_export_graph(_resources)
+        for _res in _resources:
+            with self.assertNumQueries(0):
+                _root = _res.export_to_elementtree()
+            self.assertEqual(_expected[_res.id],
+                             to_xml_string(_root, encoding="utf-8"))
+
+        _exported = 0
+        for _res, _root in batch_export(resourceInfoType_model.objects.all(),
+                                        batch_size=3):
+            self.assertEqual(_expected[_res.id],
+                             to_xml_string(_root, encoding="utf-8"))
+            _exported += 1
+        self.assertEqual(4, _exported)
+
 
 class ModelUtilsTest(TestCase):
     """
@@ -225,3 +261,70 @@ class ModelUtilsTest(TestCase):
                 + list(self.test_res_2.contactPerson.all())
                 + [self.test_res_1.identificationInfo,
                    self.test_res_2.identificationInfo])))
+
+    def test_root_resource_index(self):
+        """
+        Tests that the root resource index is kept up-to-date with changed and
+        deleted resources and that it can be rebuilt.
+        """
+        person = self.test_res_2.contactPerson.all()[0]
+        self.assertSetEqual(set((self.test_res_2,)), get_root_resources(person))
+        # a reusable object can be contained in several resources; changed
+        # many-to-many relations are reflected in the index at once
+        self.test_res_1.contactPerson.add(person)
+        self.assertSetEqual(set((self.test_res_1, self.test_res_2)),
+                            get_root_resources(person))
+        self.test_res_1.contactPerson.remove(person)
+        self.assertSetEqual(set((self.test_res_2,)), get_root_resources(person))
+        # the index can be rebuilt from scratch
+        _entry_count = RootResourceEntry.objects.count()
+        RootResourceEntry.objects.all().delete()
+        call_command('rebuild_root_resource_index', verbosity=0)
+        self.assertEqual(_entry_count, RootResourceEntry.objects.count())
+        self.assertSetEqual(set((self.test_res_1,)),
+            get_root_resources(self.test_res_1.identificationInfo))
+        # instances without index entries are looked up in the object graph
+        RootResourceEntry.objects.filter(model_name='personInfoType_model',
+                                         object_id=person.pk).delete()
+        self.assertSetEqual(set((self.test_res_2,)), get_root_resources(person))
+        # the entries of deleted resources are removed
+        _res_1_id = self.test_res_1.id
+        self.test_res_1.delete_deep()
+        self.assertFalse(RootResourceEntry.objects.filter(resource_id=_res_1_id)
+                         .exists())
+        self.assertSetEqual(set((self.test_res_2,)), get_root_resources(person))
+
+    def test_bulk_delete_deep(self):
+        """
+        Tests that `delete_resources_deep` deletes exactly the non-reusable
+        parts of the given resources.
+        """
+        res_2_xml = tostring(self.test_res_2.export_to_elementtree())
+        identification = self.test_res_1.identificationInfo
+        corpus_texts = list(self.test_res_1.resourceComponentType \
+            .as_subclass().corpusMediaType.corpustextinfotype_model_set.all())
+        creators = list(self.test_res_1.metadataInfo.metadataCreator.all())
+        self.assertTrue(creators)
+        # referring rows are deleted before the rows which they refer to
+        _order = _get_deletion_order(_collect_owned_ids([self.test_res_1]))
+        for _index, _cls in enumerate(_order):
+            for _field in _cls._meta.local_fields:
+                if _field.rel and _field.rel.to is not _cls:
+                    self.assertNotIn(_field.rel.to, _order[:_index],
+                        "{0}.{1}".format(_cls.__name__, _field.name))
+        delete_resources_deep([self.test_res_1], delete_storage_objects=True)
+        self.assertFalse(resourceInfoType_model.objects
+                         .filter(pk=self.test_res_1.pk).exists())
+        self.assertFalse(StorageObject.objects
+                         .filter(pk=self.test_res_1.storage_object_id).exists())
+        self.assertFalse(type(identification).objects
+                         .filter(pk=identification.pk).exists())
+        self.assertFalse(type(corpus_texts[0]).objects
+            .filter(pk__in=[_text.pk for _text in corpus_texts]).exists())
+        # reusable objects and other resources are left untouched
+        self.assertEqual(len(creators), type(creators[0]).objects
+            .filter(pk__in=[_creator.pk for _creator in creators]).count())
+        self.assertEqual(res_2_xml, tostring(resourceInfoType_model.objects
+            .get(pk=self.test_res_2.pk).export_to_elementtree()))
+        self.assertFalse(resourceInfoType_model.contactPerson.through.objects
+            .filter(resourceinfotype_model=self.test_res_1.pk).exists())
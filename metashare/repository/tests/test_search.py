@@ -1,17 +1,29 @@
 import os
 import logging
 
+from django.core.cache import cache
 from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test.client import Client
+from django.db import connection
+from django.db.models import F
+from django.test.client import Client, RequestFactory
 from django.test.testcases import TestCase
 
 from haystack.query import SearchQuerySet
 
 from metashare import test_utils, settings
+from metashare.haystack_backends import bump_index_generation, \
+    get_index_generation, MetashareSolrSearchBackend
 from metashare.repository import views
+from metashare.repository.management.commands.rebuild_resource_index import \
+    get_pending_batches, load_checkpoint, save_checkpoint
+from metashare.repository.models import resourceInfoType_model, \
+    PendingIndexUpdate
+from metashare.repository.search_indexes import resourceInfoType_modelIndex, \
+    process_index_update_queue, merge_access_counts, enqueue_index_update
 from metashare.settings import DJANGO_BASE, ROOT_PATH, LOG_HANDLER
-from metashare.stats.models import LRStats
+from metashare.stats.model_utils import DOWNLOAD_STAT
+from metashare.stats.models import LRStats, LRCounter
 from metashare.storage.models import INGESTED, PUBLISHED
 from metashare.test_utils import create_user
 
@@ -108,6 +120,32 @@ class SearchIndexUpdateTests(test_utils.IndexAwareTestCase):
         self.assertEqual(SearchQuerySet().count(), 0,
             "After a resource is deleted, the index must automatically change.")
 
+    def test_queued_index_updates(self):
+        """
+        Verifies that queued index updates are coalesced per resource and only
+        reach the index when the index update queue is processed.
+        """
+        settings.QUEUE_INDEX_UPDATES = True
+        try:
+            self.assert_index_is_empty()
+            resource = test_utils.import_xml(SearchIndexUpdateTests.RES_PATH_1)
+            resource.storage_object.publication_status = PUBLISHED
+            resource.storage_object.save()
+            resource.storage_object.save()
+            self.assertEqual(1, PendingIndexUpdate.objects.count())
+            self.assertEqual(SearchQuerySet().count(), 0,
+                "Queued index updates must not change the index immediately.")
+            self.assertEqual(1, process_index_update_queue())
+            self.assertEqual(0, PendingIndexUpdate.objects.count())
+            self.assertEqual(SearchQuerySet().count(), 1)
+            # deletions are queued, too
+            resource.delete_deep()
+            self.assertEqual(SearchQuerySet().count(), 1)
+            process_index_update_queue()
+            self.assertEqual(SearchQuerySet().count(), 0)
+        finally:
+            settings.QUEUE_INDEX_UPDATES = False
+
     def assert_index_is_empty(self):
         """
         Asserts that the search index is empty.
@@ -135,6 +173,237 @@ class SearchIndexUpdateTests(test_utils.IndexAwareTestCase):
           "have changed and contain that resource.")
         return resource
     
+class SearchIndexPreparationTest(TestCase):
+    """
+    Tests the preparation of the search index documents of resources.
+    """
+    @classmethod
+    def setUpClass(cls):
+        LOGGER.info("running '{}' tests...".format(cls.__name__))
+        test_utils.set_index_active(False)
+
+    @classmethod
+    def tearDownClass(cls):
+        test_utils.set_index_active(True)
+        LOGGER.info("finished '{}' tests".format(cls.__name__))
+
+    def setUp(self):
+        test_utils.setup_test_storage()
+
+    def tearDown(self):
+        test_utils.clean_resources_db()
+        test_utils.clean_storage()
+
+    def _prepare(self, prepare_method, resource_id):
+        """
+        Returns the index document prepared by the given method for the
+        resource with the given id together with the number of database
+        queries which have been required for it.
+        """
+        _resource = resourceInfoType_model.objects.get(pk=resource_id)
+        _old_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        try:
+            _queries_before = len(connection.queries)
+            _document = prepare_method(_resource)
+            _query_count = len(connection.queries) - _queries_before
+        finally:
+            connection.use_debug_cursor = _old_debug_cursor
+        # the order of multi-valued fields does not matter
+        for _key, _value in _document.items():
+            if isinstance(_value, list):
+                _document[_key] = sorted(_value)
+        return _document, _query_count
+
+    def test_prepare_from_snapshot(self):
+        """
+        Verifies that the index documents prepared from a snapshot of the
+        resource object graph equal the ones prepared by walking the object
+        graph, but with a fraction of the database queries.
+        """
+        _index = resourceInfoType_modelIndex()
+        for _fixture in ('ILSP10.xml', 'testfixture.xml'):
+            _resource = test_utils.import_xml(
+                '{0}/repository/fixtures/{1}'.format(ROOT_PATH, _fixture))
+            _expected, _expected_queries = self._prepare(
+                super(resourceInfoType_modelIndex, _index).prepare,
+                _resource.id)
+            _document, _queries = self._prepare(_index.prepare, _resource.id)
+            self.assertEqual(_expected, _document)
+            self.assertTrue(_queries * 5 < _expected_queries,
+                "{} queries were required for preparing the index document " \
+                "of {} instead of {} without a snapshot.".format(_queries,
+                    _fixture, _expected_queries))
+
+    def test_merge_access_counts(self):
+        """
+        Verifies that only resources with changed download or view counts are
+        queued for reindexing when the access counts are merged.
+        """
+        _resource = test_utils.import_xml(
+            '{0}/repository/fixtures/testfixture.xml'.format(ROOT_PATH))
+        _lrid = _resource.storage_object.identifier
+        LRStats.objects.create(lrid=_lrid, userid='u', sessid='s',
+                               action=DOWNLOAD_STAT)
+        # the counter is initialized when the index document is prepared
+        self.assertEqual(1, resourceInfoType_modelIndex() \
+                         .prepare_dl_count(_resource))
+        settings.QUEUE_INDEX_UPDATES = True
+        try:
+            self.assertEqual(1, merge_access_counts())
+            self.assertEqual([_resource.id], list(PendingIndexUpdate.objects \
+                .values_list('resource_id', flat=True)))
+            self.assertEqual(0, merge_access_counts())
+        finally:
+            settings.QUEUE_INDEX_UPDATES = False
+            PendingIndexUpdate.objects.all().delete()
+        # the counter is not marked as merged if the index update fails
+        _resource.storage_object.publication_status = PUBLISHED
+        _resource.storage_object.save()
+        LRCounter.objects.filter(lrid=_lrid).update(count=F('count') + 1)
+        def _update(backend, index, iterable, commit=True):
+            raise IOError('The search index is not writable.')
+        _update_orig = MetashareSolrSearchBackend.update
+        MetashareSolrSearchBackend.update = _update
+        try:
+            self.assertRaises(IOError, merge_access_counts)
+            MetashareSolrSearchBackend.update = \
+                lambda *args, **kwargs: None
+            self.assertEqual(1, merge_access_counts())
+            self.assertEqual(0, merge_access_counts())
+        finally:
+            MetashareSolrSearchBackend.update = _update_orig
+
+    def test_failing_queue_entries(self):
+        """
+        Verifies that a queued resource which cannot be indexed does not keep
+        the other queued resources from being indexed.
+        """
+        _ids = [test_utils.import_xml('{0}/repository/fixtures/{1}' \
+                    .format(ROOT_PATH, _fixture)).id
+                for _fixture in ('ILSP10.xml', 'testfixture.xml')]
+        for _id in _ids:
+            enqueue_index_update(_id)
+        # the search backend fails for the first resource only
+        def _remove(backend, obj_or_string, commit=True):
+            if obj_or_string.endswith('.{0}'.format(_ids[0])):
+                raise IOError('The search index is not writable.')
+        _update, _remove_orig = MetashareSolrSearchBackend.update, \
+            MetashareSolrSearchBackend.remove
+        MetashareSolrSearchBackend.update = lambda *args, **kwargs: None
+        MetashareSolrSearchBackend.remove = _remove
+        try:
+            self.assertEqual(1, process_index_update_queue())
+            self.assertEqual([_ids[0]], list(PendingIndexUpdate.objects \
+                .values_list('resource_id', flat=True)))
+            self.assertEqual(0, process_index_update_queue())
+            MetashareSolrSearchBackend.remove = lambda *args, **kwargs: None
+            self.assertEqual(1, process_index_update_queue())
+            self.assertEqual(0, PendingIndexUpdate.objects.count())
+        finally:
+            MetashareSolrSearchBackend.update = _update
+            MetashareSolrSearchBackend.remove = _remove_orig
+            PendingIndexUpdate.objects.all().delete()
+
+
+class ParallelIndexRebuildTest(TestCase):
+    """
+    Tests the checkpointing of the parallel search index rebuild.
+    """
+    CHECKPOINT = '{0}/rebuild_index_test.json'.format(settings.STORAGE_PATH)
+
+    def tearDown(self):
+        if os.path.exists(self.CHECKPOINT):
+            os.remove(self.CHECKPOINT)
+
+    def test_pending_batches(self):
+        """
+        Verifies that only the resources which are not covered by a completed
+        batch are indexed again.
+        """
+        _ids = [1, 2, 3, 5, 8, 9, 10, 12, 13]
+        self.assertEqual([[1, 2, 3], [5, 8, 9], [10, 12, 13]],
+                         get_pending_batches(_ids, [], 3))
+        self.assertEqual([[1, 2], [10]],
+                         get_pending_batches(_ids, [(3, 9), (12, 13)], 2))
+        self.assertEqual([], get_pending_batches(_ids, [(1, 13)], 2))
+
+    def test_checkpoint_roundtrip(self):
+        """
+        Verifies that saved checkpoints are loaded again and that a missing
+        checkpoint is reported as such.
+        """
+        self.assertEqual(None, load_checkpoint(self.CHECKPOINT))
+        save_checkpoint([(12, 13), (1, 9)], self.CHECKPOINT)
+        self.assertEqual([(1, 9), (12, 13)], load_checkpoint(self.CHECKPOINT))
+
+
+class SearchFilterStructureTest(TestCase):
+    """
+    Tests the creation of the filters/facets structure of the search page.
+    """
+    def setUp(self):
+        cache.clear()
+
+    def _get_view(self, selected_facets):
+        _view = views.MetashareFacetedSearchView()
+        _view.request = RequestFactory().get(_SEARCH_PAGE_PATH,
+            {'selected_facets': selected_facets})
+        _view.query = u''
+        return _view
+
+    def test_filter_structure(self):
+        """
+        Verifies the labels and targets of the facet items and that the
+        structure is cached per query and selected facets.
+        """
+        _facet_fields = {'languageNameFilter': [(u'English', 2),
+            (u'German', 1), (u'Greek', 0)],
+            'resourceTypeFilter': [(u'lexicalConceptualResource', 3)]}
+        _selected = [u'languageNameFilter_exact:English']
+        _filters = self._get_view(_selected) \
+            ._create_filters_structure(_facet_fields)
+        self.assertEqual([u'Language', u'Resource Type'],
+                         [_filter['label'] for _filter in _filters])
+        self.assertEqual([{'label': u'English', 'count': 2, 'targets': [],
+                           'subresults': []}], _filters[0]['removable'])
+        self.assertEqual([{'label': u'German', 'count': 1,
+                           'targets': _selected
+                                + [u'languageNameFilter_exact:German'],
+                           'subresults': []}], _filters[0]['addable'])
+        self.assertEqual(u'Lexical Conceptual Resource',
+                         _filters[1]['addable'][0]['label'])
+        # the same query with the same selected facets is served from the cache
+        self.assertEqual(_filters, self._get_view(_selected) \
+                         ._create_filters_structure({}))
+        self.assertEqual([], self._get_view([])._create_filters_structure({}))
+        # a write to the search index invalidates the cached structures, also
+        # in other processes, as the index generation is kept in the database
+        _generation = get_index_generation()
+        cache.clear()
+        self.assertEqual(_generation, get_index_generation())
+        bump_index_generation()
+        self.assertNotEqual(_generation, get_index_generation())
+        self.assertEqual([], self._get_view(_selected) \
+                         ._create_filters_structure({}))
+
+    def test_results_page_cache_key(self):
+        """
+        Verifies that the results page cache key depends on the sort order
+        which is actually applied, i.e., the first one.
+        """
+        def _get_key(sort):
+            _view = views.MetashareFacetedSearchView()
+            _view.request = RequestFactory().get(_SEARCH_PAGE_PATH,
+                                                 {'sort': sort})
+            _view.query = u''
+            return _view._get_results_page_cache_key()
+        self.assertEqual(_get_key(['dl_count_desc']),
+                         _get_key(['dl_count_desc', 'resourcename_asc']))
+        self.assertNotEqual(_get_key(['dl_count_desc']),
+                            _get_key(['resourcename_asc', 'dl_count_desc']))
+
+
 class SearchTest(test_utils.IndexAwareTestCase):
     """
     Test the search functionality
@@ -2,9 +2,11 @@ import shutil
 import logging
 from datetime import datetime
 
+from django.conf import settings as django_settings
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.humanize.templatetags import humanize
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.template.defaultfilters import urlizetrunc
 from django.test import TestCase
@@ -16,8 +18,11 @@ from metashare import test_utils, settings, xml_utils
 from metashare.accounts.models import UserProfile, EditorGroup, \
     EditorGroupManagers, Organization
 from metashare.repository import views
-from metashare.repository.models import resourceInfoType_model
+from metashare.repository.models import resourceInfoType_model, \
+    get_resource_view_cache_key
 from metashare.repository.supermodel import OBJECT_XML_CACHE
+from metashare.stats.model_utils import DOWNLOAD_STAT
+from metashare.stats.models import LRStats
 from metashare.settings import DJANGO_BASE, ROOT_PATH, LOG_HANDLER, \
     TEST_MODE_NAME
 from metashare.test_utils import create_user
@@ -198,6 +203,41 @@ class ViewTest(TestCase):
         test_utils.clean_storage()
         test_utils.clean_user_db()
 
+    def test_resource_view_is_cached(self):
+        """
+        Tests that the metadata part of the single resource view is cached
+        until the storage object or a reusable entity of the resource changes.
+        """
+        client = Client()
+        url = self.resource.get_absolute_url()
+        response = client.get(url, follow=True)
+        self.assertContains(response, 'Italian TTS Speech Corpus (Appen)')
+        self.assertIsNotNone(cache.get(
+            get_resource_view_cache_key(self.resource.storage_object)))
+
+        # a change of the metadata alone does not affect the cached view
+        _identification = self.resource.identificationInfo
+        _identification.resourceName = {'en-us': 'Cached Corpus Test'}
+        _identification.save()
+        response = client.get(url, follow=True)
+        self.assertContains(response, 'Italian TTS Speech Corpus (Appen)')
+
+        # saving the storage object invalidates the cached view
+        self.resource.storage_object.save()
+        response = client.get(url, follow=True)
+        self.assertTemplateUsed(response,
+                                'repository/resource_view/lr_view.html')
+        self.assertContains(response, 'Cached Corpus Test')
+        self.assertNotContains(response, 'Italian TTS Speech Corpus (Appen)')
+
+        # changing a nested part of a (reusable) contact person invalidates the
+        # cached view, too
+        _communication = self.resource.contactPerson.all()[0].communicationInfo
+        _communication.city = 'Changed View City'
+        _communication.save()
+        response = client.get(url, follow=True)
+        self.assertContains(response, 'Changed View City')
+
     def test_editor_user_sees_editor(self):
         """
         Tests whether an editor user can edit a resource (in seeing the
@@ -533,7 +573,32 @@ class DownloadViewTest(TestCase):
         self.assertEquals(200, response.status_code)
         self.assertEquals('application/zip', response.__getitem__('Content-Type'))
         self.assertEquals('attachment; filename=archive.zip', response.__getitem__('Content-Disposition'))
-        
+
+    def test_resumed_downloads_are_not_counted(self):
+        """
+        Verifies that only downloads from the first byte on are counted, also
+        if sending the file is offloaded to the web server.
+        """
+        _lrid = self.local_download_resource.storage_object.identifier
+        _downloads = LRStats.objects.filter(lrid=_lrid, action=DOWNLOAD_STAT)
+        django_settings.SENDFILE_HEADER = 'X-Sendfile'
+        try:
+            for _range, _count in ((None, 1), ('bytes=100-', 1),
+                                   ('bytes=0-99', 2), ('bytes=-10', 2)):
+                _headers = {'HTTP_RANGE': _range} if _range else {}
+                # each download is made in a new session, as the downloads
+                # are only counted once per session
+                client = Client()
+                client.login(username='normaluser', password='secret')
+                response = client.post(reverse(views.download,
+                        args=(_lrid,)),
+                    { 'in_licence_agree_form': 'True', 'licence_agree': 'True',
+                      'licence': 'AGPL' }, **_headers)
+                self.assertEquals(200, response.status_code)
+                self.assertEquals(_count, _downloads.count())
+        finally:
+            django_settings.SENDFILE_HEADER = None
+
     def test_externally_downloadable_resource(self):
         """
         Verifies that a resource which is externally downloadable can actually
@@ -1,13 +1,17 @@
 import logging
+import re
+import time
 
+from copy import copy
 from datetime import datetime
-from os.path import split, getsize
+from hashlib import md5
+from os.path import split
 from urllib import urlopen
-from mimetypes import guess_type
 
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.core.paginator import Paginator
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
 from django.shortcuts import render_to_response, get_object_or_404, redirect
 from django.template import RequestContext
 from django.contrib import messages
@@ -17,26 +21,30 @@ from django.utils.translation import ugettext as _
 
 from haystack.views import FacetedSearchView
 
+from metashare import settings
+from metashare.haystack_backends import get_index_generation
 from metashare.repository.editor.resource_editor import has_edit_permission
 from metashare.repository.forms import LicenseSelectionForm, \
     LicenseAgreementForm, DownloadContactForm, MORE_FROM_SAME_CREATORS, \
     MORE_FROM_SAME_PROJECTS
 from metashare.repository import model_utils
 from metashare.repository.models import licenceInfoType_model, \
-    resourceInfoType_model
+    resourceInfoType_model, get_resource_view_cache_key
 from metashare.repository.search_indexes import resourceInfoType_modelIndex, \
     update_lr_index_entry
-from metashare.settings import LOG_HANDLER, MEDIA_URL, DJANGO_URL
+from metashare.repository.supermodel import prefetch_export_graph
+from metashare.settings import LOG_HANDLER, MEDIA_URL, DJANGO_URL, \
+    RESOURCE_VIEW_CACHE_TIMEOUT, FACET_STRUCTURE_CACHE_TIMEOUT, \
+    SEARCH_RESULTS_CACHE_TIMEOUT
 from metashare.stats.model_utils import getLRStats, saveLRStats, \
-    saveQueryStats, VIEW_STAT, DOWNLOAD_STAT
+    saveQueryStats, saveSearchCacheStats, VIEW_STAT, DOWNLOAD_STAT
 from metashare.storage.models import PUBLISHED
 from metashare.recommendations.recommendations import SessionResourcesTracker, \
     get_download_recommendations, get_view_recommendations, \
     get_more_from_same_creators_qs, get_more_from_same_projects_qs
+from metashare.utils import serve_file, is_resumed_download, LRUCache
 
 
-MAXIMUM_READ_BLOCK_SIZE = 4096
-
 # Setup logging support.
 LOGGER = logging.getLogger(__name__)
 LOGGER.addHandler(LOG_HANDLER)
@@ -266,22 +274,15 @@ def _provide_download(request, resource, download_urls):
     dl_path = resource.storage_object.get_download()
     if dl_path:
         try:
-            def dl_stream_generator():
-                with open(dl_path, 'rb') as _local_data:
-                    _chunk = _local_data.read(MAXIMUM_READ_BLOCK_SIZE)
-                    while _chunk:
-                        yield _chunk
-                        _chunk = _local_data.read(MAXIMUM_READ_BLOCK_SIZE)
-
             # build HTTP response with a guessed mime type; the response
-            # content is a stream of the download file
-            filemimetype = guess_type(dl_path)[0] or "application/octet-stream"
-            response = HttpResponse(dl_stream_generator(),
-                                    mimetype=filemimetype)
-            response['Content-Length'] = getsize(dl_path) 
+            # content is a stream of the download file (or a part of it for
+            # resumed downloads), unless it is sent by the web server
+            response = serve_file(request, dl_path)
             response['Content-Disposition'] = 'attachment; filename={0}' \
                                                 .format(split(dl_path)[1])
-            _update_download_stats(resource, request)
+            # resumed downloads are not counted again
+            if not is_resumed_download(request, dl_path):
+                _update_download_stats(resource, request)
             LOGGER.info("Offering a local download of resource #{0}." \
                         .format(resource.id))
             return response
@@ -318,8 +319,10 @@ def _update_download_stats(resource, request):
     download request.
     """
     # maintain general download statistics
-    if saveLRStats(resource, DOWNLOAD_STAT, request):
-        # update download count in the search index, too
+    if saveLRStats(resource, DOWNLOAD_STAT, request) \
+            and not settings.QUEUE_INDEX_UPDATES:
+        # update download count in the search index, too; with queued index
+        # updates the changed counts are merged periodically instead
         update_lr_index_entry(resource)
     # update download tracker
     tracker = SessionResourcesTracker.getTracker(request)
@@ -410,13 +413,77 @@ def view(request, resource_name=None, object_id=None):
     Render browse or detail view for the repository application.
     """
     # only published resources may be viewed
-    resource = get_object_or_404(resourceInfoType_model,
-                                 storage_object__identifier=object_id,
-                                 storage_object__publication_status=PUBLISHED)
-    if request.path_info != resource.get_absolute_url():
-        return redirect(resource.get_absolute_url())
+    resource = get_object_or_404(
+        resourceInfoType_model.objects.select_related('storage_object'),
+        storage_object__identifier=object_id,
+        storage_object__publication_status=PUBLISHED)
+
+    # The resource specific part of the template context is cached for the
+    # current revision of the resource; see _get_resource_view_context().
+    cache_key = get_resource_view_cache_key(resource.storage_object)
+    context = cache.get(cache_key)
+    if context is None:
+        context = _get_resource_view_context(resource)
+        cache.set(cache_key, context, RESOURCE_VIEW_CACHE_TIMEOUT)
+    if request.path_info != context['absolute_url']:
+        return redirect(context['absolute_url'])
+    context['resource'] = resource
+
+    template = 'repository/resource_view/lr_view.html'
+
+    # For users who have edit permission for this resource, we have to add 
+    # LR_EDIT which contains the URL of the Django admin backend page 
+    # for this resource.
+    if has_edit_permission(request, resource):
+        context['LR_EDIT'] = reverse(
+            'admin:repository_resourceinfotype_model_change', \
+              args=(resource.id,))
+
+    # Update statistics:
+    if saveLRStats(resource, VIEW_STAT, request) \
+            and not settings.QUEUE_INDEX_UPDATES:
+        # update view count in the search index, too; with queued index
+        # updates the changed counts are merged periodically instead
+        update_lr_index_entry(resource)
+    # update view tracker
+    tracker = SessionResourcesTracker.getTracker(request)
+    tracker.add_view(resource, datetime.now())
+    request.session['tracker'] = tracker
+
+    # Add download/view/last updated statistics to the template context.
+    context['LR_STATS'] = getLRStats(resource.storage_object.identifier)
+            
+    # Add recommendations for 'also viewed' resources
+    context['also_viewed'] = \
+        _format_recommendations(get_view_recommendations(resource))
+    # Add recommendations for 'also downloaded' resources
+    context['also_downloaded'] = \
+        _format_recommendations(get_download_recommendations(resource))
+    # Add 'more from same' links
+    if get_more_from_same_projects_qs(resource).count():
+        context['search_rel_projects'] = '{}/repository/search?q={}:{}'.format(
+            DJANGO_URL, MORE_FROM_SAME_PROJECTS,
+            resource.storage_object.identifier)
+    if get_more_from_same_creators_qs(resource).count():
+        context['search_rel_creators'] = '{}/repository/search?q={}:{}'.format(
+            DJANGO_URL, MORE_FROM_SAME_CREATORS,
+            resource.storage_object.identifier)
+
+    # Render and return template with the defined context.
+    ctx = RequestContext(request)
+    return render_to_response(template, context, context_instance=ctx)
+
+def _get_resource_view_context(resource):
+    """
+    Returns the part of the single resource view template context which only
+    depends on the metadata of the given resource.
 
-    # Convert resource to ElementTree and then to template tuples.
+    The returned context can be cached until the storage object of the
+    resource changes; it does not include the resource instance itself.
+    """
+    # Convert resource to ElementTree and then to template tuples; the object
+    # graph of the resource is bulk-loaded first to save database queries.
+    prefetch_export_graph([resource])
     lr_content = _convert_to_template_tuples(
         resource.export_to_elementtree(pretty=True))
 
@@ -576,6 +643,7 @@ def view(request, resource_name=None, object_id=None):
    
     # Define context for template rendering.
     context = {
+                'absolute_url': resource.get_absolute_url(),
                 'contact_person_dicts': contact_person_dicts,
                 'description': description,
                 'distribution_dict': distribution_dict,
@@ -590,7 +658,6 @@ def view(request, resource_name=None, object_id=None):
                 'other_descriptions': other_descriptions,
                 'relation_dicts': relation_dicts,
                 'res_short_names': res_short_names,
-                'resource': resource,
                 'resource_component_dicts': resource_component_dicts,
                 'resource_component_dict': resource_component_dict,
                 'resourceName': resource_name,
@@ -603,47 +670,8 @@ def view(request, resource_name=None, object_id=None):
                 'text_counts': text_counts,
                 'video_counts': video_counts,
               }
-    template = 'repository/resource_view/lr_view.html'
-
-    # For users who have edit permission for this resource, we have to add 
-    # LR_EDIT which contains the URL of the Django admin backend page 
-    # for this resource.
-    if has_edit_permission(request, resource):
-        context['LR_EDIT'] = reverse(
-            'admin:repository_resourceinfotype_model_change', \
-              args=(resource.id,))
-
-    # Update statistics:
-    if saveLRStats(resource, VIEW_STAT, request):
-        # update view count in the search index, too
-        update_lr_index_entry(resource)
-    # update view tracker
-    tracker = SessionResourcesTracker.getTracker(request)
-    tracker.add_view(resource, datetime.now())
-    request.session['tracker'] = tracker
-
-    # Add download/view/last updated statistics to the template context.
-    context['LR_STATS'] = getLRStats(resource.storage_object.identifier)
-            
-    # Add recommendations for 'also viewed' resources
-    context['also_viewed'] = \
-        _format_recommendations(get_view_recommendations(resource))
-    # Add recommendations for 'also downloaded' resources
-    context['also_downloaded'] = \
-        _format_recommendations(get_download_recommendations(resource))
-    # Add 'more from same' links
-    if get_more_from_same_projects_qs(resource).count():
-        context['search_rel_projects'] = '{}/repository/search?q={}:{}'.format(
-            DJANGO_URL, MORE_FROM_SAME_PROJECTS,
-            resource.storage_object.identifier)
-    if get_more_from_same_creators_qs(resource).count():
-        context['search_rel_creators'] = '{}/repository/search?q={}:{}'.format(
-            DJANGO_URL, MORE_FROM_SAME_CREATORS,
-            resource.storage_object.identifier)
+    return context
 
-    # Render and return template with the defined context.
-    ctx = RequestContext(request)
-    return render_to_response(template, context, context_instance=ctx)
 
 def tuple2dict(_tuple):
     '''
@@ -712,6 +740,70 @@ def _format_recommendations(recommended_resources):
     return result
 
 
+# the (name, label, facet id, parent facet id) tuples of all search filters,
+# sorted by their facet ids
+# pylint: disable-msg=E1101
+_FILTER_LABELS = sorted([(name, field.label, field.facet_id, field.parent_id)
+                         for name, field
+                         in resourceInfoType_modelIndex.fields.iteritems()
+                         if name.endswith("Filter")], key=lambda f: f[2])
+# the top level search filters, sorted by their facet ids
+_TOP_LEVEL_FILTERS = [f for f in _FILTER_LABELS if f[3] == 0]
+# the sub filters of each top level search filter, keyed by its facet id
+_SUB_FILTERS = {}
+for _filter in _FILTER_LABELS:
+    if _filter[3] != 0:
+        _SUB_FILTERS.setdefault(_filter[3], []).append(_filter)
+
+# matches the words of camel case facet values
+_CAMEL_CASE_WORD_RE = re.compile(r'[A-Z\_]*[^A-Z]*')
+# the display labels of facet values, keyed by the facet values
+_FACET_VALUE_LABELS = LRUCache(10000)
+
+
+def _get_facet_value_label(value):
+    """
+    Returns the display label of the given non-empty facet value, i.e., the
+    value with its first letter capitalized and its camel case words separated
+    by spaces.
+    """
+    label = _FACET_VALUE_LABELS.get(value)
+    if label is None:
+        label = " ".join(_CAMEL_CASE_WORD_RE.findall(
+            value[0].capitalize() + value[1:]))[:-1]
+        _FACET_VALUE_LABELS[value] = label
+    return label
+
+
+def _get_filters_cache_key(query, sel_facets):
+    """
+    Returns the cache key of the filters/facets data structure for the given
+    search query and selected facets in the current search index generation.
+    """
+    _facets = sorted((name, sorted(values))
+                     for name, values in sel_facets.iteritems())
+    return 'search_filters_{0}'.format(md5(repr((get_index_generation(),
+                                                 query, _facets))).hexdigest())
+
+
+class _CachedSearchResults(object):
+    """
+    A stand-in for the search results of a query of which only the results on
+    a single (cached) page are available; this is sufficient for paginating
+    the results.
+    """
+    def __init__(self, count, offset, results):
+        self.count = count
+        self.offset = offset
+        self.results = results
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, key):
+        return self.results[key.start - self.offset:key.stop - self.offset]
+
+
 class MetashareFacetedSearchView(FacetedSearchView):
     """
     A modified `FacetedSearchView` which makes sure that only such results will
@@ -749,16 +841,74 @@ class MetashareFacetedSearchView(FacetedSearchView):
         else:
             sqs = sqs.order_by('resourceNameSort_exact')
 
-        # collect statistics about the query
+        return sqs
+
+    def _get_results_page_cache_key(self):
+        """
+        Returns the cache key of the current search results page in the current
+        search index generation, or None if the requested page is invalid.
+        """
+        try:
+            _page_no = int(self.request.GET.get('page', 1))
+        except (TypeError, ValueError):
+            return None
+        _key = (get_index_generation(), u' '.join(self.query.split()),
+                sorted(self.request.GET.getlist('selected_facets')),
+                self.request.GET.getlist('sort')[:1], _page_no)
+        return 'search_page_{0}'.format(md5(repr(_key)).hexdigest())
+
+    def create_response(self):
+        """
+        Generates the actual HttpResponse to send back to the user.
+
+        The results page and the facet counts are cached for
+        SEARCH_RESULTS_CACHE_TIMEOUT seconds or until the search index changes,
+        whatever happens first.
+        """
         starttime = datetime.now()
-        results_count = sqs.count()
+        _start = time.time()
+        _cache_key = self._get_results_page_cache_key()
+        _cached = _cache_key and cache.get(_cache_key)
+        if _cached:
+            paginator = Paginator(_CachedSearchResults(_cached['count'],
+                    _cached['offset'], _cached['results']),
+                self.results_per_page)
+            page = paginator.page(_cached['number'])
+            self.facet_counts = _cached['facets']
+        else:
+            (paginator, page) = self.build_page()
+            self.facet_counts = self.results.facet_counts()
+            if _cache_key:
+                # the model objects of the results are not needed for
+                # rendering the results page
+                _results = [copy(_result) for _result in page.object_list]
+                for _result in _results:
+                    _result._object = None
+                cache.set(_cache_key, {'count': paginator.count,
+                    'offset': (page.number - 1) * self.results_per_page,
+                    'results': _results,
+                    'number': page.number, 'facets': self.facet_counts},
+                    SEARCH_RESULTS_CACHE_TIMEOUT)
+        saveSearchCacheStats(bool(_cached),
+                             int((time.time() - _start) * 1000))
+
+        # collect statistics about the query
         if self.query:
             saveQueryStats(self.query, \
                 str(sorted(self.request.GET.getlist("selected_facets"))), \
-                results_count, \
+                paginator.count, \
                 (datetime.now() - starttime).microseconds, self.request)
 
-        return sqs
+        context = {
+            'query': self.query,
+            'form': self.form,
+            'page': page,
+            'paginator': paginator,
+            'suggestion': None,
+        }
+        context.update(self.extra_context())
+        return render_to_response(self.template, context,
+            context_instance=self.context_class(self.request))
     
     def _get_selected_facets(self):
         """
@@ -783,22 +933,33 @@ class MetashareFacetedSearchView(FacetedSearchView):
         
         Takes the raw facet 'fields' dictionary which is (indirectly) returned
         by the `facet_counts()` method of a `SearchQuerySet`.
+
+        The structure is cached for FACET_STRUCTURE_CACHE_TIMEOUT seconds per
+        query and selected facets.
         """
-        import re
+        sel_facets = self._get_selected_facets()
+        _cache_key = _get_filters_cache_key(self.query, sel_facets)
+        result = cache.get(_cache_key)
+        if result is None:
+            result = self._build_filters_structure(facet_fields, sel_facets)
+            cache.set(_cache_key, result, FACET_STRUCTURE_CACHE_TIMEOUT)
+        return result
 
+    def _build_filters_structure(self, facet_fields, sel_facets):
+        """
+        Builds the filters/facets data structure of `_create_filters_structure`
+        for the given raw facet 'fields' dictionary and selected facets.
+        """
         result = []
-        # pylint: disable-msg=E1101
-        filter_labels = [(name, field.label, field.facet_id, field.parent_id)
-                         for name, field
-                         in resourceInfoType_modelIndex.fields.iteritems()
-                         if name.endswith("Filter")]
-        filter_labels.sort(key=lambda f: f[2])
-        sel_facets = self._get_selected_facets()
+        # the (field, value, target) triples of all selected facets; each list
+        # of targets is derived from these
+        sel_targets = [(name, value, u'{0}:{1}'.format(name, value))
+                       for name, values in sel_facets.iteritems()
+                       for value in values]
         # Step (1): if there are any selected facets, then add these first:
         if sel_facets:
             # add all top level facets (sorted by their facet IDs):
-            for name, label, facet_id, _dummy in \
-              [f for f in filter_labels if f[3] == 0]:
+            for name, label, facet_id, _dummy in _TOP_LEVEL_FILTERS:
                 name_exact = '{0}_exact'.format(name)
                 # only add selected facets in step (1)
                 if name_exact in sel_facets:
@@ -808,53 +969,45 @@ class MetashareFacetedSearchView(FacetedSearchView):
                         addable = []
                         # only items with a count > 0 are shown
                         for item in [i for i in items if i[1] > 0]:
-                            subfacets = [f for f in filter_labels if (f[3] == \
-                              facet_id and item[0] in f[0]) ]
-                            subfacets_exactname_list = []
-                            subfacets_exactname_list.extend( \
-                              [u'{0}_exact'.format(subfacet[0]) \
-                              for subfacet in subfacets])
+                            subfacets = [f for f in
+                                         _SUB_FILTERS.get(facet_id, ())
+                                         if item[0] in f[0]]
+                            subfacets_exactname_list = \
+                                [u'{0}_exact'.format(subfacet[0])
+                                 for subfacet in subfacets]
                             subresults = []
                             for facet in subfacets:
-                                subresults = self.show_subfilter( \
-                                  facet, sel_facets, facet_fields, subresults)
+                                subresults = self.show_subfilter(facet,
+                                    sel_facets, facet_fields, subresults,
+                                    sel_targets)
+                            if item[0] == "":
+                                continue
                             if item[0] in sel_facets[name_exact]:
-                                if item[0] != "":
-                                    lab_item = " ".join(re.findall( \
-                                      '[A-Z\_]*[^A-Z]*', \
-                                      item[0][0].capitalize()+item[0][1:]))[:-1]
-                                    removable.append({'label': lab_item,
-                                        'count': item[1], 'targets':
-                                            [u'{0}:{1}'.format(name, value)
-                                             for name, values in
-                                             sel_facets.iteritems() for value in
-                                             values if (name != name_exact
-                                             or value != item[0]) and name \
-                                               not in subfacets_exactname_list], \
-                                               'subresults': subresults})
+                                removable.append({
+                                    'label': _get_facet_value_label(item[0]),
+                                    'count': item[1],
+                                    'targets': [_target for _name, _value,
+                                        _target in sel_targets
+                                        if (_name != name_exact
+                                            or _value != item[0])
+                                        and _name not in
+                                            subfacets_exactname_list],
+                                    'subresults': subresults})
                             else:
-                                targets = [u'{0}:{1}'.format(name, value)
-                                           for name, values in
-                                           sel_facets.iteritems()
-                                           for value in values]
-                                targets.append(u'{0}:{1}'.format(name_exact,
-                                                                 item[0]))
-                                if item[0] != "":
-                                    lab_item = " ".join(re.findall( \
-                                      '[A-Z\_]*[^A-Z]*', \
-                                      item[0][0].capitalize()+item[0][1:]))[:-1]
-                                    addable.append({'label': lab_item,
-                                                'count': item[1],
-                                                'targets': targets,
-                                                'subresults': subresults})
+                                addable.append({
+                                    'label': _get_facet_value_label(item[0]),
+                                    'count': item[1],
+                                    'targets': [_t[2] for _t in sel_targets]
+                                        + [u'{0}:{1}'.format(name_exact,
+                                                             item[0])],
+                                    'subresults': subresults})
 
                         result.append({'label': label, 'removable': removable,
                                        'addable': addable})                    
 
         # Step (2): add all top level facets without selected facet items at the
         # end (sorted by their facet IDs):
-        for name, label, facet_id, _dummy in \
-          [f for f in filter_labels if f[3] == 0]:
+        for name, label, facet_id, _dummy in _TOP_LEVEL_FILTERS:
             name_exact = '{0}_exact'.format(name)
             # only add facets without selected items in step (2)
             if not name_exact in sel_facets:
@@ -863,24 +1016,22 @@ class MetashareFacetedSearchView(FacetedSearchView):
                     addable = []
                     # only items with a count > 0 are shown
                     for item in [i for i in items if i[1] > 0]:
-                        targets = [u'{0}:{1}'.format(name, value)
-                                   for name, values in sel_facets.iteritems()
-                                   for value in values]
-                        targets.append(u'{0}:{1}'.format(name_exact, item[0]))
-
                         if item[0] != "":
-                            lab_item = " ".join(re.findall('[A-Z\_]*[^A-Z]*', 
-                              item[0][0].capitalize()+item[0][1:]))[:-1]
-                            addable.append({'label': lab_item, 'count': item[1],
-                                        'targets': targets})
-                    subresults = [f for f in filter_labels if f[3] == facet_id] 
+                            addable.append({
+                                'label': _get_facet_value_label(item[0]),
+                                'count': item[1],
+                                'targets': [_t[2] for _t in sel_targets]
+                                    + [u'{0}:{1}'.format(name_exact, item[0])]})
+                    subresults = list(_SUB_FILTERS.get(facet_id, ()))
                     result.append({'label': label, 'removable': [],
                                    'addable': addable, 'subresults': subresults})
 
         return result
 
     def extra_context(self):
-        extra = super(MetashareFacetedSearchView, self).extra_context()
+        # the facet counts are taken from the (possibly cached) results page
+        # instead of the search results
+        extra = {'request': self.request, 'facets': self.facet_counts}
         # add a data structure encapsulating most of the logic which is required
         # for rendering the filters/facets
         if 'fields' in extra['facets']:
@@ -893,17 +1044,20 @@ class MetashareFacetedSearchView(FacetedSearchView):
             extra['filters'] = []
         return extra
     
-    def show_subfilter(self, facet, sel_facets, facet_fields, results):
+    def show_subfilter(self, facet, sel_facets, facet_fields, results,
+                       sel_targets=None):
         """
         Creates a second level for faceting. 
         Sub filters are included after the parent filters.
         """
-        import re
-
         name = facet[0]
         label = facet[1]
 
         name_exact = '{0}_exact'.format(name)
+        if sel_targets is None:
+            sel_targets = [(_name, _value, u'{0}:{1}'.format(_name, _value))
+                           for _name, _values in sel_facets.iteritems()
+                           for _value in _values]
 
         if name_exact in sel_facets:
             items = facet_fields.get(name)
@@ -912,30 +1066,21 @@ class MetashareFacetedSearchView(FacetedSearchView):
                 addable = []
                 # only items with a count > 0 are shown
                 for item in [i for i in items if i[1] > 0]:
+                    if item[0] == "":
+                        continue
                     if item[0] in sel_facets[name_exact]:
-                        if item[0] != "":
-                            lab_item = " ".join(re.findall('[A-Z\_]*[^A-Z]*', 
-                              item[0][0].capitalize()+item[0][1:]))[:-1]
-                            removable.append({'label': lab_item,
-                                'count': item[1], 'targets':
-                                    [u'{0}:{1}'.format(name, value)
-                                     for name, values in
-                                     sel_facets.iteritems() for value in
-                                     values if name != name_exact
-                                     or value != item[0]]})
+                        removable.append({
+                            'label': _get_facet_value_label(item[0]),
+                            'count': item[1],
+                            'targets': [_target for _name, _value, _target
+                                        in sel_targets if _name != name_exact
+                                        or _value != item[0]]})
                     else:
-                        targets = [u'{0}:{1}'.format(name, value)
-                                   for name, values in
-                                   sel_facets.iteritems()
-                                   for value in values]
-                        targets.append(u'{0}:{1}'.format(name_exact,
-                                                         item[0]))
-                        if item[0] != "":
-                            lab_item = " ".join(re.findall('[A-Z\_]*[^A-Z]*', 
-                              item[0][0].capitalize()+item[0][1:]))[:-1]
-                            addable.append({'label': lab_item,
-                                        'count': item[1],
-                                        'targets': targets})
+                        addable.append({
+                            'label': _get_facet_value_label(item[0]),
+                            'count': item[1],
+                            'targets': [_t[2] for _t in sel_targets]
+                                + [u'{0}:{1}'.format(name_exact, item[0])]})
                 if (addable+removable):
                     results.append({'label': label, 'removable': removable,
                                'addable': addable})
@@ -945,15 +1090,12 @@ class MetashareFacetedSearchView(FacetedSearchView):
                 addable = []
                 # only items with a count > 0 are shown
                 for item in [i for i in items if i[1] > 0]:
-                    targets = [u'{0}:{1}'.format(name, value)
-                               for name, values in sel_facets.iteritems()
-                               for value in values]
-                    targets.append(u'{0}:{1}'.format(name_exact, item[0]))
                     if item[0] != "":
-                        lab_item = " ".join(re.findall('[A-Z\_]*[^A-Z]*', 
-                          item[0][0].capitalize()+item[0][1:]))[:-1]
-                        addable.append({'label': lab_item, 'count': item[1],
-                                    'targets': targets})
+                        addable.append({
+                            'label': _get_facet_value_label(item[0]),
+                            'count': item[1],
+                            'targets': [_t[2] for _t in sel_targets]
+                                + [u'{0}:{1}'.format(name_exact, item[0])]})
                 if addable:
                     results.append({'label': label, 'removable': [],
                                'addable': addable})
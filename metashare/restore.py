@@ -87,6 +87,8 @@ if __name__ == "__main__":
     
     # Be nice and cleanup cache...
     _cache_size = sum([len(x) for x in OBJECT_XML_CACHE.values()])
+    print "OBJECT_XML_CACHE statistics: {} hits, {} misses".format(
+      OBJECT_XML_CACHE.hits, OBJECT_XML_CACHE.misses)
     OBJECT_XML_CACHE.clear()
     print "Cleared OBJECT_XML_CACHE ({} bytes)".format(_cache_size)
     
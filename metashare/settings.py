@@ -18,6 +18,48 @@ LOG_FORMATTER = logging.Formatter(LOG_FORMAT, LOG_DATE)
 # Allows to disable check for duplicate instances.
 CHECK_FOR_DUPLICATE_INSTANCES = True
 
+# Maximum number of serialized objects which are cached for the check for
+# duplicate instances.
+OBJECT_XML_CACHE_SIZE = 10000
+
+# Number of seconds for which the metadata part of a single resource view is
+# cached; the cache entry is also invalidated whenever the storage object or
+# one of the reusable entities (persons, organizations, etc.) of the resource
+# changes.
+RESOURCE_VIEW_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Number of seconds for which the filters/facets structure of the search page
+# is cached per search query and selected facets.
+FACET_STRUCTURE_CACHE_TIMEOUT = 60
+
+# Number of seconds for which a search results page is cached per search query,
+# selected facets, sort order and page number; the cache entries are also
+# invalidated whenever the search index changes.
+SEARCH_RESULTS_CACHE_TIMEOUT = 5 * 60
+
+# Maximum number of query statistics events which are buffered in memory before
+# they are written to the database in bulk; buffered events are written at the
+# latest after STATS_BUFFER_FLUSH_INTERVAL seconds. Set to 0 to write the
+# statistics immediately.
+STATS_BUFFER_SIZE = 100
+STATS_BUFFER_FLUSH_INTERVAL = 10
+
+# Number of days for which the raw query statistics are kept; older entries
+# are removed by the nightly `prune_query_stats` job once they have been rolled
+# up into the daily and monthly statistics aggregates.
+QUERY_STATS_RETENTION = 2 * 365
+
+# If True, the search index entries of changed resources are not updated
+# within the request which changed them; instead the resources are queued and
+# indexed in batches by the `process_index_queue` job which runs every minute.
+# Changed download and view counts are then only merged into the index by the
+# hourly `merge_access_counts` job.
+QUEUE_INDEX_UPDATES = True
+
+# Maximum number of queued resources which are indexed with a single request
+# to the search backend.
+INDEX_QUEUE_BATCH_SIZE = 100
+
 # work around a problem on non-posix-compliant platforms by not using any
 # RotatingFileHandler there
 if os.name == "posix":
@@ -201,12 +243,12 @@ PROJECT_APPS = (
 TEST_MODE_NAME = 'testing'
 HAYSTACK_CONNECTIONS = {
     'default': {
-        'ENGINE': 'haystack.backends.solr_backend.SolrEngine',
+        'ENGINE': 'metashare.haystack_backends.MetashareSolrEngine',
         'URL': SOLR_URL,
         'SILENTLY_FAIL': False
     },
     TEST_MODE_NAME: {
-        'ENGINE': 'haystack.backends.solr_backend.SolrEngine',
+        'ENGINE': 'metashare.haystack_backends.MetashareSolrEngine',
         'URL': TESTING_SOLR_URL,
         'SILENTLY_FAIL': False
     },
@@ -249,8 +291,42 @@ MAX_VIEW_INTERVAL = 60 * 5
 # used in recommendations
 MAX_DOWNLOAD_INTERVAL = 60 * 10
 
-# list of synchronization protocols supported by this node
+# default number of worker threads per node which concurrently download full
+# metadata records during synchronization; can be overridden per node with the
+# 'FETCH_WORKERS' key in the CORE_NODES and PROXIED_NODES settings
+SYNC_FETCH_WORKERS = 4
+
+# number of full metadata records which a worker thread requests at once from
+# nodes that support batch requests
+SYNC_METADATA_BATCH_SIZE = 50
+
+# list of synchronization protocols supported by this node, in the order of
+# preference; protocol '1.1' adds delta inventories based on change cursors,
+# protocol '1.2' additionally adds batch requests for full metadata records
 SYNC_PROTOCOLS = (
+    '1.2',
+    '1.1',
     '1.0',
 )
 
+# maximum age in seconds of the tombstones in the inventory change log which
+# is used for delta inventories; change cursors expire after half of that time
+# so that the synchronizing nodes fall back to a full inventory
+SYNC_CHANGE_LOG_MAX_AGE = 60 * 60 * 24 * 30
+
+# maximum duration in seconds of the transactions which record inventory
+# changes (e.g., bulk imports); the changes which have been recorded within
+# that time before a change cursor has been issued are sent again with the
+# next delta inventory, as they may have been committed after the cursor
+SYNC_CHANGE_LOG_SAFETY_WINDOW = 60 * 60
+
+
+# offloading of file downloads to the web server; set to 'X-Sendfile' for
+# lighttpd (requires "allow-x-send-file" => "enable" in the fastcgi.server
+# configuration) or to 'X-Accel-Redirect' for nginx; if None, files are
+# streamed by Django
+SENDFILE_HEADER = None
+
+# internal URL location which the web server maps to STORAGE_PATH; only used
+# with SENDFILE_HEADER = 'X-Accel-Redirect'
+SENDFILE_ACCEL_LOCATION = '/protected-storage/'
@@ -0,0 +1,30 @@
+"""
+Management utility to add the indexes of the statistics tables to databases
+which have been created with an older version.
+"""
+from django.core.management.base import BaseCommand
+from metashare.stats.model_utils import add_lr_stats_unique_index, \
+    add_stats_field_indexes
+
+
+class Command(BaseCommand):
+
+    help = 'Adds the indexes of the statistics tables which are missing in ' \
+      + 'databases created with an older version; run it before the node is ' \
+      + 'started with the current version'
+
+    def handle(self, *args, **options):
+        """
+        Add the missing statistics indexes.
+        """
+        _removed = add_lr_stats_unique_index()
+        _added = add_stats_field_indexes()
+        if int(options.get('verbosity', 1)) >= 1:
+            if _removed is None:
+                print 'The unique index of the resource statistics exists.'
+            else:
+                print 'Added the unique index of the resource statistics ' \
+                    'after removing {0} duplicate entries.'.format(_removed)
+            for _model_name, _field_name in _added:
+                print 'Added the index of {0}.{1}.'.format(_model_name,
+                                                           _field_name)
@@ -0,0 +1,23 @@
+"""
+Management utility to prune the raw query statistics.
+"""
+from django.core.management.base import BaseCommand
+from metashare.stats.model_utils import prune_query_stats
+from metashare.utils import Lock
+
+
+class Command(BaseCommand):
+    
+    help = 'Removes the rolled up query statistics which are older than ' \
+      + 'QUERY_STATS_RETENTION days'
+    
+    def handle(self, *args, **options):
+        """
+        Prune the query statistics.
+        """
+        lock = Lock('stats_rollup')
+        try:
+            lock.acquire()
+            prune_query_stats()
+        finally:
+            lock.release()
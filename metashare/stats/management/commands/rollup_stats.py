@@ -0,0 +1,39 @@
+"""
+Management utility to roll up the raw statistics into daily and monthly
+aggregates.
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from metashare.stats.model_utils import rollup_stats, clear_stats_rollups
+from metashare.utils import Lock
+
+
+class Command(BaseCommand):
+
+    option_list = BaseCommand.option_list + (
+        make_option('-r', '--rebuild', action='store_true', dest='rebuild',
+                    default=False, help='remove all rollups and backfill ' \
+                    'them from the raw statistics'),
+    )
+
+    help = 'Rolls up the statistics of all past days which have not been ' \
+      + 'rolled up, yet'
+
+    def handle(self, *args, **options):
+        """
+        Roll up the statistics.
+        """
+        # make sure that the statistics are never rolled up by two concurrent
+        # jobs
+        lock = Lock('stats_rollup')
+        try:
+            lock.acquire()
+            if options.get('rebuild'):
+                clear_stats_rollups()
+            _days = rollup_stats()
+            if int(options.get('verbosity', 1)) >= 2:
+                print 'Rolled up the statistics of {0} days.'.format(_days)
+        finally:
+            lock.release()
@@ -1,17 +1,30 @@
+import atexit
 import logging
 import json
-import itertools 
 import threading
 import re
-from django.db.models import Count, Sum
+from collections import Counter
+from datetime import date, datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from django.core.management.color import no_style
+from django.db import connection, transaction, IntegrityError, \
+    DatabaseError, close_connection
+from django.db.models import Count, Sum, Min, Max, F
 from django.contrib.auth.models import User
 from math import trunc
-from metashare.stats.models import LRStats, QueryStats, UsageStats
+from metashare.stats.models import LRStats, QueryStats, UsageStats, \
+    SearchCacheStats, LRStatsRollup, QueryStatsRollup, StatsRollupStatus, \
+    DAY_PERIOD, MONTH_PERIOD
 from metashare.stats.geoip import getcountry_code, getcountry_name
 from metashare.storage.models import PUBLISHED
+from metashare import settings
 from metashare.settings import LOG_HANDLER
+from metashare.utils import LRUCache, bulk_insert
 
 USAGETHREADNAME = "usagethread"
+# the number of resources or entries which are handled at once when updating
+# the usage statistics
+USAGE_BATCH_SIZE = 100
 BOT_AGENT_RE = re.compile(r".*(bot|spider|spyder|crawler|archiver|seek|\
     scooter|wget|misesajour|slurp|agent|gazz|onetszukaj|perl|web|lab|\
     scrubby|asterias|ip3000|knowledge|rambler|search|link|zmeu|hat|appie|\
@@ -35,6 +48,127 @@ LOGGER = logging.getLogger(__name__)
 LOGGER.addHandler(LOG_HANDLER)
 
 
+# the (user id, resource id, session id, action) keys of the most recently
+# recorded actions of this process
+_RECORDED_LR_ACTIONS = LRUCache(10000)
+
+
+def _insert_lr_stats(userid, lrid, sessid, action, ignored, geoinfo):
+    """
+    Inserts a new LRStats entry for the given action of the given session on
+    the given resource.
+
+    If there is such an entry already (e.g., created by a concurrent request),
+    it is updated instead. Returns whether a new entry was inserted or not.
+    """
+    _savepoint = transaction.savepoint()
+    try:
+        LRStats(userid=userid, lrid=lrid, sessid=sessid, action=action,
+                ignored=ignored, geoinfo=geoinfo).save(force_insert=True)
+        transaction.savepoint_commit(_savepoint)
+        return True
+    except IntegrityError:
+        transaction.savepoint_rollback(_savepoint)
+    LRStats.objects.filter(userid=userid, lrid=lrid, sessid=sessid,
+                           action=action).update(ignored=ignored)
+    return False
+
+
+def _has_lr_stats_unique_index():
+    """
+    Returns whether the database enforces that each action of a session on a
+    resource is only recorded once.
+
+    Databases which have been created before the uniqueness of the LRStats
+    entries was declared lack the corresponding unique index.
+    """
+    # the probe entries have an empty resource id, which real entries never do
+    _probe = {'userid': '', 'lrid': '', 'sessid': '', 'action': ''}
+    _savepoint = transaction.savepoint()
+    try:
+        LRStats(**_probe).save(force_insert=True)
+        LRStats(**_probe).save(force_insert=True)
+        return False
+    except IntegrityError:
+        return True
+    finally:
+        transaction.savepoint_rollback(_savepoint)
+        LRStats.objects.filter(**_probe).delete()
+
+
+def add_lr_stats_unique_index():
+    """
+    Adds the unique index on the user id, resource id, session id and action
+    of the LRStats entries to databases which lack it.
+
+    Duplicate entries are merged into the most recent one of them before. As
+    recording a resource action relies on the index, this should be done
+    before the node is started with the current version. Returns the number of
+    removed duplicate entries or None if the index exists already.
+    """
+    _fields = LRStats._meta.unique_together[0]
+    with transaction.commit_on_success():
+        if _has_lr_stats_unique_index():
+            return None
+        _removed = 0
+        for _key in LRStats.objects.values(*_fields) \
+                .annotate(entries=Count('id')).filter(entries__gt=1) \
+                .order_by():
+            del _key['entries']
+            _entries = list(LRStats.objects.filter(**_key) \
+                            .order_by('-lasttime'))
+            _entries[0].count = sum(_entry.count for _entry in _entries)
+            _entries[0].save()
+            LRStats.objects.filter(
+                id__in=[_entry.id for _entry in _entries[1:]]).delete()
+            _removed += len(_entries) - 1
+        _qn = connection.ops.quote_name
+        connection.cursor().execute('CREATE UNIQUE INDEX {0} ON {1} ({2})'
+            .format(_qn('{0}_unique_action'.format(LRStats._meta.db_table)),
+                    _qn(LRStats._meta.db_table),
+                    ', '.join(_qn(LRStats._meta.get_field(_field).column)
+                              for _field in _fields)))
+    LOGGER.info('Added the unique index of the resource statistics after ' \
+                'removing {0} duplicate entries.'.format(_removed))
+    return _removed
+
+
+def add_stats_field_indexes():
+    """
+    Adds the indexes of the indexed fields of the LRStats and QueryStats
+    entries to databases which lack them, e.g., as they have been created
+    before the fields were indexed.
+
+    Returns the (model name, field name) pairs of the added indexes.
+    """
+    _added = []
+    with transaction.commit_on_success():
+        for _model in (LRStats, QueryStats):
+            for _field in _model._meta.local_fields:
+                for _sql in connection.creation.sql_indexes_for_field(_model,
+                        _field, no_style()):
+                    _savepoint = transaction.savepoint()
+                    try:
+                        connection.cursor().execute(_sql)
+                        transaction.savepoint_commit(_savepoint)
+                        _added.append((_model.__name__, _field.name))
+                    except DatabaseError:
+                        # an index with the same name exists already
+                        transaction.savepoint_rollback(_savepoint)
+    if _added:
+        LOGGER.info('Added the statistics indexes {0}.'.format(_added))
+    return _added
+
+
+def delete_lr_stats(lrids):
+    """
+    Removes all statistics of the resources with the given identifiers.
+    """
+    UsageStats.objects.filter(lrid__in=lrids).delete()
+    LRStats.objects.filter(lrid__in=lrids).delete()
+    LRStatsRollup.objects.filter(lrid__in=lrids).delete()
+
+
 def saveLRStats(resource, action, request=None): 
     """
     Saves the actions on a resource.
@@ -54,51 +188,207 @@ def saveLRStats(resource, action, request=None):
     if action == INGEST_STAT:
         ignored = True
         LRStats.objects.filter(lrid=lrid).update(ignored=ignored)
+        LRStatsRollup.objects.filter(lrid=lrid).update(ignored=ignored)
         UsageStats.objects.filter(lrid=lrid).delete()
     if action == DELETE_STAT:
-        UsageStats.objects.filter(lrid=lrid).delete()
-        LRStats.objects.filter(lrid=lrid).delete()
+        delete_lr_stats([lrid])
         return result
     if (resource.storage_object.publication_status != PUBLISHED):
         return result
         
     userid = _get_userid(request)
     sessid = _get_sessionid(request)
-    lrset = LRStats.objects.filter(userid=userid, lrid=lrid, sessid=sessid, action=action)
-    if (lrset.count() > 0):
-        record = lrset[0]
-        record.ignored = ignored
-        record.save(force_update=True)
-        #LOGGER.debug('UPDATESTATS: Saved LR {0}, {1} action={2} ({3}).'.format(lrid, sessid, action, record.lasttime))
-    else:       
-        record = LRStats()
-        record.userid = userid
-        record.lrid = lrid
-        record.action = action
-        record.sessid = sessid    
-        record.geoinfo = getcountry_code(_get_ipaddress(request))
-        record.ignored = ignored
-        record.save(force_insert=True)
-        #LOGGER.debug('SAVESTATS: Saved LR {0}, {1} action={2}.'.format(lrid, sessid, action))
-        result = True
+    key = (userid, lrid, sessid, action)
+    # if this process has recorded the action of the session before, the entry
+    # most probably still exists and only needs to be updated
+    if key not in _RECORDED_LR_ACTIONS or not LRStats.objects.filter(
+            userid=userid, lrid=lrid, sessid=sessid, action=action) \
+            .update(ignored=ignored):
+        result = _insert_lr_stats(userid, lrid, sessid, action, ignored,
+                                  getcountry_code(_get_ipaddress(request)))
+        _RECORDED_LR_ACTIONS[key] = True
     if action == UPDATE_STAT:
         if (resource.storage_object.published):
-            UsageStats.objects.filter(lrid=lrid).delete()
             update_usage_stats(lrid, resource.export_to_elementtree())
             #LOGGER.debug('STATS: Updating usage statistics: resource {0} updated'.format(lrid))
     return result
 
+class StatsBuffer(object):
+    """
+    An in-process buffer for query statistics and search results page cache
+    statistics.
+
+    The buffered statistics are written to the database in bulk by a
+    background thread, either STATS_BUFFER_FLUSH_INTERVAL seconds after the
+    first buffered event or as soon as STATS_BUFFER_SIZE events have been
+    buffered. With a STATS_BUFFER_SIZE of 0, the statistics are written
+    immediately.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # serializes the writing of the buffered statistics
+        self._flush_lock = threading.Lock()
+        # tuples of user id, IP address, query, facets, found, exectime and
+        # time of the buffered queries
+        self._queries = []
+        # maps days to lists of the numbers of hits and misses and the sums of
+        # their times
+        self._cache_stats = {}
+        self._size = 0
+        self._timer = None
+
+    def add_query(self, userid, ipaddress, query, facets, found, exectime):
+        """
+        Buffers the statistics of a single search query.
+        """
+        with self._lock:
+            self._queries.append((userid, ipaddress, query, facets, found,
+                                  exectime, datetime.now()))
+            self._added()
+        self._flush_if_unbuffered()
+
+    def add_search_cache_event(self, hit, exectime):
+        """
+        Buffers a search results page which has been served from the cache (if
+        `hit` is True) or which has been created from scratch.
+        """
+        with self._lock:
+            _counts = self._cache_stats.setdefault(date.today(), [0, 0, 0, 0])
+            if hit:
+                _counts[0] += 1
+                _counts[2] += exectime
+            else:
+                _counts[1] += 1
+                _counts[3] += exectime
+            self._added()
+        self._flush_if_unbuffered()
+
+    def _added(self):
+        """
+        Schedules the writing of the buffered statistics after an event has
+        been added; must be called while holding the buffer lock.
+        """
+        self._size += 1
+        if settings.STATS_BUFFER_SIZE <= 0:
+            return
+        if self._size >= settings.STATS_BUFFER_SIZE:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(0, self._flush_in_background)
+        elif self._timer is None:
+            self._timer = threading.Timer(settings.STATS_BUFFER_FLUSH_INTERVAL,
+                                          self._flush_in_background)
+        else:
+            return
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_if_unbuffered(self):
+        if settings.STATS_BUFFER_SIZE <= 0:
+            self.flush()
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            # the database connection of the timer thread is not reused
+            close_connection()
+
+    def flush(self):
+        """
+        Writes all buffered statistics to the database.
+        """
+        with self._flush_lock:
+            with self._lock:
+                _queries, self._queries = self._queries, []
+                _cache_stats, self._cache_stats = self._cache_stats, {}
+                self._size = 0
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not _queries and not _cache_stats:
+                return
+            try:
+                _insert_query_stats(_queries)
+                for _day, _counts in _cache_stats.iteritems():
+                    _update_search_cache_stats(_day, *_counts)
+                transaction.commit_unless_managed()
+            except Exception:
+                LOGGER.error('Failed to write {0} buffered query statistics.' \
+                             .format(len(_queries)), exc_info=True)
+                transaction.rollback_unless_managed()
+
+STATS_BUFFER = StatsBuffer()
+# write the remaining buffered statistics on shutdown
+atexit.register(STATS_BUFFER.flush)
+
+
+def _insert_query_stats(queries):
+    """
+    Inserts QueryStats entries for the given tuples of user id, IP address,
+    query, facets, found, exectime and time with a single statement.
+    """
+    # the geo information is looked up here, outside of the search requests
+    bulk_insert(QueryStats, ('userid', 'geoinfo', 'query', 'facets', 'found',
+                             'exectime', 'lasttime'),
+        [(userid, getcountry_code(ipaddress), query, facets, found, exectime,
+          lasttime) for userid, ipaddress, query, facets, found, exectime,
+          lasttime in queries])
+
+def _update_search_cache_stats(day, hits, misses, hit_time, miss_time):
+    """
+    Adds the given numbers of hits and misses and their times to the search
+    results page cache statistics of the given day.
+    """
+    _values = {'hits': F('hits') + hits, 'misses': F('misses') + misses,
+               'hit_time': F('hit_time') + hit_time,
+               'miss_time': F('miss_time') + miss_time}
+    if SearchCacheStats.objects.filter(date=day).update(**_values):
+        return
+    # a concurrent process may have created the statistics of the day already
+    _savepoint = transaction.savepoint()
+    try:
+        SearchCacheStats.objects.create(date=day)
+        transaction.savepoint_commit(_savepoint)
+    except IntegrityError:
+        transaction.savepoint_rollback(_savepoint)
+    SearchCacheStats.objects.filter(date=day).update(**_values)
+
 def saveQueryStats(query, facets, found, exectime=0, request=None): 
-    stat = QueryStats()
-    stat.userid = _get_userid(request)
-    stat.geoinfo = getcountry_code(_get_ipaddress(request))    
-    stat.query = query
-    stat.facets = facets
-    stat.found = found
-    stat.exectime = exectime    
-    stat.save()
+    STATS_BUFFER.add_query(_get_userid(request), _get_ipaddress(request),
+                           query, facets, found, exectime)
     LOGGER.debug(u'saveQueryStats q={0}.'.format(query))
 
+def saveSearchCacheStats(hit, exectime):
+    """
+    Counts a search results page which has been served from the cache (if
+    `hit` is True) or which has been created from scratch, together with the
+    time in milliseconds which has been required for it.
+    """
+    STATS_BUFFER.add_search_cache_event(hit, exectime)
+
+def getSearchCacheStats(day):
+    """
+    Returns a dict with the numbers of hits and misses of the search results
+    page cache on the given day, the hit ratio, the average times in
+    milliseconds for creating a search results page with and without the cache
+    and the total time in milliseconds which has been saved by the cache.
+    """
+    data = {'hits': 0, 'misses': 0, 'hit_ratio': 0.0, 'hit_time_avg': 0.0,
+            'miss_time_avg': 0.0, 'saved_time': 0}
+    for stats in SearchCacheStats.objects.filter(date=day):
+        data['hits'] = stats.hits
+        data['misses'] = stats.misses
+        if stats.hits + stats.misses:
+            data['hit_ratio'] = float(stats.hits) / (stats.hits + stats.misses)
+        if stats.hits:
+            data['hit_time_avg'] = float(stats.hit_time) / stats.hits
+        if stats.misses:
+            data['miss_time_avg'] = float(stats.miss_time) / stats.misses
+            data['saved_time'] = int(max(0, stats.hits \
+                * (data['miss_time_avg'] - data['hit_time_avg'])))
+    return data
+
 def getLRStats(lrid):
     data = ""
     action_list = LRStats.objects.values('lrid', 'action').filter(lrid=lrid, ignored=False).annotate(Count('action'), Sum('count')).order_by('-action')
@@ -152,27 +442,231 @@ def getUserStats(lrid):
 
     
 ## get the top data (limited by a number) 
+def get_rollup_watermark():
+    """
+    Returns the day up to which (exclusively) the LRStats and QueryStats
+    entries have been rolled up or None if they have never been rolled up.
+    """
+    _days = StatsRollupStatus.objects.values_list('rolled_up_until', flat=True)
+    return _days[0] if _days else None
+
+def _rollup_day(day):
+    """
+    (Re-)creates the daily rollups of the LRStats and QueryStats entries of the
+    given day.
+    """
+    _raw_filter = {'lasttime__gte': day,
+                   'lasttime__lt': day + timedelta(days=1)}
+    LRStatsRollup.objects.filter(period=DAY_PERIOD, day=day).delete()
+    bulk_insert(LRStatsRollup, ('period', 'day', 'lrid', 'action', 'geoinfo',
+                                'ignored', 'entries', 'count'),
+        [(DAY_PERIOD, day, _row['lrid'], _row['action'], _row['geoinfo'],
+          _row['ignored'], _row['id__count'], _row['count__sum'])
+         for _row in LRStats.objects.filter(**_raw_filter)
+            .values('lrid', 'action', 'geoinfo', 'ignored')
+            .annotate(Count('id'), Sum('count')).order_by()])
+    QueryStatsRollup.objects.filter(period=DAY_PERIOD, day=day).delete()
+    bulk_insert(QueryStatsRollup, ('period', 'day', 'query', 'facets',
+                                   'geoinfo', 'entries'),
+        [(DAY_PERIOD, day, _row['query'], _row['facets'], _row['geoinfo'],
+          _row['id__count'])
+         for _row in QueryStats.objects.filter(**_raw_filter)
+            .values('query', 'facets', 'geoinfo').annotate(Count('id'))
+            .order_by()])
+
+def _rollup_month(month):
+    """
+    (Re-)creates the monthly rollups of the month starting on the given day
+    from the daily rollups of the month.
+    """
+    _daily_filter = {'period': DAY_PERIOD, 'day__gte': month,
+                     'day__lt': month + relativedelta(months=1)}
+    LRStatsRollup.objects.filter(period=MONTH_PERIOD, day=month).delete()
+    bulk_insert(LRStatsRollup, ('period', 'day', 'lrid', 'action', 'geoinfo',
+                                'ignored', 'entries', 'count'),
+        [(MONTH_PERIOD, month, _row['lrid'], _row['action'], _row['geoinfo'],
+          _row['ignored'], _row['entries__sum'], _row['count__sum'])
+         for _row in LRStatsRollup.objects.filter(**_daily_filter)
+            .values('lrid', 'action', 'geoinfo', 'ignored')
+            .annotate(Sum('entries'), Sum('count')).order_by()])
+    QueryStatsRollup.objects.filter(period=MONTH_PERIOD, day=month).delete()
+    bulk_insert(QueryStatsRollup, ('period', 'day', 'query', 'facets',
+                                   'geoinfo', 'entries'),
+        [(MONTH_PERIOD, month, _row['query'], _row['facets'], _row['geoinfo'],
+          _row['entries__sum'])
+         for _row in QueryStatsRollup.objects.filter(**_daily_filter)
+            .values('query', 'facets', 'geoinfo').annotate(Sum('entries'))
+            .order_by()])
+
+def rollup_stats(until=None):
+    """
+    Rolls up the LRStats and QueryStats entries of all days before the given
+    day (defaults to today) which have not been rolled up, yet, into daily and
+    monthly aggregates.
+
+    Days which have been rolled up before are rolled up again if entries with
+    a timestamp on these days have been added since the last rollup.
+
+    Returns the number of rolled up days.
+    """
+    _until = until or date.today()
+    # entries which are added from now on are checked on the next rollup
+    _lr_stats_id, _query_stats_id = [
+        _stats.objects.aggregate(Max('id'))['id__max'] or 0
+        for _stats in (LRStats, QueryStats)]
+    _statuses = list(StatsRollupStatus.objects.all()[:1])
+    _days = set()
+    if not _statuses:
+        # backfill all days with raw statistics
+        _first_times = [_stats.objects.aggregate(Min('lasttime'))
+                        ['lasttime__min'] for _stats in (LRStats, QueryStats)]
+        _first_days = [_time.date() for _time in _first_times if _time]
+        _watermark = min(_first_days) if _first_days else _until
+    else:
+        _watermark = _statuses[0].rolled_up_until
+        for _stats, _id in ((LRStats, _statuses[0].lr_stats_id),
+                            (QueryStats, _statuses[0].query_stats_id)):
+            _days.update(_day.date() for _day in _stats.objects \
+                .filter(id__gt=_id, lasttime__lt=_watermark) \
+                .dates('lasttime', 'day'))
+    _day = _watermark
+    while _day < _until:
+        _days.add(_day)
+        _day += timedelta(days=1)
+    if not _days:
+        return 0
+    _months = set()
+    for _day in sorted(_days):
+        with transaction.commit_on_success():
+            _rollup_day(_day)
+        _months.add(_day.replace(day=1))
+    with transaction.commit_on_success():
+        for _month in sorted(_months):
+            _rollup_month(_month)
+        _status = {'rolled_up_until': max(_watermark, _until),
+                   'lr_stats_id': _lr_stats_id,
+                   'query_stats_id': _query_stats_id}
+        if not StatsRollupStatus.objects.update(**_status):
+            StatsRollupStatus.objects.create(**_status)
+    LOGGER.info('Rolled up the statistics of {0} days.'.format(len(_days)))
+    return len(_days)
+
+def clear_stats_rollups():
+    """
+    Removes all rolled up statistics, so that they are backfilled from the
+    LRStats and QueryStats entries on the next rollup.
+    """
+    with transaction.commit_on_success():
+        StatsRollupStatus.objects.all().delete()
+        LRStatsRollup.objects.all().delete()
+        QueryStatsRollup.objects.all().delete()
+
+def prune_query_stats():
+    """
+    Removes all QueryStats entries which are older than QUERY_STATS_RETENTION
+    days and which have already been rolled up.
+
+    Returns the number of removed entries.
+    """
+    _watermark = get_rollup_watermark()
+    if _watermark is None:
+        return 0
+    _expiration_day = min(_watermark,
+        date.today() - timedelta(days=settings.QUERY_STATS_RETENTION))
+    # the entries are removed with a single statement instead of one statement
+    # per entry as in `QuerySet.delete()`
+    _cursor = connection.cursor()
+    _cursor.execute('DELETE FROM {0} WHERE {1} < %s'.format(
+            connection.ops.quote_name(QueryStats._meta.db_table),
+            connection.ops.quote_name(
+                QueryStats._meta.get_field('lasttime').column)),
+        [connection.ops.value_to_db_datetime(
+            datetime.combine(_expiration_day, datetime.min.time()))])
+    transaction.commit_unless_managed()
+    LOGGER.info('Pruned {0} query statistics entries.'.format(
+        _cursor.rowcount))
+    return _cursor.rowcount
+
+def _sum_up_stats(raw_model, rollup_model, fields, sums, order_by,
+                  since=None, filters=None, excludes=None, limit=None,
+                  offset=0):
+    """
+    Returns the given sums of the entries of the given raw statistics model
+    since the given day, grouped by the given fields and sorted in descending
+    order of the given sum, as a list of dicts like `values().annotate()`.
+    If a limit is given, at most this many rows starting at the given offset
+    are returned.
+
+    `sums` maps the names of the sums to pairs of the aggregate of the raw
+    statistics and the field of the rollup model which holds it. Wherever
+    possible the sums are computed from the rollups; only the entries which
+    have not been rolled up, yet, are aggregated from the raw statistics. The
+    partial sums are combined, sorted and limited by the database.
+    """
+    _names = sorted(sums)
+    _parts = []
+    def _add(queryset, aggregates):
+        queryset = queryset.values(*fields)
+        # the sums are annotated one by one, so that the columns of all parts
+        # are in the same order
+        for _name in _names:
+            queryset = queryset.annotate(**{_name: aggregates[_name]})
+        queryset = queryset.order_by()
+        _parts.append(queryset.query.get_compiler(queryset.db).as_sql())
+
+    _raw = raw_model.objects.filter(**(filters or {})) \
+        .exclude(**(excludes or {}))
+    if since:
+        _raw = _raw.filter(lasttime__gte=since)
+    _watermark = get_rollup_watermark()
+    if _watermark:
+        _rollups = rollup_model.objects.filter(**(filters or {})) \
+            .exclude(**(excludes or {}))
+        _rollup_sums = dict((_name, Sum(_rollup_field))
+                            for _name, (_, _rollup_field) in sums.items())
+        if since:
+            _add(_rollups.filter(period=DAY_PERIOD, day__gte=since,
+                day__lt=_watermark), _rollup_sums)
+        else:
+            # complete months are summed up from the monthly rollups
+            _month = _watermark.replace(day=1)
+            _add(_rollups.filter(period=MONTH_PERIOD, day__lt=_month),
+                 _rollup_sums)
+            _add(_rollups.filter(period=DAY_PERIOD, day__gte=_month,
+                day__lt=_watermark), _rollup_sums)
+        _raw = _raw.filter(lasttime__gte=_watermark)
+    _add(_raw, dict((_name, _raw_sum)
+                    for _name, (_raw_sum, _) in sums.items()))
+
+    _qn = connection.ops.quote_name
+    _fields = ', '.join(_qn(_field) for _field in fields)
+    _sql = 'SELECT {0}, {1} FROM ({2}) {3} GROUP BY {0} ' \
+        'ORDER BY SUM({4}) DESC, {0}'.format(_fields,
+            ', '.join('SUM({0})'.format(_qn(_name)) for _name in _names),
+            ' UNION ALL '.join(_part_sql for _part_sql, _ in _parts),
+            _qn('stats_parts'), _qn(order_by))
+    if limit is not None:
+        _sql += ' LIMIT {0} OFFSET {1}'.format(int(limit), int(offset))
+    _cursor = connection.cursor()
+    _cursor.execute(_sql, [_param for _, _part_params in _parts
+                           for _param in _part_params])
+    _result = []
+    for _row in _cursor.fetchall():
+        _result.append(dict(zip(fields, _row[:len(fields)])))
+        # some databases return the sums as decimals
+        _result[-1].update((_name, int(_sum or 0)) for _name, _sum
+                           in zip(_names, _row[len(fields):]))
+    return _result
+
 def getLRTop(action, limit, geoinfo=None, since=None, offset=0):
     action_list = []
     if (action and not action == ""):
+        filters = {'action': action, 'ignored': False}
         if (geoinfo != None and geoinfo != ''):
-            if (since):
-                action_list = LRStats.objects.values('lrid') \
-                    .filter(ignored=False, action=action, geoinfo=geoinfo, lasttime__gte=since) \
-                    .annotate(sum_count=Sum('count')).order_by('-sum_count')[offset:offset+limit]
-            else:
-                action_list = LRStats.objects.values('lrid') \
-                    .filter(ignored=False, action=action, geoinfo=geoinfo) \
-                    .annotate(sum_count=Sum('count')).order_by('-sum_count')[offset:offset+limit]
-        else:
-            if (since):
-                action_list = LRStats.objects.values('lrid') \
-                    .filter(ignored=False, action=action, lasttime__gte=since) \
-                    .annotate(sum_count=Sum('count')).order_by('-sum_count')[offset:offset+limit]
-            else:
-                action_list = LRStats.objects.values('lrid') \
-                    .filter(ignored=False, action=action) \
-                    .annotate(sum_count=Sum('count')).order_by('-sum_count')[offset:offset+limit]
+            filters['geoinfo'] = geoinfo
+        action_list = _sum_up_stats(LRStats, LRStatsRollup, ('lrid',),
+            {'sum_count': (Sum('count'), 'count')}, 'sum_count', since,
+            filters, limit=limit, offset=offset)
     return action_list
 
 def getLRLast(action, limit, geoinfo=None, offset=0):
@@ -193,35 +687,15 @@ def getLRLast(action, limit, geoinfo=None, offset=0):
     return action_list
 
 def getTopQueries(limit, geoinfo=None, since=None, offset=0):
+    filters = {}
     if (geoinfo != None and geoinfo != ''):
-        if (since):
-            topqueries = QueryStats.objects.values('query', 'facets') \
-                .exclude(query__startswith="mfs") \
-                .filter(lasttime__gte=since, geoinfo=geoinfo) \
-                .annotate(query_count=Count('query'),
-                          facets_count=Count('facets')) \
-                .order_by('-query_count','-facets_count')[offset:offset+limit]
-        else:
-            topqueries = QueryStats.objects.values('query', 'facets') \
-                .exclude(query__startswith="mfs") \
-                .filter(geoinfo=geoinfo) \
-                .annotate(query_count=Count('query'), 
-                    facets_count=Count('facets')) \
-                .order_by('-query_count','-facets_count')[offset:offset+limit] 
-    else:
-        if (since):
-            topqueries = QueryStats.objects.values('query', 'facets') \
-                .exclude(query__startswith="mfs") \
-                .filter(lasttime__gte=since) \
-                .annotate(query_count=Count('query'), 
-                    facets_count=Count('facets')) \
-                .order_by('-query_count','-facets_count')[offset:offset+limit]
-        else:
-            topqueries = QueryStats.objects.values('query', 'facets') \
-                .exclude(query__startswith="mfs") \
-                .annotate(query_count=Count('query'), 
-                    facets_count=Count('facets')) \
-                .order_by('-query_count','-facets_count')[offset:offset+limit]
+        filters['geoinfo'] = geoinfo
+    topqueries = _sum_up_stats(QueryStats, QueryStatsRollup,
+        ('query', 'facets'), {'query_count': (Count('id'), 'entries')},
+        'query_count', since, filters, {'query__startswith': "mfs"},
+        limit, offset)
+    for item in topqueries:
+        item['facets_count'] = item['query_count']
     return topqueries
     
 def getLastQuery(limit, geoinfo=None, offset=0):
@@ -242,16 +716,29 @@ def statByDate(date):
         lasttime__day=date[6:8]).annotate(Count('action'))
     
 def statDays():
-    days = itertools.chain(LRStats.objects.dates('lasttime', 'day'), QueryStats.objects.dates('lasttime', 'day'))
-    return reduce(lambda x, y: x if y in x else x + [y], days, [])
+    days = set()
+    watermark = get_rollup_watermark()
+    raw_since = {}
+    if watermark:
+        for rollup_model in (LRStatsRollup, QueryStatsRollup):
+            days.update(rollup_model.objects.filter(period=DAY_PERIOD) \
+                .values_list('day', flat=True).distinct())
+        raw_since['lasttime__gte'] = watermark
+    for stats_model in (LRStats, QueryStats):
+        days.update(day.date() for day in stats_model.objects \
+            .filter(**raw_since).dates('lasttime', 'day'))
+    return sorted(days)
 
 def getCountryActions(action):
     result = []
     sets = None
     if (action != None):
-        sets = LRStats.objects.values('geoinfo').exclude(geoinfo=u'').filter(action=action).annotate(Count('action')).order_by('-action__count')
+        sets = _sum_up_stats(LRStats, LRStatsRollup, ('geoinfo',),
+            {'action__count': (Count('id'), 'entries')}, 'action__count',
+            filters={'action': action}, excludes={'geoinfo': u''})
     else:
-        sets = LRStats.objects.values('geoinfo').annotate(Count('action')).order_by('-action__count')
+        sets = _sum_up_stats(LRStats, LRStatsRollup, ('geoinfo',),
+            {'action__count': (Count('id'), 'entries')}, 'action__count')
     
     for key in sets:
         result.append([key['geoinfo'], key['action__count'], getcountry_name(key['geoinfo'])])
@@ -260,7 +747,9 @@ def getCountryActions(action):
         
 def getCountryQueries():
     result = []
-    sets = QueryStats.objects.values('geoinfo').exclude(geoinfo=u'').annotate(Count('geoinfo')).order_by('-geoinfo__count')
+    sets = _sum_up_stats(QueryStats, QueryStatsRollup, ('geoinfo',),
+        {'geoinfo__count': (Count('id'), 'entries')}, 'geoinfo__count',
+        excludes={'geoinfo': u''})
     for key in sets:
         result.append([key['geoinfo'], key['geoinfo__count'], getcountry_name(key['geoinfo'])])
     return result
@@ -305,49 +794,48 @@ def _get_ipaddress(request):
     return ''
 
 
+def _count_usage(element_tree):
+    """
+    Returns a Counter of the (parent tag, element tag, text) triples of all
+    elements below the root of the given ElementTree.
+
+    The text is only considered for leaf elements and is empty otherwise.
+    """
+    usage = Counter()
+    for parent in element_tree.iter():
+        for child in parent:
+            if len(child):
+                usage[(parent.tag, child.tag, u'')] += 1
+            else:
+                usage[(parent.tag, child.tag, child.text or u'')] += 1
+    return usage
+
 def update_usage_stats(lrid, element_tree):
-    element_children = element_tree.getchildren()
-    if len(element_children):
-        for child in element_children:
-            item = update_usage_stats(lrid, child)
-            if (item == None or item[0] == None):
-                lrset = UsageStats.objects.filter(lrid=lrid, elparent=element_tree.tag, elname=child.tag)
-                if (lrset.count() > 1):
-                    LOGGER.debug('ERROR! Saving usage stats in {}, {}'.format(element_tree.tag, child.tag))
-                    continue
-                if (lrset.count() > 0):
-                    record = lrset[0]
-                    record.count = record.count+1
-                    record.save(force_update=True)
-                else:
-                    record = UsageStats()
-                    record.lrid = lrid
-                    record.elname = child.tag
-                    record.elparent = element_tree.tag
-                    record.save(force_insert=True)
-                continue
-            if not isinstance(item[0], basestring):
-                elname = item[0][0].encode("utf-8") if item[0][0] != None else ""
-                text = item[0][1].encode("utf-8") if item[0][1] != None else ""
-                lrset = UsageStats.objects.filter(lrid=lrid, elparent=element_tree.tag, elname=elname, text=text)
-                if (lrset.count() > 1):
-                    LOGGER.debug('ERROR! Saving usage stats in {}, {}'.format(element_tree.tag, elname))
-                    continue
-                if (lrset.count() > 0):
-                    record = lrset[0]
-                    record.count = record.count+1
-                    record.save(force_update=True)
-                else:
-                    record = UsageStats()
-                    record.lrid = lrid
-                    record.elname = elname
-                    record.elparent = element_tree.tag
-                    record.text = text
-                    record.save(force_insert=True)
-        return None
-    # Otherwise, we return a tuple containg (key, value), i.e., (tag, text).
-    else:
-        return ((element_tree.tag, element_tree.text),)
+    """
+    Brings the usage statistics of the resource with the given storage object
+    identifier up-to-date with its exported ElementTree.
+
+    The usage of the elements is counted in memory; only the differences to
+    the stored usage statistics are written to the database.
+    """
+    usage = _count_usage(element_tree)
+    obsolete_ids = []
+    for record in UsageStats.objects.filter(lrid=lrid) \
+            .values('id', 'elparent', 'elname', 'text', 'count'):
+        key = (record['elparent'], record['elname'], record['text'])
+        count = usage.pop(key, None)
+        if count is None:
+            # either no longer used or a duplicate entry
+            obsolete_ids.append(record['id'])
+        elif count != record['count']:
+            UsageStats.objects.filter(id=record['id']).update(count=count)
+    for start in range(0, len(obsolete_ids), USAGE_BATCH_SIZE):
+        UsageStats.objects.filter(
+            id__in=obsolete_ids[start:start + USAGE_BATCH_SIZE]).delete()
+    bulk_insert(UsageStats, ('lrid', 'elparent', 'elname', 'text', 'count'),
+        [(lrid, elparent, elname, text, count)
+         for (elparent, elname, text), count in usage.iteritems()])
+    transaction.commit_unless_managed()
     
 
 def updateUsageStats(resources):   
@@ -385,25 +873,37 @@ class UsageThread(threading.Thread):
         return 0
         
     def run(self):       
+        # imported here to avoid a circular import
+        from metashare.repository.supermodel import prefetch_export_graph
         self.done = 0
-        usagelrids = UsageStats.objects.values_list('lrid', flat=True).distinct()
-        available_lrids = []
-        for resource in self.resources:
-            try:
-                # add statistics for new resources
-                if not resource.storage_object.identifier in usagelrids:
-                    update_usage_stats(resource.storage_object.identifier, resource.export_to_elementtree())
-                else: 
-                    available_lrids.append(resource.storage_object.identifier)
-            # pylint: disable-msg=W0703
-            except Exception, e:
-                LOGGER.debug('ERROR! Usage statistics updating failed on resource {}: {}'.format(resource.id, e))
-            self.done += 1
+        usagelrids = set(UsageStats.objects.values_list('lrid', flat=True)
+                         .distinct())
+        available_lrids = dict(self.resources
+            .values_list('storage_object__identifier', 'id'))
+        # add statistics for new resources; the object graphs of a batch of
+        # resources are loaded at once for their export
+        new_ids = [resource_id for lrid, resource_id
+                   in available_lrids.iteritems() if not lrid in usagelrids]
+        self.done = len(available_lrids) - len(new_ids)
+        for start in range(0, len(new_ids), USAGE_BATCH_SIZE):
+            resources = list(self.resources.filter(
+                id__in=new_ids[start:start + USAGE_BATCH_SIZE]))
+            prefetch_export_graph(resources)
+            for resource in resources:
+                try:
+                    update_usage_stats(resource.storage_object.identifier,
+                                       resource.export_to_elementtree())
+                # pylint: disable-msg=W0703
+                except Exception, e:
+                    LOGGER.debug('ERROR! Usage statistics updating failed on resource {}: {}'.format(resource.id, e))
+                self.done += 1
         #remove statistics for no longer available resources
-        if (len(usagelrids) != len(available_lrids)):
+        obsolete_lrids = [lrid for lrid in usagelrids
+                          if not lrid in available_lrids]
+        if obsolete_lrids:
             self.done = self.done - 1
-            for lrid in usagelrids:
-                if not lrid in available_lrids:
-                    UsageStats.objects.filter(lrid=str(lrid)).delete()
-                    LRStats.objects.filter(lrid=str(lrid)).delete()
-            
+            for start in range(0, len(obsolete_lrids), USAGE_BATCH_SIZE):
+                lrids = obsolete_lrids[start:start + USAGE_BATCH_SIZE]
+                UsageStats.objects.filter(lrid__in=lrids).delete()
+                LRStats.objects.filter(lrid__in=lrids).delete()
+                LRStatsRollup.objects.filter(lrid__in=lrids).delete()
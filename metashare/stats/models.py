@@ -1,19 +1,25 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Sum
+from django.db.models.signals import post_save, post_delete
 from datetime import datetime
         
 class LRStats(models.Model):
     # the storage object identifier of the language resource,
     # NOT the pk of the resource!
-    lrid = models.CharField(blank=False, max_length=64)    
+    lrid = models.CharField(blank=False, max_length=64, db_index=True)
 
     userid = models.CharField(blank=False, max_length=64)
     geoinfo = models.CharField(blank=True, max_length=2)
     sessid = models.CharField(blank=False, max_length=64)
-    lasttime = models.DateTimeField(blank=False)
+    lasttime = models.DateTimeField(blank=False, db_index=True)
     action = models.CharField(blank=False, max_length=1)
     count = models.IntegerField(blank=False, default=1)
     ignored = models.BooleanField(blank=False, default=False)
 
+    class Meta:
+        # each action of a session on a resource is only recorded once
+        unique_together = ('userid', 'lrid', 'sessid', 'action')
+
     def save(self, **kwargs):
         # automatically set the `lasttime` value if it is not given; we are not
         # using Django's `auto_now_add` on purpose, as we'd like to be able to
@@ -33,7 +39,7 @@ class QueryStats(models.Model):
     geoinfo = models.CharField(blank=True, max_length=2)
     query = models.TextField(blank=False)
     facets = models.TextField(blank=False)
-    lasttime = models.DateTimeField(blank=False)
+    lasttime = models.DateTimeField(blank=False, db_index=True)
     found = models.IntegerField(blank=False, default=0)
     exectime = models.IntegerField(blank=False, default=0)
 
@@ -61,3 +67,137 @@ class UsageStats(models.Model):
     
     #def __unicode__(self):
     #    return "U>> " +str(self.lrid) + "," + str(self.elname) + "," + str(self.elparent) + "," +str(self.text)+ "," + str(self.count)
+
+
+class SearchCacheStats(models.Model):
+    """
+    Holds the daily statistics of the search results page cache.
+    """
+    date = models.DateField(unique=True)
+    hits = models.IntegerField(blank=False, default=0)
+    misses = models.IntegerField(blank=False, default=0)
+    # the total time in milliseconds which has been required for creating the
+    # search results pages of all cache hits and misses, respectively
+    hit_time = models.IntegerField(blank=False, default=0)
+    miss_time = models.IntegerField(blank=False, default=0)
+
+
+# the periods of rolled up statistics
+DAY_PERIOD = 'd'
+MONTH_PERIOD = 'm'
+
+
+class LRStatsRollup(models.Model):
+    """
+    Holds the LRStats entries of a day or a month aggregated by resource,
+    action, country and ignored status.
+    """
+    period = models.CharField(blank=False, max_length=1)
+    # the first day of the period
+    day = models.DateField(db_index=True)
+    # the storage object identifier of the language resource,
+    # NOT the pk of the resource!
+    lrid = models.CharField(blank=False, max_length=64, db_index=True)
+    action = models.CharField(blank=False, max_length=1)
+    geoinfo = models.CharField(blank=True, max_length=2)
+    ignored = models.BooleanField(blank=False, default=False)
+    # the number of aggregated LRStats entries and the sum of their `count`s
+    entries = models.IntegerField(blank=False, default=0)
+    count = models.IntegerField(blank=False, default=0)
+
+
+class QueryStatsRollup(models.Model):
+    """
+    Holds the QueryStats entries of a day or a month aggregated by query,
+    facets and country.
+    """
+    period = models.CharField(blank=False, max_length=1)
+    # the first day of the period
+    day = models.DateField(db_index=True)
+    query = models.TextField(blank=False)
+    facets = models.TextField(blank=False)
+    geoinfo = models.CharField(blank=True, max_length=2)
+    # the number of aggregated QueryStats entries
+    entries = models.IntegerField(blank=False, default=0)
+
+
+class StatsRollupStatus(models.Model):
+    """
+    Holds the day up to which (exclusively) the LRStats and QueryStats entries
+    have been rolled up.
+
+    The highest ids of the LRStats and QueryStats entries at the time of the
+    last rollup are kept, too, so that entries which are added later with an
+    earlier timestamp (e.g., by a node migration) can be rolled up.
+    """
+    rolled_up_until = models.DateField()
+    lr_stats_id = models.IntegerField(default=0)
+    query_stats_id = models.IntegerField(default=0)
+
+
+class LRCounter(models.Model):
+    """
+    Holds the total count of an action on a language resource, i.e., the sum of
+    the `count`s of all LRStats entries of the resource and action, so that it
+    does not have to be aggregated whenever it is displayed or indexed.
+    """
+    # the storage object identifier of the language resource,
+    # NOT the pk of the resource!
+    lrid = models.CharField(blank=False, max_length=64)
+
+    action = models.CharField(blank=False, max_length=1)
+    count = models.IntegerField(blank=False, default=0)
+    # the count which has last been merged into the search index
+    indexed_count = models.IntegerField(blank=False, default=0)
+
+    class Meta:
+        unique_together = ('lrid', 'action')
+
+
+def get_lr_counter(lrid, action):
+    """
+    Returns the total count of the given action on the language resource with
+    the given storage object identifier.
+
+    Missing counters are initialized from the LRStats entries.
+    """
+    _counts = LRCounter.objects.filter(lrid=lrid, action=action) \
+        .values_list('count', flat=True)
+    if _counts:
+        return _counts[0]
+    _count = LRStats.objects.filter(lrid=lrid, action=action) \
+        .aggregate(Sum('count'))['count__sum'] or 0
+    # a concurrent request may have initialized the counter in the meantime
+    _savepoint = transaction.savepoint()
+    try:
+        LRCounter.objects.create(lrid=lrid, action=action, count=_count)
+        transaction.savepoint_commit(_savepoint)
+    except IntegrityError:
+        transaction.savepoint_rollback(_savepoint)
+    return _count
+
+
+def _lr_stats_saved(sender, instance, created, **kwargs):
+    """
+    Increments the counter of the resource and action of new LRStats entries.
+
+    The `count` of existing LRStats entries is never changed. Counters which do
+    not exist, yet, are initialized on their next access.
+    """
+    if created:
+        LRCounter.objects.filter(lrid=instance.lrid, action=instance.action) \
+            .update(count=F('count') + instance.count)
+
+
+def _lr_stats_deleted(sender, instance, **kwargs):
+    """
+    Removes the counter of the resource and action of deleted LRStats entries,
+    so that it is initialized again on its next access.
+    """
+    LRCounter.objects.filter(lrid=instance.lrid, action=instance.action) \
+        .delete()
+
+post_save.connect(_lr_stats_saved, sender=LRStats,
+    dispatch_uid="metashare.stats.models._lr_stats_saved")
+post_delete.connect(_lr_stats_deleted, sender=LRStats,
+    dispatch_uid="metashare.stats.models._lr_stats_deleted")
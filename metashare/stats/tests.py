@@ -2,16 +2,23 @@ import logging
 import urllib2
 from urllib import urlencode
 import uuid
+from datetime import date, datetime, timedelta
+from xml.etree.ElementTree import fromstring
 from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
 from django.test.client import Client
 from django.test.testcases import TestCase
-from metashare import test_utils
+from metashare import settings, test_utils
 from metashare.accounts.models import EditorGroup, EditorGroupManagers
 from metashare.repository.models import resourceInfoType_model
 from metashare.settings import ROOT_PATH, STORAGE_PATH, LOG_HANDLER, DJANGO_BASE, STATS_SERVER_URL, DJANGO_URL
-from metashare.storage.models import INGESTED
+from metashare.storage.models import INGESTED, PUBLISHED
 from metashare.stats.model_utils import update_usage_stats, UsageStats, saveLRStats, getLRLast, getLastQuery, \
-    UPDATE_STAT, VIEW_STAT, RETRIEVE_STAT, DOWNLOAD_STAT
+    saveSearchCacheStats, getSearchCacheStats, saveQueryStats, STATS_BUFFER, UPDATE_STAT, VIEW_STAT, \
+    RETRIEVE_STAT, DOWNLOAD_STAT, _insert_lr_stats, getLRTop, getTopQueries, getCountryActions, \
+    getCountryQueries, statDays, rollup_stats, prune_query_stats, add_lr_stats_unique_index, \
+    add_stats_field_indexes
+from metashare.stats.models import LRStats, LRCounter, QueryStats, LRStatsRollup, QueryStatsRollup, \
+    DAY_PERIOD, MONTH_PERIOD, get_lr_counter
 from metashare.stats.views import callServerStats
 
 # Setup logging support.
@@ -97,6 +104,156 @@ class StatsTest(TestCase):
                 saveLRStats(resource, action)
                 self.assertEqual(len(getLRLast(action, 10)), i+1)
  
+    def test_lr_stats_deduplication(self):
+        """
+        Verifies that each action of a session on a resource is only recorded
+        once.
+        """
+        resource = resourceInfoType_model.objects.all()[0]
+        resource.storage_object.publication_status = PUBLISHED
+        resource.storage_object.save()
+        _lrid = resource.storage_object.identifier
+        self.assertTrue(saveLRStats(resource, VIEW_STAT))
+        self.assertFalse(saveLRStats(resource, VIEW_STAT))
+        self.assertEqual(1, LRStats.objects.filter(lrid=_lrid,
+                                                   action=VIEW_STAT).count())
+        # an entry which has been recorded by another process is updated
+        self.assertFalse(_insert_lr_stats('', _lrid, '', VIEW_STAT, False, ''))
+        self.assertEqual(1, LRStats.objects.filter(lrid=_lrid,
+                                                   action=VIEW_STAT).count())
+        # an entry which has been removed in the meantime is recorded again
+        LRStats.objects.filter(lrid=_lrid).delete()
+        self.assertTrue(saveLRStats(resource, VIEW_STAT))
+        self.assertEqual(1, LRStats.objects.filter(lrid=_lrid,
+                                                   action=VIEW_STAT).count())
+        # the unique index is only added to databases which lack it
+        self.assertIsNone(add_lr_stats_unique_index())
+        self.assertEqual(1, LRStats.objects.count())
+        self.assertEqual([], add_stats_field_indexes())
+
+    def test_lr_counters(self):
+        """
+        Verifies that the action counters of resources are initialized from
+        and kept up-to-date with the LRStats entries.
+        """
+        _lrid = 'counter-test-lrid'
+        LRStats.objects.create(lrid=_lrid, userid='u1', sessid='s1',
+                               action=VIEW_STAT)
+        self.assertEqual(1, get_lr_counter(_lrid, VIEW_STAT))
+        self.assertEqual(0, get_lr_counter(_lrid, DOWNLOAD_STAT))
+        LRStats.objects.create(lrid=_lrid, userid='u2', sessid='s2',
+                               action=VIEW_STAT, count=2)
+        self.assertEqual(3, LRCounter.objects.get(lrid=_lrid,
+                                                  action=VIEW_STAT).count)
+        self.assertEqual(3, get_lr_counter(_lrid, VIEW_STAT))
+        LRStats.objects.filter(lrid=_lrid, userid='u1').delete()
+        self.assertEqual(2, get_lr_counter(_lrid, VIEW_STAT))
+        LRStats.objects.filter(lrid=_lrid).delete()
+        self.assertEqual(0, get_lr_counter(_lrid, VIEW_STAT))
+
+    def test_search_cache_stats(self):
+        """
+        Verifies the daily statistics of the search results page cache.
+        """
+        saveSearchCacheStats(False, 90)
+        saveSearchCacheStats(False, 110)
+        saveSearchCacheStats(True, 10)
+        _stats = getSearchCacheStats(date.today())
+        self.assertEqual(1, _stats['hits'])
+        self.assertEqual(2, _stats['misses'])
+        self.assertAlmostEqual(1.0 / 3, _stats['hit_ratio'])
+        self.assertEqual(100.0, _stats['miss_time_avg'])
+        self.assertEqual(90, _stats['saved_time'])
+
+    def test_stats_rollups(self):
+        """
+        Verifies that the dashboard statistics do not change when the raw
+        statistics are rolled up and the rolled up query statistics are pruned.
+        """
+        _today = date.today()
+        _now = datetime.now()
+        for _days, _lrid, _geoinfo in ((400, 'lr1', 'IT'), (40, 'lr1', 'DE'),
+                (40, 'lr2', 'DE'), (3, 'lr2', 'IT'), (3, 'lr2', 'IT'),
+                (0, 'lr2', '')):
+            LRStats.objects.create(lrid=_lrid, userid='', geoinfo=_geoinfo,
+                sessid=str(uuid.uuid4()), action=VIEW_STAT,
+                lasttime=_now - timedelta(days=_days))
+            QueryStats.objects.create(query=_lrid, facets='[]', userid='',
+                geoinfo=_geoinfo, lasttime=_now - timedelta(days=_days))
+        _week_ago = _today - timedelta(days=7)
+        def _get_dashboard_stats():
+            return (list(getLRTop(VIEW_STAT, 10)),
+                    list(getLRTop(VIEW_STAT, 10, 'DE')),
+                    list(getLRTop(VIEW_STAT, 10, since=_week_ago)),
+                    list(getTopQueries(10)),
+                    list(getTopQueries(10, since=_week_ago)),
+                    getCountryActions(VIEW_STAT), getCountryQueries(),
+                    statDays())
+        _raw_stats = _get_dashboard_stats()
+        self.assertEqual([{'lrid': 'lr2', 'sum_count': 4},
+                          {'lrid': 'lr1', 'sum_count': 2}], _raw_stats[0])
+        self.assertEqual([{'lrid': 'lr2', 'sum_count': 3}], _raw_stats[2])
+        self.assertEqual(4, len(_raw_stats[7]))
+        self.assertEqual([{'lrid': 'lr1', 'sum_count': 2}],
+                         list(getLRTop(VIEW_STAT, 1, offset=1)))
+
+        self.assertEqual(400, rollup_stats())
+        self.assertEqual(0, rollup_stats())
+        self.assertEqual(_raw_stats, _get_dashboard_stats())
+        self.assertEqual(2, LRStatsRollup.objects.filter(period=DAY_PERIOD,
+            lrid='lr2', day=_today - timedelta(days=40)).count() \
+            + LRStatsRollup.objects.filter(period=DAY_PERIOD,
+            lrid='lr2', day=_today - timedelta(days=3)).count())
+        self.assertTrue(QueryStatsRollup.objects.filter(period=MONTH_PERIOD,
+            query='lr1', day=(_today - timedelta(days=400)).replace(day=1)) \
+            .exists())
+
+        # the rolled up statistics survive the pruning of the raw statistics
+        _retention = settings.QUERY_STATS_RETENTION
+        settings.QUERY_STATS_RETENTION = 365
+        try:
+            self.assertEqual(1, prune_query_stats())
+        finally:
+            settings.QUERY_STATS_RETENTION = _retention
+        self.assertEqual(5, QueryStats.objects.count())
+        self.assertEqual(_raw_stats, _get_dashboard_stats())
+
+        # entries which are added with a timestamp before the last rollup are
+        # rolled up on the next rollup
+        for _lrid in ('lr1', 'lr1'):
+            LRStats.objects.create(lrid=_lrid, userid='', geoinfo='DE',
+                sessid=str(uuid.uuid4()), action=VIEW_STAT,
+                lasttime=_now - timedelta(days=40))
+        self.assertEqual(1, rollup_stats())
+        self.assertEqual(0, rollup_stats())
+        self.assertEqual([{'lrid': 'lr1', 'sum_count': 4},
+                          {'lrid': 'lr2', 'sum_count': 4}],
+                         list(getLRTop(VIEW_STAT, 10)))
+
+    def test_buffered_query_stats(self):
+        """
+        Verifies that buffered query statistics are only written to the
+        database when the buffer is flushed.
+        """
+        _buffer_size = settings.STATS_BUFFER_SIZE
+        _flush_interval = settings.STATS_BUFFER_FLUSH_INTERVAL
+        settings.STATS_BUFFER_SIZE = 100
+        settings.STATS_BUFFER_FLUSH_INTERVAL = 3600
+        try:
+            saveQueryStats('buffered query', '[]', 3, 20)
+            saveQueryStats('buffered query', '[]', 3, 10)
+            saveSearchCacheStats(True, 10)
+            self.assertEqual(0, QueryStats.objects.filter(
+                query='buffered query').count())
+            self.assertEqual(0, getSearchCacheStats(date.today())['hits'])
+            STATS_BUFFER.flush()
+            self.assertEqual(2, QueryStats.objects.filter(
+                query='buffered query', found=3).count())
+            self.assertEqual(1, getSearchCacheStats(date.today())['hits'])
+        finally:
+            settings.STATS_BUFFER_SIZE = _buffer_size
+            settings.STATS_BUFFER_FLUSH_INTERVAL = _flush_interval
+
     def test_visiting_stats(self):
         """
         Tries to load the visiting stats page of the META-SHARE website.
@@ -262,6 +419,29 @@ class StatsTest(TestCase):
         response = client.get('/{0}stats/top/'.format(DJANGO_BASE))
         self.assertContains(response, ">No data found<")
             
+    def test_usage_stats_update(self):
+        """
+        Verifies that the usage statistics of a resource are brought
+        up-to-date with its current metadata.
+        """
+        def _get_usage():
+            return sorted(UsageStats.objects.filter(lrid='usage-test-lrid')
+                .values_list('elparent', 'elname', 'text', 'count'))
+        update_usage_stats('usage-test-lrid', fromstring('<resourceInfo>'
+            '<identificationInfo><resourceName>A</resourceName>'
+            '<resourceName>A</resourceName><description>B</description>'
+            '</identificationInfo></resourceInfo>'))
+        self.assertEqual([(u'identificationInfo', u'description', u'B', 1),
+            (u'identificationInfo', u'resourceName', u'A', 2),
+            (u'resourceInfo', u'identificationInfo', u'', 1)], _get_usage())
+        update_usage_stats('usage-test-lrid', fromstring('<resourceInfo>'
+            '<identificationInfo><resourceName>A</resourceName>'
+            '<resourceName>C</resourceName></identificationInfo>'
+            '</resourceInfo>'))
+        self.assertEqual([(u'identificationInfo', u'resourceName', u'A', 1),
+            (u'identificationInfo', u'resourceName', u'C', 1),
+            (u'resourceInfo', u'identificationInfo', u'', 1)], _get_usage())
+
     def test_usage(self):
         # checking if there are the usage statistics
         client = Client()
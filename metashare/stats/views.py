@@ -15,12 +15,12 @@ from django.utils.importlib import import_module
 import django.utils.encoding
 from django.shortcuts import render_to_response     
 from django.db.models import Count, Max, Min, Avg
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.template import RequestContext
 from django.core.paginator import Paginator
 
 from json import JSONEncoder
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from dateutil.relativedelta import relativedelta
 import urllib, urllib2
 from threading import Timer
@@ -255,6 +255,8 @@ def _add_usage_meta(usage_fields, component_name, field, verbose_name, status, m
 
 def topstats (request):
     """ viewing statistics about the top LR and latest queries. """    
+    # include the not yet written query statistics
+    STATS_BUFFER.flush()
     topdata = []
     view = request.GET.get('view', 'topviewed')
     last = request.GET.get('last', '')
@@ -366,28 +368,38 @@ def getstats (request):
     currdate = request.GET.get('date', '')
     if (not currdate):
         currdate = date.today()
+    else:
+        try:
+            currdate = datetime.strptime(currdate, '%Y-%m-%d').date()
+        except ValueError:
+            return HttpResponseBadRequest('Invalid date.')
+    # a range filter instead of `lasttime__startswith` can use the index
+    dayfilter = {'lasttime__gte': currdate,
+                 'lasttime__lt': currdate + timedelta(days=1)}
     
     data['date'] = str(currdate)    
+    STATS_BUFFER.flush()
     data['metashare_version'] = METASHARE_VERSION  
-    data['user'] = LRStats.objects.filter(lasttime__startswith=currdate).values('sessid').annotate(Count('sessid')).count()
+    data['user'] = LRStats.objects.filter(**dayfilter).values('sessid').annotate(Count('sessid')).count()
     data['lrcount'] = resourceInfoType_model.objects.filter(
         storage_object__publication_status=PUBLISHED,
         storage_object__deleted=False).count()
     data['lrmastercount'] = StorageObject.objects.filter(copy_status=MASTER, publication_status=PUBLISHED, deleted=False).count()
-    data['lrupdate'] = LRStats.objects.filter(lasttime__startswith=currdate, action=UPDATE_STAT).count()
-    data['lrview'] = LRStats.objects.filter(lasttime__startswith=currdate, action=VIEW_STAT).count()
-    data['lrdown'] = LRStats.objects.filter(lasttime__startswith=currdate, action=DOWNLOAD_STAT).count()
-    data['queries'] = QueryStats.objects.filter(lasttime__startswith=currdate).count()
-    extimes = QueryStats.objects.filter(lasttime__startswith=currdate).aggregate(Avg('exectime'), Max('exectime'), Min('exectime'))
+    data['lrupdate'] = LRStats.objects.filter(action=UPDATE_STAT, **dayfilter).count()
+    data['lrview'] = LRStats.objects.filter(action=VIEW_STAT, **dayfilter).count()
+    data['lrdown'] = LRStats.objects.filter(action=DOWNLOAD_STAT, **dayfilter).count()
+    data['queries'] = QueryStats.objects.filter(**dayfilter).count()
+    extimes = QueryStats.objects.filter(**dayfilter).aggregate(Avg('exectime'), Max('exectime'), Min('exectime'))
     
     qltavg = 0
     if (extimes["exectime__avg"]):
-        qltavg = QueryStats.objects.filter(lasttime__startswith=currdate, exectime__lt = int(extimes["exectime__avg"])).count()
+        qltavg = QueryStats.objects.filter(exectime__lt = int(extimes["exectime__avg"]), **dayfilter).count()
     else:
         extimes["exectime__avg"] = 0
     
     data['qexec_time_avg'] = extimes["exectime__avg"]
     data['qlt_avg'] = qltavg
+    data['search_cache'] = getSearchCacheStats(currdate)
     
     ###get usage statistics
     if (stats_uuid == str(uuid.uuid3(uuid.NAMESPACE_DNS, STORAGE_PATH))):
@@ -18,6 +18,7 @@ import zipfile
 from zipfile import ZIP_DEFLATED
 from django.db.models.query_utils import Q
 import glob
+from metashare.utils import get_resource_locks, get_import_lock, acquired
 
 # Setup logging support.
 LOGGER = logging.getLogger(__name__)
@@ -206,6 +207,27 @@ class StorageObject(models.Model):
             self.update_storage()
         return self.digest_checksum
     
+    def get_digest_path(self):
+        """
+        Returns the local path to the digest zip-archive of this storage object
+        instance.
+        """
+        return '{0}/resource.zip'.format(self._storage_folder())
+    
+    def has_valid_digest(self):
+        """
+        Checks without any re-serialization if the current digest zip-archive
+        of this storage object instance exists and if its checksum matches the
+        content hash of the current metadata and global storage
+        serializations.
+        """
+        if self.digest_checksum is None or self.metadata is None \
+          or self.global_storage is None \
+          or not os.path.isfile(self.get_digest_path()):
+            return False
+        return self.digest_checksum == \
+          compute_digest_checksum(self.metadata, self.global_storage)
+    
     def __unicode__(self):
         """
         Returns the Unicode representation for this storage object instance.
@@ -257,12 +279,14 @@ class StorageObject(models.Model):
         # Call save() method from super class with all arguments.
         super(StorageObject, self).save(*args, **kwargs)
     
-    def update_storage(self, force_digest=False):
+    def update_storage(self, force_digest=False, resource=None):
         """
         Updates the metadata XML if required and serializes it and this storage
         object to the storage folder.
         
         force_digest (optional): if True, always recreate the digest zip-archive
+        resource (optional): the resource of this storage object, e.g., with a
+          prefetched object graph; loaded from the database if not given
         """
         # check if the storage folder for this storage object instance exists
         if self._storage_folder() and not exists(self._storage_folder()):
@@ -286,7 +310,7 @@ class StorageObject(models.Model):
         self.digest_last_checked = datetime.now()        
 
         # check metadata serialization
-        metadata_updated = self.check_metadata()
+        metadata_updated = self.check_metadata(resource)
         
         # check global storage object serialization
         global_updated = self.check_global_storage_object()
@@ -302,17 +326,20 @@ class StorageObject(models.Model):
         # at least self.digest_last_checked in the local storage object 
         # has changed
         if source_url_updated or metadata_updated or global_updated \
-                or local_updated:
+                or local_updated or force_digest:
             self.save()
 
 
-    def check_metadata(self):
+    def check_metadata(self, resource=None):
         """
         Checks if the metadata of the resource has changed with respect to the
         current metadata serialization. If yes, recreates the serialization,
         updates it in the storage folder and increases the revision (for master
         copies)
         
+        resource (optional): the resource of this storage object; loaded from
+          the database if not given
+        
         Returns a flag indicating if the serialization was updated. 
         """
         
@@ -322,9 +349,11 @@ class StorageObject(models.Model):
         # create current version of metadata XML
         from metashare.xml_utils import to_xml_string
         try:
+            if resource is None:
+                # pylint: disable-msg=E1101
+                resource = self.resourceinfotype_model_set.all()[0]
             _metadata = to_xml_string(
-              # pylint: disable-msg=E1101
-              self.resourceinfotype_model_set.all()[0].export_to_elementtree(),
+              resource.export_to_elementtree(),
               # use ASCII encoding to convert non-ASCII chars to entities
               encoding="ASCII")
         except:
@@ -391,7 +420,10 @@ class StorageObject(models.Model):
         """
 
         if self.copy_status in (MASTER, PROXY):
-            _zf_name = '{0}/resource.zip'.format(self._storage_folder())
+            # the archive is written to a temporary file first and then moved
+            # into place, so that digests which are currently streamed to other
+            # nodes are never truncated
+            _zf_name = '{0}.tmp'.format(self.get_digest_path())
             _zf = zipfile.ZipFile(_zf_name, mode='w', compression=ZIP_DEFLATED)
             try:
                 _zf.write(
@@ -402,6 +434,7 @@ class StorageObject(models.Model):
                   arcname='storage-global.json')
             finally:
                 _zf.close()
+            os.rename(_zf_name, self.get_digest_path())
             # update zip digest checksum
             self.digest_checksum = \
               compute_digest_checksum(self.metadata, self.global_storage)
@@ -594,14 +627,21 @@ def add_or_update_resource(storage_json, resource_xml_string, storage_digest,
 
     # Now the actual update_resource():
     storage_id = storage_json['identifier']
-    if storage_object_exists(storage_id):
-        if copy_status != MASTER and StorageObject.objects.get(identifier=storage_id).copy_status == MASTER:
-            raise IllegalAccessException("Attempt to overwrite a master copy with a non-master-copy record; refusing")
-        remove_files_from_disk(storage_id)
-        remove_database_entries(storage_id)
-    write_to_disk(storage_id)
-    return restore_from_folder(storage_id, copy_status=copy_status,
-      storage_digest=storage_digest, source_node=source_node, force_digest=True)
+    # only the storage of this resource is locked, so that resources can be
+    # imported while other resources are updated
+    with acquired(get_resource_locks([storage_id])):
+        if storage_object_exists(storage_id):
+            if copy_status != MASTER and StorageObject.objects.get(identifier=storage_id).copy_status == MASTER:
+                raise IllegalAccessException("Attempt to overwrite a master copy with a non-master-copy record; refusing")
+            remove_files_from_disk(storage_id)
+            remove_database_entries(storage_id)
+        write_to_disk(storage_id)
+        # the deduplication of reusable entities requires imports to be
+        # serialized, even of different resources
+        with acquired([get_import_lock()]):
+            return restore_from_folder(storage_id, copy_status=copy_status,
+              storage_digest=storage_digest, source_node=source_node,
+              force_digest=True)
 
 
 def _fill_storage_object(storage_obj, json_file_name):
@@ -624,20 +664,63 @@ def update_digests():
     Re-creates a digest if it is older than MAX_DIGEST_AGE / 2.
     This assumes that this method is called in MAX_DIGEST_AGE / 2 intervals to
     guarantee a maximum digest age of MAX_DIGEST_AGE.
+    
+    The synchronization views only serve these precomputed digests, so this
+    method also makes sure that the digest zip-archive of every master and
+    proxy copy matches the content hash of its current metadata and global
+    storage serializations; missing or stale archives are recreated.
     """
+    # only import on demand, as the repository depends on this module
+    from metashare.repository.models import resourceInfoType_model
+    from metashare.repository.supermodel import iterate_prefetched, \
+        EXPORT_BATCH_SIZE
+    
     LOGGER.info('Starting to update digests.')
     _expiration_date = _get_expiration_date()
     
-    # get all master copy storage object of ingested and published resources
+    # get all master and proxy copy storage objects of ingested and published
+    # resources and collect the ones to update together with their
+    # force_digest flag
+    _outdated = {}
     for _so in StorageObject.objects.filter(
-      Q(copy_status=MASTER),
+      Q(copy_status=MASTER) | Q(copy_status=PROXY),
       Q(publication_status=INGESTED) | Q(publication_status=PUBLISHED)):
-        if _expiration_date > _so.digest_modified \
+        if not _so.has_valid_digest():
+            LOGGER.info('recreating digest of {}'.format(_so.identifier))
+            _outdated[_so.id] = True
+        elif _so.copy_status == MASTER \
+          and _expiration_date > _so.digest_modified \
           and _expiration_date > _so.digest_last_checked: 
             LOGGER.info('updating {}'.format(_so.identifier))
-            _so.update_storage()
+            _outdated[_so.id] = False
         else:
             LOGGER.info('{} is up to date'.format(_so.identifier))
+    
+    # the resources of the storage objects to update are exported with their
+    # object graphs loaded in batches, so that the number of database queries
+    # does not depend on the number of resources
+    _so_ids = sorted(_outdated.keys())
+    for _start in range(0, len(_so_ids), EXPORT_BATCH_SIZE):
+        for _res in iterate_prefetched(resourceInfoType_model.objects.filter(
+          storage_object__in=_so_ids[_start:_start + EXPORT_BATCH_SIZE]) \
+          .select_related('storage_object')):
+            with acquired(get_resource_locks([_res.storage_object.identifier])):
+                # the resource may have been changed or removed (e.g., by a
+                # synchronization) while waiting for its lock
+                _so = StorageObject.objects.filter(pk=_res.storage_object.id,
+                                                   resourceinfotype_model=_res)
+                if not _so:
+                    LOGGER.info('{} has been removed in the meantime'.format(
+                      _res.storage_object.identifier))
+                    continue
+                _so = _so[0]
+                if _so.revision == _res.storage_object.revision:
+                    # the prefetched object graph is still up-to-date
+                    _res.storage_object = _so
+                    _so.update_storage(force_digest=_outdated[_so.id],
+                                       resource=_res)
+                else:
+                    _so.update_storage(force_digest=_outdated[_so.id])
 
     LOGGER.info('Finished updating digests.')
 
@@ -1,4 +1,5 @@
 import logging
+import sys
 from time import sleep
 from django.core.exceptions import ValidationError
 from django.test.client import Client
@@ -11,6 +12,8 @@ import json
 from metashare.repository.models import resourceInfoType_model
 from datetime import date
 from metashare.test_utils import set_index_active
+from metashare.utils import get_storage_lock, get_resource_locks, \
+    get_import_lock
 
 # Setup logging support.
 LOGGER = logging.getLogger(__name__)
@@ -279,3 +282,41 @@ class UpdateTests(unittest.TestCase):
         self.assertEquals(1, len(persons))
         contact_person = persons[0]
         self.assertEquals(MASTER, contact_person.copy_status)
+
+
+class LockTests(unittest.TestCase):
+    """
+    Tests the shared/exclusive locks on the storage and its resources.
+    """
+    @unittest.skipUnless('fcntl' in sys.modules, 'requires the fcntl module')
+    def test_shared_lock(self):
+        import fcntl
+        _shared = get_storage_lock(shared=True)
+        _other_shared = get_storage_lock(shared=True)
+        # shared locks are compatible with each other, but not with an
+        # exclusive lock
+        with _shared:
+            with _other_shared:
+                _exclusive = get_storage_lock()
+                self.assertRaises(IOError, fcntl.flock, _exclusive.handle,
+                                  fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(_exclusive.handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        _exclusive.release()
+
+    @unittest.skipUnless('fcntl' in sys.modules, 'requires the fcntl module')
+    def test_import_lock(self):
+        import fcntl
+        # imports are serialized, even if they are of different resources
+        with get_import_lock():
+            _other = get_import_lock()
+            self.assertRaises(IOError, fcntl.flock, _other.handle,
+                              fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_resource_locks(self):
+        _ids = [u'{0:032x}'.format(_i) for _i in range(500)]
+        _names = [_lock.lock_name for _lock in get_resource_locks(_ids)]
+        # each bucket is locked once and always in the same order
+        self.assertEqual(len(_names), len(set(_names)))
+        self.assertEqual(_names, [_lock.lock_name for _lock
+                                  in get_resource_locks(reversed(_ids))])
+        self.assertEqual(1, len(get_resource_locks([_ids[0], _ids[0]])))
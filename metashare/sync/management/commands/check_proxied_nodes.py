@@ -4,10 +4,11 @@ Management utility to handle removed proxy nodes.
 from django.core.management.base import BaseCommand
 from metashare import settings
 from metashare.storage.models import PROXY, StorageObject
-from metashare.sync.sync_utils import remove_resource
+from metashare.sync.models import NodeSyncCursor
+from metashare.sync.sync_utils import remove_resources, REMOVE_BATCH_SIZE
 import sys
 import logging
-from metashare.utils import Lock
+from metashare.utils import get_storage_lock
 
 
 # Setup logging support.
@@ -21,10 +22,12 @@ class Command(BaseCommand):
     
     def handle(self, *args, **options):
         try:
-            # before starting, make sure to lock the storage so that any other
-            # processes with heavy/frequent operations on the storage don't get
-            # in our way
-            lock = Lock('storage')
+            # before starting, make sure to lock the storage so that any
+            # processes which operate on the whole storage don't get in our
+            # way; the lock is shared with other processes which only operate
+            # on particular resources, as the removed resources are locked
+            # separately
+            lock = get_storage_lock(shared=True)
             lock.acquire()
 
             # collect current proxied node ids
@@ -33,15 +36,24 @@ class Command(BaseCommand):
             # iterate over proxy resources and check for each if its source node
             # id is still listed in the proxied node id list
             remove_count = 0
-            for proxy_res in StorageObject.objects.filter(copy_status=PROXY):
-                if not proxy_res.source_node in proxied_ids:
+            to_remove = [proxy_res for proxy_res
+                         in StorageObject.objects.filter(copy_status=PROXY)
+                         if not proxy_res.source_node in proxied_ids]
+            for start in range(0, len(to_remove), REMOVE_BATCH_SIZE):
+                batch = to_remove[start:start + REMOVE_BATCH_SIZE]
+                for proxy_res in batch:
                     # delete the associated resource
                     sys.stdout.write("\nremoving proxied resource {}\n" \
                         .format(proxy_res.identifier))
                     LOGGER.info("removing from proxied node {} resource {}" \
                         .format(proxy_res.source_node, proxy_res.identifier))
-                    remove_count += 1
-                    remove_resource(proxy_res)
+                remove_resources(batch)
+                remove_count += len(batch)
+            # forget the change cursors of removed proxied nodes so that a
+            # later synchronization with such a node starts again with a full
+            # inventory
+            NodeSyncCursor.objects.exclude(node_id__in=proxied_ids) \
+                .exclude(node_id__in=settings.CORE_NODES.keys()).delete()
             sys.stdout.write("\n{} proxied resources removed\n" \
                 .format(remove_count))
             LOGGER.info("A total of {} resources have been removed" \
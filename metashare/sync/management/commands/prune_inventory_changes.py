@@ -0,0 +1,17 @@
+"""
+Management utility to prune the inventory change log.
+"""
+from django.core.management.base import BaseCommand
+from metashare.sync.models import prune_inventory_changes
+
+
+class Command(BaseCommand):
+    
+    help = 'Removes tombstones older than SYNC_CHANGE_LOG_MAX_AGE seconds ' \
+      + 'from the inventory change log'
+    
+    def handle(self, *args, **options):
+        """
+        Prune the inventory change log.
+        """
+        prune_inventory_changes()
@@ -4,9 +4,10 @@ Management utility to handle removed nodes.
 from django.core.management.base import BaseCommand
 from metashare import settings
 from metashare.storage.models import StorageObject
-from metashare.sync.sync_utils import remove_resource
+from metashare.sync.models import NodeSyncCursor
+from metashare.sync.sync_utils import remove_resources, REMOVE_BATCH_SIZE
 import logging
-from metashare.utils import Lock
+from metashare.utils import get_storage_lock
 
 
 # Setup logging support.
@@ -20,20 +21,30 @@ class Command(BaseCommand):
     
     def handle(self, *args, **options):
         try:
-            # before starting, make sure to lock the storage so that any other
-            # processes with heavy/frequent operations on the storage don't get
-            # in our way
-            lock = Lock('storage')
+            # before starting, make sure to lock the storage so that any
+            # processes which operate on the whole storage don't get in our
+            # way; the lock is shared with other processes which only operate
+            # on particular resources, as the removed resources are locked
+            # separately
+            lock = get_storage_lock(shared=True)
             lock.acquire()
 
             for node_name in args:
                 LOGGER.info("checking node {}".format(node_name))
                 remove_count = 0
-                for res in StorageObject.objects.filter(source_node=node_name):
-                    remove_count += 1
-                    LOGGER.info("removing resource {}".format(res.identifier))
-                    remove_resource(res)
+                resources = list(
+                    StorageObject.objects.filter(source_node=node_name))
+                for start in range(0, len(resources), REMOVE_BATCH_SIZE):
+                    batch = resources[start:start + REMOVE_BATCH_SIZE]
+                    for res in batch:
+                        LOGGER.info("removing resource {}" \
+                            .format(res.identifier))
+                    remove_resources(batch)
+                    remove_count += len(batch)
                 LOGGER.info("removed {} resources of node {}" \
                         .format(remove_count, node_name))
+                # forget the change cursor so that a later synchronization
+                # with the node starts again with a full inventory
+                NodeSyncCursor.objects.filter(node_id=node_name).delete()
         finally:
             lock.release()
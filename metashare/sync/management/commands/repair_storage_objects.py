@@ -4,7 +4,7 @@ is set.
 """
 from django.core.management.base import BaseCommand
 from metashare.storage.models import repair_storage_objects
-from metashare.utils import Lock
+from metashare.utils import get_storage_lock
 
 
 class Command(BaseCommand):
@@ -16,7 +16,7 @@ class Command(BaseCommand):
             # before starting to remove the storage objects, make sure to lock
             # the storage so that any other processes with heavy/frequent
             # operations on the storage don't get in our way
-            lock = Lock('storage')
+            lock = get_storage_lock()
             lock.acquire()
             repair_storage_objects()
         finally:
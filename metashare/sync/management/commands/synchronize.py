@@ -3,15 +3,21 @@ Management utility to trigger synchronization.
 """
 import logging
 import socket
+import urllib
+from Queue import Queue, Empty
+from threading import Thread
+from traceback import format_exc
 
 from metashare import settings
 from metashare.sync.sync_utils import login, get_inventory, get_full_metadata, \
-    remove_resource
+    get_full_metadata_batch, remove_resource
+from metashare.sync.views import BATCH_SYNC_PROTOCOLS
 from django.core.management.base import BaseCommand
 from optparse import make_option
 from metashare.storage.models import StorageObject, PROXY, REMOTE, add_or_update_resource
+from metashare.sync.models import NodeSyncCursor
 from django.core.exceptions import ObjectDoesNotExist
-from metashare.utils import Lock
+from metashare.utils import Lock, get_storage_lock, acquired
 
 
 # Setup logging support.
@@ -85,19 +91,21 @@ class Command(BaseCommand):
         for node_id, node in nodes.items():
             LOGGER.info("syncing with node {} at {} ...".format(
               node_id, node['URL']))
+            # before starting the actual synchronization, make sure to lock
+            # the storage so that any processes which operate on the whole
+            # storage don't get in our way; the storage lock is shared with
+            # the synchronization with other nodes, as the added, updated and
+            # removed resources are locked separately, but the same node must
+            # not be synchronized concurrently
+            locks = [get_storage_lock(shared=True),
+                     Lock('sync-{0}'.format(node_id))]
             try:
-                # before starting the actual synchronization, make sure to lock
-                # the storage so that any other processes with heavy/frequent
-                # operations on the storage don't get in our way
-                lock = Lock('storage')
-                lock.acquire()
-                Command.sync_with_single_node(
-                  node_id, node, is_proxy, id_file=id_file)
+                with acquired(locks):
+                    Command.sync_with_single_node(
+                      node_id, node, is_proxy, id_file=id_file)
             except:
                 LOGGER.error('There was an error while trying to sync with '
                     'node "%s":', node_id, exc_info=True)
-            finally:
-                lock.release()
 
     @staticmethod
     def sync_with_single_node(node_id, node, is_proxy, id_file=None):
@@ -127,18 +135,29 @@ class Command(BaseCommand):
             if (index < len(settings.SYNC_PROTOCOLS) - 1):
                 inv_url = inv_url + "&"
         
+        # add the change cursor of the last successful synchronization with
+        # the node, if any, so that only the changes since then are sent
+        try:
+            inv_url = inv_url + "&cursor={}".format(urllib.quote(
+              NodeSyncCursor.objects.get(node_id=node_id).cursor))
+        except NodeSyncCursor.DoesNotExist:
+            pass
+        
         # get the inventory list 
-        remote_inventory = get_inventory(opener, inv_url)
+        remote_inventory, sync_protocol, remote_cursor, is_delta = \
+          get_inventory(opener, inv_url)
         remote_inventory_count = len(remote_inventory)
-        LOGGER.info("Remote node {} contains {} resources".format(
-          node_id, remote_inventory_count))
+        if is_delta:
+            LOGGER.info("Remote node {} reports {} changed resources".format(
+              node_id, remote_inventory_count))
+        else:
+            LOGGER.info("Remote node {} contains {} resources".format(
+              node_id, remote_inventory_count))
         
         # create a dictionary of uuid's and digests of resource from the local 
         # inventory that stem from the remote node
-        local_inventory = {}
-        remote_storage_objects = StorageObject.objects.filter(source_node=node_id)
-        for item in remote_storage_objects:
-            local_inventory[item.identifier] = item.digest_checksum
+        local_inventory = dict(StorageObject.objects.filter(source_node=node_id)
+          .values_list('identifier', 'digest_checksum'))
         local_inventory_count = len(local_inventory)
         LOGGER.info("Local node contains {} resources stemming from remote node {}".format(
           local_inventory_count, node_id))
@@ -149,12 +168,22 @@ class Command(BaseCommand):
         # 2. list of resources to be updated - resources that exist in both
         # inventories but the remote is different from the local
         # 3. list of resources to be removed - resources that exist in the local
-        # inventory but not in the remote
+        # inventory but not in the remote; in case of a delta inventory these
+        # are the resources for which the remote node reports a tombstone
         resources_to_add = []
         resources_to_update = []
+        resources_to_delete = []
         
         for remote_res_id, remote_digest in remote_inventory.iteritems():
-            if remote_res_id in local_inventory:
+            if remote_digest is None and is_delta:
+                if remote_res_id in local_inventory:
+                    resources_to_delete.append(remote_res_id)
+            elif remote_digest is None:
+                # the digest of the resource has not been created yet on the
+                # remote node (e.g., after a bulk import); the local copy is
+                # kept and the resource is fetched once its digest is listed
+                local_inventory.pop(remote_res_id, None)
+            elif remote_res_id in local_inventory:
                 # compare checksums; if they differ, the resource has to be updated
                 if remote_digest != local_inventory[remote_res_id]:
                     resources_to_update.append(remote_res_id)
@@ -179,8 +208,9 @@ class Command(BaseCommand):
                       node_id, remote_res_id, source_node))
                 except ObjectDoesNotExist:
                     resources_to_add.append(remote_res_id)
-        # remaining local inventory resources are to delete
-        resources_to_delete = local_inventory.keys()
+        if not is_delta:
+            # remaining local inventory resources are to delete
+            resources_to_delete = local_inventory.keys()
 
         # print informative messages to the user
         resources_to_add_count = len(resources_to_add)
@@ -195,37 +225,53 @@ class Command(BaseCommand):
         else:
             _copy_status = REMOTE
 
-        # add resources from remote inventory
+        # add and update resources from remote inventory; the full metadata
+        # records are downloaded and verified concurrently by a bounded pool of
+        # worker threads, but they are written to the database one after the
+        # other by this thread only
+        fetch_workers = node.get('FETCH_WORKERS', settings.SYNC_FETCH_WORKERS)
+        # if supported by the remote node, request the records in batches
+        if sync_protocol in BATCH_SYNC_PROTOCOLS:
+            batch_size = settings.SYNC_METADATA_BATCH_SIZE
+        else:
+            batch_size = None
         num_added = 0
-        for res_id in resources_to_add:
-            try:
-                LOGGER.info("adding resource {0} from node {1}".format(res_id, node_id))
-                res_obj = Command._get_remote_resource(
-                  res_id, remote_inventory[res_id], node_id, node, opener, _copy_status)
-                if not id_file is None:
-                    id_file.write("--->RESOURCE_ID:{0};STORAGE_IDENTIFIER:{1}\n"\
-                        .format(res_obj.id, res_obj.storage_object.identifier))
-                num_added += 1
-            except:
-                LOGGER.error("Error while adding resource {}".format(res_id),
-                    exc_info=True)
-
-        # update resources from remote inventory
         num_updated = 0
-        for res_id in resources_to_update:
+        _resources_to_update = set(resources_to_update)
+        for res_id, full_metadata, error in Command._fetch_remote_resources(
+                resources_to_add + resources_to_update, remote_inventory, node,
+                opener, fetch_workers, batch_size):
+            is_update = res_id in _resources_to_update
+            if error:
+                LOGGER.error("Error while fetching resource {}:\n{}".format(
+                  res_id, error))
+                continue
             try:
-                LOGGER.info("updating resource {0} from node {1}".format(res_id, node_id))
-                res_obj = Command._get_remote_resource(
-                  res_id, remote_inventory[res_id], node_id, node, opener, _copy_status)
+                if is_update:
+                    LOGGER.info("updating resource {0} from node {1}".format(res_id, node_id))
+                else:
+                    LOGGER.info("adding resource {0} from node {1}".format(res_id, node_id))
+                storage_json, resource_xml_string = full_metadata
+                res_obj = add_or_update_resource(storage_json,
+                  resource_xml_string, remote_inventory[res_id], _copy_status,
+                  source_node=node_id)
                 if not id_file is None:
                     id_file.write("--->RESOURCE_ID:{0};STORAGE_IDENTIFIER:{1}\n"\
                         .format(res_obj.id, res_obj.storage_object.identifier))
-                    if remote_inventory[res_id] != res_obj.storage_object.digest_checksum:
+                    if is_update and remote_inventory[res_id] \
+                            != res_obj.storage_object.digest_checksum:
                         id_file.write("Different digests!\n")
-                num_updated += 1
+                if is_update:
+                    num_updated += 1
+                else:
+                    num_added += 1
             except:
-                LOGGER.error("Error while updating resource {}".format(res_id),
-                    exc_info=True)
+                if is_update:
+                    LOGGER.error("Error while updating resource {}".format(res_id),
+                        exc_info=True)
+                else:
+                    LOGGER.error("Error while adding resource {}".format(res_id),
+                        exc_info=True)
 
         # delete resources from remote inventory
         num_deleted = 0
@@ -246,18 +292,69 @@ class Command(BaseCommand):
         LOGGER.info("{} of {} resources successfully removed." \
             .format(num_deleted, resources_to_delete_count))
 
+        # only remember the new change cursor if all changes could be applied;
+        # otherwise the same changes will be requested again next time
+        if remote_cursor and num_added == resources_to_add_count \
+                and num_updated == resources_to_update_count \
+                and num_deleted == resources_to_delete_count:
+            _node_cursor, _ = \
+              NodeSyncCursor.objects.get_or_create(node_id=node_id,
+                                                   defaults={'cursor': ''})
+            _node_cursor.cursor = remote_cursor
+            _node_cursor.save()
+
+        opener.log_statistics(node_id)
+        opener.close()
+
 
     @staticmethod
-    def _get_remote_resource(resource_id, resource_digest, node_id, node, opener, copy_status):
+    def _fetch_remote_resources(resource_ids, remote_inventory, node, opener,
+                                fetch_workers, batch_size=None):
         """
-        Retrieves from the given node the resource for the given id and
-        adds/updates it at the current node with the given copy status using the
-        given opener 
+        Retrieves from the given node the full metadata of the resources with
+        the given ids using the given opener and a pool of `fetch_workers`
+        worker threads. If a `batch_size` is given, then each request of a
+        worker asks for up to that many records at once.
+        
+        This is a generator which yields triples of resource id, a pair of
+        storage JSON and resource XML string, and an error message (None if the
+        full metadata could be retrieved and its digest has been verified).
+        The triples are yielded in the order in which the downloads finish; at
+        most twice as many records as the workers can request at once are
+        buffered so that fast downloads cannot exhaust the memory while the
+        caller is busy.
         """
-        # Get the json storage object and the actual metadata xml
-        storage_json, resource_xml_string = \
-          get_full_metadata(opener, "{0}/sync/{1}/metadata/" \
-                .format(node['URL'], resource_id), resource_digest)
-        res_obj = add_or_update_resource(storage_json, resource_xml_string,
-                        resource_digest, copy_status, source_node=node_id)
-        return res_obj
+        tasks = Queue()
+        for i in range(0, len(resource_ids), batch_size or 1):
+            tasks.put(resource_ids[i:i + (batch_size or 1)])
+        results = Queue(maxsize=2 * max(fetch_workers, 1) * (batch_size or 1))
+
+        def _fetch():
+            while True:
+                try:
+                    task = tasks.get_nowait()
+                except Empty:
+                    return
+                if batch_size:
+                    for result in get_full_metadata_batch(opener,
+                            "{0}/sync/metadata/".format(node['URL']),
+                            dict((res_id, remote_inventory[res_id])
+                                 for res_id in task)):
+                        results.put(result)
+                    continue
+                res_id = task[0]
+                try:
+                    results.put((res_id, get_full_metadata(opener,
+                      "{0}/sync/{1}/metadata/".format(node['URL'], res_id),
+                      remote_inventory[res_id]), None))
+                except:
+                    results.put((res_id, None, format_exc()))
+
+        for _ in range(min(max(fetch_workers, 1), tasks.qsize())):
+            worker = Thread(target=_fetch)
+            # the workers must not keep the process alive in case the caller
+            # stops consuming the results
+            worker.daemon = True
+            worker.start()
+        for _ in range(len(resource_ids)):
+            yield results.get()
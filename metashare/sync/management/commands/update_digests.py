@@ -3,7 +3,7 @@ Management utility to trigger digest updating.
 """
 from django.core.management.base import BaseCommand
 from metashare.storage.models import update_digests
-from metashare.utils import Lock
+from metashare.utils import get_storage_lock
 
 
 class Command(BaseCommand):
@@ -16,9 +16,11 @@ class Command(BaseCommand):
         """
         try:
             # before starting the digest updating, make sure to lock the storage
-            # so that any other processes with heavy/frequent operations on the
-            # storage don't get in our way
-            lock = Lock('storage')
+            # so that any processes which operate on the whole storage don't
+            # get in our way; the lock is shared with other processes which
+            # only operate on particular resources, as each updated resource is
+            # locked separately
+            lock = get_storage_lock(shared=True)
             lock.acquire()
             update_digests()
         finally:
@@ -0,0 +1,180 @@
+import logging
+from datetime import datetime, timedelta
+
+from django.db import models
+from django.db.models import Max, Q
+from django.db.models.signals import post_save, post_delete
+
+from metashare import settings
+from metashare.settings import LOG_HANDLER
+from metashare.storage.models import StorageObject, MASTER, PROXY, INTERNAL
+
+# Setup logging support.
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(LOG_HANDLER)
+
+# separator between the change number and the issue time of a change cursor
+CURSOR_SEPARATOR = ':'
+
+
+class InventoryChange(models.Model):
+    """
+    Models an entry in the change log of the synchronization inventory of this
+    node.
+
+    Whenever the inventory state of a storage object changes, a new entry is
+    added and the previous entries of the storage object are removed, so that
+    the auto-incremented primary key is a monotonic change number which can be
+    used as change cursor by the synchronizing nodes.
+    A `digest_checksum` of None marks a tombstone, i.e., a resource which is no
+    longer part of the inventory.
+    """
+    identifier = models.CharField(max_length=64, db_index=True)
+
+    digest_checksum = models.CharField(blank=True, null=True, max_length=32)
+
+    recorded = models.DateTimeField(db_index=True)
+
+    def __unicode__(self):
+        """
+        Returns the Unicode representation for this change log entry.
+        """
+        return u'<InventoryChange #{0} "{1}">'.format(self.id, self.identifier)
+
+
+class NodeSyncCursor(models.Model):
+    """
+    Holds the most recent inventory change cursor which this node has obtained
+    from another (core or proxied) node.
+    """
+    # the node id as used in the CORE_NODES/PROXIED_NODES settings
+    node_id = models.CharField(max_length=32, unique=True)
+
+    cursor = models.CharField(max_length=64)
+
+    modified = models.DateTimeField(auto_now=True)
+
+
+def _is_in_inventory(storage_object):
+    """
+    Returns whether the given storage object is currently part of the
+    synchronization inventory.
+    """
+    return storage_object.copy_status in (MASTER, PROXY) \
+        and storage_object.publication_status != INTERNAL
+
+
+def record_inventory_change(identifier, digest_checksum):
+    """
+    Records in the inventory change log that the storage object with the given
+    identifier is now part of the inventory with the given digest checksum, or
+    that it has been removed from the inventory if the checksum is None.
+
+    Nothing is recorded if the inventory state has not changed.
+    """
+    _latest = InventoryChange.objects.filter(identifier=identifier) \
+        .order_by('-id')[:1]
+    if _latest and _latest[0].digest_checksum == digest_checksum:
+        return
+    _entry = InventoryChange.objects.create(identifier=identifier,
+        digest_checksum=digest_checksum, recorded=datetime.now())
+    # the superseded entries are only removed after the new entry has been
+    # added; this way the highest change number never decreases, even on
+    # database backends which reuse the highest deleted primary key
+    InventoryChange.objects.filter(identifier=identifier, id__lt=_entry.id) \
+        .delete()
+
+
+def _storage_object_saved(sender, instance, **kwargs):
+    """
+    Keeps the inventory change log up-to-date with saved storage objects.
+    """
+    if not _is_in_inventory(instance):
+        record_inventory_change(instance.identifier, None)
+    # a resource whose digest has not been created yet (e.g., after a bulk
+    # import) is not removed from the inventory; its change is recorded as
+    # soon as its digest is available
+    elif instance.digest_checksum is not None:
+        record_inventory_change(instance.identifier, instance.digest_checksum)
+
+
+def _storage_object_deleted(sender, instance, **kwargs):
+    """
+    Records a tombstone in the inventory change log for deleted storage objects.
+    """
+    record_inventory_change(instance.identifier, None)
+
+post_save.connect(_storage_object_saved, sender=StorageObject,
+    dispatch_uid="metashare.sync.models._storage_object_saved")
+post_delete.connect(_storage_object_deleted, sender=StorageObject,
+    dispatch_uid="metashare.sync.models._storage_object_deleted")
+
+
+def get_current_cursor():
+    """
+    Returns a new change cursor for the current state of the inventory change
+    log.
+
+    A change cursor consists of the most recent change number and the time
+    when the cursor has been issued, so that expired cursors can be detected
+    even after the change log has been pruned.
+    """
+    _max_id = InventoryChange.objects.aggregate(Max('id'))['id__max'] or 0
+    return '{0}{1}{2}'.format(_max_id, CURSOR_SEPARATOR,
+                              datetime.now().strftime('%Y%m%d%H%M%S'))
+
+
+def get_inventory_changes(cursor):
+    """
+    Returns a dict with all inventory changes since the given change cursor.
+
+    The dict maps resource identifiers to digest checksums; a value of None
+    denotes that the resource has been removed from the inventory.
+
+    Returns None if the given cursor is invalid or has expired, i.e., if the
+    changes since the cursor cannot be reliably determined anymore.
+
+    Changes which have been recorded up to SYNC_CHANGE_LOG_SAFETY_WINDOW
+    seconds before the cursor has been issued are included again, as their
+    transactions may have been committed only after the cursor was issued.
+    """
+    try:
+        _change_no, _issued = cursor.split(CURSOR_SEPARATOR)
+        _change_no = int(_change_no)
+        _issued = datetime.strptime(_issued, '%Y%m%d%H%M%S')
+    except (AttributeError, ValueError):
+        return None
+    # tombstones which are older than the maximum change log age are pruned;
+    # for safety, we consider cursors as expired after half of that time
+    if _issued < datetime.now() \
+            - timedelta(seconds=settings.SYNC_CHANGE_LOG_MAX_AGE / 2):
+        return None
+    # a cursor beyond the current change log denotes that the change log has
+    # been reset in the meantime
+    _max_id = InventoryChange.objects.aggregate(Max('id'))['id__max'] or 0
+    if _change_no > _max_id:
+        return None
+    # in case of concurrent changes there may be more than one entry per
+    # resource; the latest one wins
+    _window_start = _issued \
+        - timedelta(seconds=settings.SYNC_CHANGE_LOG_SAFETY_WINDOW)
+    return dict(InventoryChange.objects \
+        .filter(Q(id__gt=_change_no) | Q(recorded__gte=_window_start)) \
+        .order_by('id').values_list('identifier', 'digest_checksum'))
+
+
+def prune_inventory_changes():
+    """
+    Removes all tombstones from the inventory change log which are older than
+    SYNC_CHANGE_LOG_MAX_AGE.
+    """
+    _expiration_date = datetime.now() \
+        - timedelta(seconds=settings.SYNC_CHANGE_LOG_MAX_AGE)
+    # the most recent entry is always kept so that the highest change number
+    # never decreases
+    _max_id = InventoryChange.objects.aggregate(Max('id'))['id__max'] or 0
+    _tombstones = InventoryChange.objects.filter(digest_checksum__isnull=True,
+        recorded__lt=_expiration_date).exclude(id=_max_id)
+    LOGGER.info('Pruning {} tombstones from the inventory change log.' \
+                .format(_tombstones.count()))
+    _tombstones.delete()
@@ -5,41 +5,55 @@ client-server protocol for synchronizing metadata.
 
 import urllib
 import urllib2
+import urlparse
 import contextlib
+import cookielib
+import httplib
 import json
 import os
 import shutil
 import logging
+import socket
+import tarfile
+import threading
+import time
+import zlib
 from zipfile import ZipFile
 from StringIO import StringIO
 from traceback import format_exc
 from metashare import settings
+from metashare.repository.models import resourceInfoType_model, \
+    delete_resources_deep
 from metashare.storage.models import compute_digest_checksum
 from metashare.settings import LOG_HANDLER
+from metashare.utils import get_resource_locks, acquired
 
 # Setup logging support.
 LOGGER = logging.getLogger(__name__)
 LOGGER.addHandler(LOG_HANDLER)
 
+# the number of resources which are removed together by remove_resources()
+REMOVE_BATCH_SIZE = 100
+
 # Idea taken from 
 # http://stackoverflow.com/questions/5082128/how-do-i-authenticate-a-urllib2-script-in-order-to-access-https-web-services-fro
 def login(login_url, username, password):
     """
     Login to django site.
-    Returns an opener with which logged-in requests can be sent.
+    Returns an opener (a `SyncSession`) with which logged-in requests can be
+    sent.
     Raises URLError if HTTP response status is in the 400-599 range.
     """
-    cookie_proc = urllib2.HTTPCookieProcessor()
-    opener = urllib2.build_opener(cookie_proc)
-    urllib2.install_opener(opener)
-    opener.open(login_url)
+    opener = SyncSession()
+    opener.open(login_url).close()
 
     csrftoken = None
-    for cookie in cookie_proc.cookiejar:
+    for cookie in opener.cookiejar:
         if cookie.name == 'csrftoken':
             csrftoken = cookie.value
             break
     if csrftoken is None:
+        opener.close()
         raise Exception("Response does not contain a csrftoken, cannot continue")
     
     post_data = urllib.urlencode({
@@ -55,16 +69,242 @@ def login(login_url, username, password):
         html = response.read()
         if not 'Logout' in html:
             raise Exception("Expected html page with a Logout button but got:\n{0}".format(html))
+    except:
+        opener.close()
+        raise
     finally:
         if response is not None:
             response.close()
     return opener
 
 
+class SyncSession(object):
+    """
+    An opener for the requests to a remote node which keeps its HTTP
+    connections alive across requests, negotiates gzip compression and keeps
+    track of the number of requests, the transferred bytes and the latency.
+    
+    A session may be shared between threads; every thread then uses its own
+    persistent connection per remote host. Cookies are shared, though.
+    """
+    # maximum number of redirects which are followed per request
+    MAX_REDIRECTS = 5
+
+    def __init__(self):
+        self.cookiejar = cookielib.CookieJar()
+        self.request_count = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency = 0.0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = []
+
+    def open(self, url, data=None):
+        """
+        Sends a GET request to the given URL - or a POST request if `data` is
+        given - and returns a file-like response object with a `headers`
+        attribute.
+        
+        Redirects are followed. Raises HTTPError if the HTTP response status
+        is in the 400-599 range.
+        """
+        for _ in range(SyncSession.MAX_REDIRECTS + 1):
+            response = self._send(url, data)
+            if not response.status in (301, 302, 303, 307):
+                break
+            response.close()
+            url = urlparse.urljoin(url, response.headers['location'])
+            # just like browsers do, we follow POST redirects with GETs
+            data = None
+        if response.status >= 400:
+            response.close()
+            raise urllib2.HTTPError(url, response.status, response.reason,
+                                    response.headers, None)
+        return response
+
+    def _send(self, url, data):
+        """
+        Sends a single request over the persistent connection of the current
+        thread and returns the response.
+        """
+        request = urllib2.Request(url, data)
+        self.cookiejar.add_cookie_header(request)
+        headers = dict(request.header_items())
+        headers['Accept-Encoding'] = 'gzip'
+        if data is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        # a response must be read completely before the next request can be
+        # sent over the same connection
+        previous_response = getattr(self._local, 'response', None)
+        if previous_response is not None:
+            previous_response.close()
+        start = time.time()
+        # a kept-alive connection may have been closed by the server in the
+        # meantime, so we retry once with a new connection
+        for retry in (False, True):
+            connection, path = self._get_connection(request)
+            try:
+                connection.request(request.get_method(), path, data, headers)
+                raw_response = connection.getresponse()
+                break
+            except (httplib.HTTPException, socket.error):
+                self._drop_connection(request)
+                if retry:
+                    raise
+        response = _SyncResponse(raw_response, self)
+        self.cookiejar.extract_cookies(response, request)
+        self._local.response = response
+        with self._stats_lock:
+            self.request_count += 1
+            self.bytes_sent += len(data or '')
+            self.latency += time.time() - start
+        return response
+
+    def _get_connection(self, request):
+        """
+        Returns a pair of the persistent connection of the current thread
+        which has to be used for the given request and the path to request.
+        """
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        key = (request.get_type(), request.get_host())
+        path = request.get_selector()
+        proxy = urllib.getproxies().get(request.get_type())
+        if proxy and urllib.proxy_bypass(request.get_host()):
+            proxy = None
+        if proxy and request.get_type() == 'http':
+            path = request.get_full_url()
+        if not key in connections:
+            host = request.get_host()
+            if proxy:
+                host = urlparse.urlsplit(proxy).netloc
+            if request.get_type() == 'https':
+                connection = httplib.HTTPSConnection(host)
+                if proxy:
+                    connection.set_tunnel(request.get_host())
+            else:
+                connection = httplib.HTTPConnection(host)
+            connections[key] = connection
+            with self._stats_lock:
+                self._connections.append(connection)
+        return connections[key], path
+
+    def _drop_connection(self, request):
+        """
+        Closes and forgets the connection of the current thread which has
+        been used for the given request.
+        """
+        connection = self._local.connections.pop(
+          (request.get_type(), request.get_host()))
+        connection.close()
+
+    def add_received_bytes(self, count):
+        """
+        Adds the given number of bytes to the received bytes statistics.
+        """
+        with self._stats_lock:
+            self.bytes_received += count
+
+    def log_statistics(self, node_id):
+        """
+        Logs the transfer statistics of this session for the given node.
+        """
+        LOGGER.info("Sent {} requests to node {} with an average latency of "
+          "{:.3f} seconds; {} bytes sent, {} bytes received.".format(
+            self.request_count, node_id,
+            self.latency / max(self.request_count, 1), self.bytes_sent,
+            self.bytes_received))
+
+    def close(self):
+        """
+        Closes all connections of this session.
+        """
+        with self._stats_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+class _SyncResponse(object):
+    """
+    A file-like HTTP response of a `SyncSession` which transparently decodes
+    gzip content.
+    """
+    # size of the chunks in which the raw response is read
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, raw_response, session):
+        self._raw_response = raw_response
+        self._session = session
+        self.status = raw_response.status
+        self.reason = raw_response.reason
+        self.headers = raw_response.msg
+        if self.headers.get('content-encoding', '') == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._decompressor = None
+        self._buffer = ''
+        self._eof = False
+
+    def info(self):
+        """
+        Returns the response headers; required for cookie handling.
+        """
+        return self.headers
+
+    def _read_raw(self):
+        """
+        Reads the next chunk of the raw response and returns it decoded.
+        """
+        data = self._raw_response.read(_SyncResponse.CHUNK_SIZE)
+        self._session.add_received_bytes(len(data))
+        if not data:
+            self._eof = True
+            if self._decompressor:
+                return self._decompressor.flush()
+        elif self._decompressor:
+            return self._decompressor.decompress(data)
+        return data
+
+    def read(self, size=-1):
+        """
+        Reads up to `size` bytes of (decoded) content or all remaining content
+        if no size is given.
+        """
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while not self._eof and (size < 0 or length < size):
+            chunk = self._read_raw()
+            chunks.append(chunk)
+            length += len(chunk)
+        data = ''.join(chunks)
+        if size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+    def close(self):
+        """
+        Reads the remaining response so that the connection can be reused.
+        """
+        while not self._eof:
+            self._read_raw()
+        self._raw_response.close()
+        self._buffer = ''
+
+
 def get_inventory(opener, inventory_url):
     """
     Obtain the inventory from a logged-in opener and fill it into a JSON structure.
-    Returns the JSON structure.
+    Returns a 4-tuple of the JSON structure, the sync protocol chosen by the
+    remote node, the change cursor sent by the remote node (None if the sync
+    protocol does not support change cursors) and a flag whether the JSON
+    structure only contains the changes since the change cursor given in the
+    inventory URL.
     """
     try:
         with contextlib.closing(opener.open(inventory_url)) as response:
@@ -73,11 +313,14 @@ def get_inventory(opener, inventory_url):
                     'send any sync protocol version along with its metadata '
                     'inventory. This indicates an incompatible pre-v3.0 node.'
                     .format(inventory_url))
+            sync_protocol = response.headers['sync-protocol']
+            cursor = response.headers.get('sync-cursor', None)
+            is_delta = response.headers.get('sync-inventory', None) == 'delta'
             data = response.read()
             with ZipFile(StringIO(data), 'r') as inzip:
                 json_inventory = json.load(inzip.open('inventory.json'))
                 # TODO: add error handling and verification of json structure
-                return json_inventory
+                return json_inventory, sync_protocol, cursor, is_delta
     except ConnectionException:
         raise
     except:
@@ -94,20 +337,77 @@ def get_full_metadata(opener, full_metadata_url, expected_digest):
     does not have an md5 digest identical to expected_digest.
     """
     with contextlib.closing(opener.open(full_metadata_url)) as response:
-        data = response.read()
-        with ZipFile(StringIO(data), 'r') as inzip:
-            with inzip.open('metadata.xml') as resource_xml:
-                resource_xml_string = resource_xml.read()
-            with inzip.open('storage-global.json') as storage_file:
-                # read json string
-                storage_json_string = storage_file.read() 
-                # convert to json object
-                storage_json = json.loads(storage_json_string)
-            if not expected_digest == \
-              compute_digest_checksum(resource_xml_string, storage_json_string):
-                raise CorruptDataException("Checksum error for resource '{0}'." \
-                  .format(full_metadata_url))
-            return storage_json, resource_xml_string
+        return _read_full_metadata(response.read(), expected_digest,
+                                   full_metadata_url)
+
+
+def get_full_metadata_batch(opener, batch_url, expected_digests):
+    """
+    Obtain the full metadata records for several resources with a single
+    request.
+    
+    `expected_digests` is a dict of the identifiers of the requested resources
+    and their expected digests.
+    
+    This is a generator which yields a triple for each requested resource:
+    the resource identifier, a pair of storage_json_string,
+    resource_xml_string, and an error message (None if the record has been
+    received and its digest verified). The records are verified and yielded
+    while the response is still being received.
+    """
+    post_data = urllib.urlencode(
+      [('resource', res_id) for res_id in expected_digests])
+    missing = set(expected_digests)
+    try:
+        with contextlib.closing(opener.open(batch_url, post_data)) as response:
+            with contextlib.closing(
+                    tarfile.open(fileobj=response, mode='r|')) as intar:
+                for entry in intar:
+                    res_id = entry.name[:-len('.zip')]
+                    if not res_id in missing:
+                        continue
+                    missing.remove(res_id)
+                    try:
+                        result = (res_id, _read_full_metadata(
+                          intar.extractfile(entry).read(),
+                          expected_digests[res_id],
+                          '{0} ({1})'.format(batch_url, res_id)), None)
+                    except Exception:
+                        result = (res_id, None, format_exc())
+                    yield result
+    except Exception:
+        # all records which have not been received yet have failed
+        error = format_exc()
+        for res_id in missing:
+            yield res_id, None, error
+        return
+    for res_id in missing:
+        yield res_id, None, "Resource '{0}' was not sent by {1}." \
+            .format(res_id, batch_url)
+
+
+def _read_full_metadata(data, expected_digest, source):
+    """
+    Reads the full metadata record from the given zip data.
+    
+    Returns a pair of storage_json_string, resource_xml_string.
+    
+    Raises CorruptDataException if the zip data does not have an md5 digest
+    identical to expected_digest.
+    """
+    with ZipFile(StringIO(data), 'r') as inzip:
+        with inzip.open('metadata.xml') as resource_xml:
+            resource_xml_string = resource_xml.read()
+        with inzip.open('storage-global.json') as storage_file:
+            # read json string
+            storage_json_string = storage_file.read() 
+            # convert to json object
+            storage_json = json.loads(storage_json_string)
+        if not expected_digest == \
+          compute_digest_checksum(resource_xml_string, storage_json_string):
+            raise CorruptDataException("Checksum error for resource '{0}'." \
+              .format(source))
+        return storage_json, resource_xml_string
 
 
 def remove_resource(storage_object, keep_stats=False):
@@ -117,18 +417,36 @@ def remove_resource(storage_object, keep_stats=False):
     Also includes deletion of statistics and recommendations; use keep_stats
     optional parameter to suppress deletion of statistics and recommendations.
     """
-    try:
-        resource = storage_object.resourceinfotype_model_set.all()[0]
-    except:
-        # pylint: disable-msg=E1101
-        LOGGER.error('PROBLEMATIC: %s - count: %s', storage_object.identifier, 
-          storage_object.resourceinfotype_model_set.count(), exc_info=True)
-        raise
+    remove_resources([storage_object], keep_stats)
+
+
+def remove_resources(storage_objects, keep_stats=False):
+    """
+    Completely removes the given storage objects and their associated language
+    resources from the storage layer; the resources are deleted in bulk.
+    Also includes deletion of statistics and recommendations; use keep_stats
+    optional parameter to suppress deletion of statistics and recommendations.
+    """
+    resources = list(resourceInfoType_model.objects.filter(
+        storage_object__in=storage_objects))
+    if len(resources) != len(storage_objects):
+        _found = set(res.storage_object_id for res in resources)
+        for storage_object in storage_objects:
+            if storage_object.id not in _found:
+                # pylint: disable-msg=E1101
+                LOGGER.error('PROBLEMATIC: %s - count: %s',
+                  storage_object.identifier,
+                  storage_object.resourceinfotype_model_set.count())
+        raise Exception('missing resources of storage objects')
 
-    folder = os.path.join(settings.STORAGE_PATH, storage_object.identifier)
-    shutil.rmtree(folder)
-    resource.delete_deep(keep_stats=keep_stats)
-    storage_object.delete()
+    with acquired(get_resource_locks(
+            [storage_object.identifier for storage_object in storage_objects])):
+        delete_resources_deep(resources, keep_stats=keep_stats,
+                              delete_storage_objects=True)
+        # the folders are only removed once the deletion has been committed
+        for storage_object in storage_objects:
+            shutil.rmtree(os.path.join(settings.STORAGE_PATH,
+                                       storage_object.identifier))
 
     
 class ConnectionException(Exception):
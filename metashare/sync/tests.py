@@ -1,12 +1,18 @@
 import datetime
 import os
 import json
+import BaseHTTPServer
 import logging
+import tarfile
+import threading
 
+from contextlib import closing
+from gzip import GzipFile
 from xml.etree.ElementTree import fromstring
 from StringIO import StringIO
 from zipfile import ZipFile
 
+from django.conf import settings as django_settings
 from django.test.testcases import TestCase
 from django.test.client import Client
 from django.contrib.auth.models import User, Group, Permission
@@ -16,9 +22,13 @@ from django.core.management import call_command
 from metashare import settings, test_utils
 from metashare.repository.models import resourceInfoType_model
 from metashare.storage.models import INGESTED, INTERNAL, StorageObject, \
-    PUBLISHED, compute_digest_checksum, MASTER, PROXY
+    PUBLISHED, compute_digest_checksum, MASTER, PROXY, update_digests
 from metashare.settings import DJANGO_BASE, LOGIN_URL, LOG_HANDLER
 from metashare.test_utils import set_index_active
+from metashare.sync.management.commands.synchronize import Command
+from metashare.sync.sync_utils import get_full_metadata_batch, SyncSession
+from metashare.sync.models import InventoryChange, record_inventory_change, \
+    get_current_cursor, get_inventory_changes
 
 # Setup logging support.
 LOGGER = logging.getLogger(__name__)
@@ -265,6 +275,103 @@ class MetadataSyncTest (TestCase):
         self.assertEquals(expected_digest, compute_digest_checksum(
           resource_xml_string, storage_json_string))
 
+    def test_full_metadata_range_request(self):
+        settings.SYNC_NEEDS_AUTHENTICATION = False
+        client = Client()
+        storage_object = StorageObject.objects.filter(publication_status=PUBLISHED)[0]
+        url = '{0}{1}/metadata/'.format(self.SYNC_BASE, storage_object.identifier)
+        with open(storage_object.get_digest_path(), 'rb') as inzip:
+            zipfiledata = inzip.read()
+        response = client.get(url)
+        self.assertEquals(200, response.status_code)
+        self.assertEquals('bytes', response['Accept-Ranges'])
+        self.assertEquals(zipfiledata, response.content)
+        # resume the download
+        response = client.get(url, HTTP_RANGE='bytes=100-')
+        self.assertEquals(206, response.status_code)
+        self.assertEquals('bytes 100-{0}/{1}'.format(len(zipfiledata) - 1,
+            len(zipfiledata)), response['Content-Range'])
+        self.assertEquals(zipfiledata[100:], response.content)
+        response = client.get(url, HTTP_RANGE='bytes=-10')
+        self.assertEquals(206, response.status_code)
+        self.assertEquals(zipfiledata[-10:], response.content)
+        # an outdated If-Range validator causes a full response
+        response = client.get(url, HTTP_RANGE='bytes=100-',
+                              HTTP_IF_RANGE='Sun, 01 Jan 2012 00:00:00 GMT')
+        self.assertEquals(200, response.status_code)
+        self.assertEquals(zipfiledata, response.content)
+        response = client.get(url, HTTP_RANGE='bytes={0}-'.format(len(zipfiledata)))
+        self.assertEquals(416, response.status_code)
+
+    def test_full_metadata_sendfile(self):
+        settings.SYNC_NEEDS_AUTHENTICATION = False
+        client = Client()
+        storage_object = StorageObject.objects.filter(publication_status=PUBLISHED)[0]
+        url = '{0}{1}/metadata/'.format(self.SYNC_BASE, storage_object.identifier)
+        _storage_path = django_settings.STORAGE_PATH
+        try:
+            django_settings.SENDFILE_HEADER = 'X-Sendfile'
+            response = client.get(url)
+            self.assertEquals(storage_object.get_digest_path(),
+                              response['X-Sendfile'])
+            self.assertEquals('', response.content)
+            # the test storage path is only set in the metashare settings
+            django_settings.STORAGE_PATH = settings.STORAGE_PATH
+            django_settings.SENDFILE_HEADER = 'X-Accel-Redirect'
+            response = client.get(url)
+            self.assertEquals('{0}{1}/resource.zip'.format(
+                    settings.SENDFILE_ACCEL_LOCATION, storage_object.identifier),
+                response['X-Accel-Redirect'])
+        finally:
+            django_settings.SENDFILE_HEADER = None
+            django_settings.STORAGE_PATH = _storage_path
+
+    def test_digests_are_not_created_inline(self):
+        settings.SYNC_NEEDS_AUTHENTICATION = False
+        client = Client()
+        storage_object = StorageObject.objects.filter(publication_status=PUBLISHED)[0]
+        resource_uuid = storage_object.identifier
+        expected_digest = storage_object.digest_checksum
+        # remove the digest so that it is not available anymore
+        os.remove(storage_object.get_digest_path())
+        StorageObject.objects.filter(identifier=resource_uuid) \
+            .update(digest_checksum=None)
+        response = client.get('{0}{1}/metadata/'.format(self.SYNC_BASE, resource_uuid))
+        self.assertEquals(503, response.status_code)
+        # the background job recreates the digest
+        update_digests()
+        storage_object = StorageObject.objects.get(identifier=resource_uuid)
+        self.assertEquals(expected_digest, storage_object.digest_checksum)
+        self.assertTrue(storage_object.has_valid_digest())
+        response = client.get(self.INVENTORY_URL + "?sync_protocol=1.0")
+        self.assertEquals(expected_digest,
+                          self.extract_inventory(response)[resource_uuid])
+        response = client.get('{0}{1}/metadata/'.format(self.SYNC_BASE, resource_uuid))
+        self.assertValidFullMetadataResponse(response)
+
+    def test_inventory_lists_resources_without_digest(self):
+        settings.SYNC_NEEDS_AUTHENTICATION = False
+        client = Client()
+        storage_object = StorageObject.objects.filter(publication_status=PUBLISHED)[0]
+        resource_uuid = storage_object.identifier
+        expected_digest = storage_object.digest_checksum
+        # remove the digest as, e.g., in case of a bulk import
+        os.remove(storage_object.get_digest_path())
+        StorageObject.objects.filter(identifier=resource_uuid) \
+            .update(digest_checksum=None)
+        # the resource must still be part of the full inventory, as otherwise
+        # the synchronizing node would delete it, but its digest is not
+        # created inline
+        response = client.get(self.INVENTORY_URL + "?sync_protocol=1.0")
+        self.assertIsNone(self.extract_inventory(response)[resource_uuid])
+        self.assertIsNone(StorageObject.objects.get(identifier=resource_uuid)
+                          .digest_checksum)
+        # the background job creates the digest
+        update_digests()
+        response = client.get(self.INVENTORY_URL + "?sync_protocol=1.0")
+        self.assertEquals(expected_digest,
+                          self.extract_inventory(response)[resource_uuid])
+
     def test_inventory_no_sync_protocol(self):
         settings.SYNC_NEEDS_AUTHENTICATION = False
         response = Client().get(self.INVENTORY_URL)
@@ -285,6 +392,169 @@ class MetadataSyncTest (TestCase):
         inventory = self.extract_inventory(response)
         self.assertNotEquals(0, len(inventory))
      
+    def test_inventory_delta_protocol_without_cursor(self):
+        settings.SYNC_NEEDS_AUTHENTICATION = False
+        response = Client().get(
+          self.INVENTORY_URL + "?sync_protocol=1.1&sync_protocol=1.0")
+        self.assertValidInventoryResponse(response)
+        self.assertEquals("1.1", response['Sync-Protocol'])
+        self.assertEquals("full", response['Sync-Inventory'])
+        self.assertTrue(response['Sync-Cursor'])
+        self.assertEquals(2, len(self.extract_inventory(response)))
+
+    def test_inventory_delta_protocol_with_invalid_cursor(self):
+        settings.SYNC_NEEDS_AUTHENTICATION = False
+        for cursor in ('foo', '0:19700101000000', '100000:20990101000000'):
+            response = Client().get(self.INVENTORY_URL
+              + "?sync_protocol=1.1&cursor={}".format(cursor))
+            self.assertValidInventoryResponse(response)
+            self.assertEquals("full", response['Sync-Inventory'])
+
+    @staticmethod
+    def _age_inventory_changes():
+        """
+        Moves all recorded inventory changes out of the safety window, so that
+        they are not sent again with the next delta inventory.
+        """
+        InventoryChange.objects.update(recorded=datetime.datetime.now()
+          - datetime.timedelta(seconds=2 * settings.SYNC_CHANGE_LOG_SAFETY_WINDOW))
+
+    def test_inventory_delta(self):
+        settings.SYNC_NEEDS_AUTHENTICATION = False
+        client = Client()
+        self._age_inventory_changes()
+        response = client.get(self.INVENTORY_URL + "?sync_protocol=1.1")
+        cursor = response['Sync-Cursor']
+        # no changes since the cursor has been issued
+        response = client.get(self.INVENTORY_URL
+          + "?sync_protocol=1.1&cursor={}".format(cursor))
+        self.assertEquals(200, response.status_code)
+        self.assertEquals("delta", response['Sync-Inventory'])
+        self.assertEquals({}, self.extract_inventory(response))
+        # publishing an internal resource shows up as an addition
+        storage_object = \
+          StorageObject.objects.filter(publication_status=INTERNAL)[0]
+        storage_object.publication_status = PUBLISHED
+        storage_object.update_storage()
+        response = client.get(self.INVENTORY_URL
+          + "?sync_protocol=1.1&cursor={}".format(cursor))
+        self.assertEquals("delta", response['Sync-Inventory'])
+        self.assertEquals(
+          {storage_object.identifier: storage_object.digest_checksum},
+          self.extract_inventory(response))
+        cursor = response['Sync-Cursor']
+        self._age_inventory_changes()
+        # making it internal again shows up as a tombstone
+        storage_object.publication_status = INTERNAL
+        storage_object.save()
+        response = client.get(self.INVENTORY_URL
+          + "?sync_protocol=1.1&cursor={}".format(cursor))
+        self.assertEquals({storage_object.identifier: None},
+                          self.extract_inventory(response))
+        cursor = response['Sync-Cursor']
+        self._age_inventory_changes()
+        # a published resource without a digest yet is not a removal
+        storage_object = \
+          StorageObject.objects.filter(publication_status=PUBLISHED)[0]
+        storage_object.digest_checksum = None
+        storage_object.save()
+        response = client.get(self.INVENTORY_URL
+          + "?sync_protocol=1.1&cursor={}".format(cursor))
+        self.assertEquals({}, self.extract_inventory(response))
+
+    def test_inventory_delta_resends_recent_changes(self):
+        # a change which is recorded before the cursor is issued may only be
+        # committed afterwards, so recent changes are sent again
+        self._age_inventory_changes()
+        record_inventory_change('late-change', None)
+        self.assertEquals({'late-change': None},
+                          get_inventory_changes(get_current_cursor()))
+        # changes outside of the safety window are not sent again
+        self._age_inventory_changes()
+        self.assertEquals({}, get_inventory_changes(get_current_cursor()))
+
+    def test_fetch_remote_resources(self):
+        # a fake opener which serves the digests of the local resources
+        class _Opener():
+            def open(self, url):
+                res_id = url.split('/')[-3]
+                with open(os.path.join(settings.STORAGE_PATH, res_id,
+                                       'resource.zip'), 'rb') as _zip:
+                    return StringIO(_zip.read())
+        inventory = dict((_so.identifier, _so.digest_checksum)
+          for _so in StorageObject.objects.exclude(publication_status=INTERNAL))
+        # tamper with one of the digests
+        corrupt_id = inventory.keys()[0]
+        inventory[corrupt_id] = '0' * 32
+        results = list(Command._fetch_remote_resources(inventory.keys(),
+          inventory, {'URL': 'http://example.org'}, _Opener(), 3))
+        self.assertEquals(sorted(inventory.keys()),
+                          sorted(res_id for res_id, _, _ in results))
+        for res_id, full_metadata, error in results:
+            if res_id == corrupt_id:
+                self.assertIsNone(full_metadata)
+                self.assertTrue('CorruptDataException' in error)
+            else:
+                self.assertIsNone(error)
+                self.assertEquals(res_id, full_metadata[0]['identifier'])
+                self.assertIsNotNone(fromstring(full_metadata[1]))
+
+    def test_full_metadata_batch(self):
+        settings.SYNC_NEEDS_AUTHENTICATION = False
+        client = Client()
+        self.assertEquals(405,
+          client.get('{0}metadata/'.format(self.SYNC_BASE)).status_code)
+        identifiers = StorageObject.objects.values_list('identifier', flat=True)
+        response = client.post('{0}metadata/'.format(self.SYNC_BASE),
+                               {'resource': identifiers})
+        self.assertEquals(200, response.status_code)
+        self.assertEquals('application/x-tar', response['Content-Type'])
+        with closing(tarfile.open(fileobj=StringIO(response.content),
+                                  mode='r')) as intar:
+            entries = intar.getmembers()
+            # internal resources are left out
+            self.assertEquals(sorted('{0}.zip'.format(_so.identifier)
+                for _so in StorageObject.objects.exclude(
+                    publication_status=INTERNAL)),
+              sorted(entry.name for entry in entries))
+            for entry in entries:
+                with ZipFile(intar.extractfile(entry), 'r') as inzip:
+                    self.assertEquals(
+                      StorageObject.objects.get(identifier=entry.name[:-4])
+                        .digest_checksum,
+                      compute_digest_checksum(inzip.read('metadata.xml'),
+                                              inzip.read('storage-global.json')))
+
+    def test_anonymous_cannot_reach_full_metadata_batch(self):
+        settings.SYNC_NEEDS_AUTHENTICATION = True
+        response = Client().post('{0}metadata/'.format(self.SYNC_BASE),
+          {'resource': StorageObject.objects.values_list('identifier',
+                                                         flat=True)})
+        self.assertIsForbidden(response)
+
+    def test_get_full_metadata_batch(self):
+        settings.SYNC_NEEDS_AUTHENTICATION = False
+        # a fake opener which POSTs to the local batch full metadata view
+        class _Opener():
+            def open(self, url, data):
+                return StringIO(Client().post(url, data,
+                  content_type='application/x-www-form-urlencoded').content)
+        expected_digests = dict(StorageObject.objects.values_list(
+          'identifier', 'digest_checksum'))
+        internal_id = StorageObject.objects.get(
+          publication_status=INTERNAL).identifier
+        results = list(get_full_metadata_batch(_Opener(),
+          '{0}metadata/'.format(self.SYNC_BASE), expected_digests))
+        self.assertEquals(sorted(expected_digests.keys()),
+                          sorted(res_id for res_id, _, _ in results))
+        for res_id, full_metadata, error in results:
+            if res_id == internal_id:
+                self.assertIsNone(full_metadata)
+                self.assertTrue('was not sent' in error)
+            else:
+                self.assertIsNone(error)
+                self.assertEquals(res_id, full_metadata[0]['identifier'])
+
     def test_proxy_check(self):
         
         # define proxied nodes
@@ -341,3 +611,73 @@ class MetadataSyncTest (TestCase):
         self.assertFalse(os.path.isdir(res1_folder))
         self.assertFalse(os.path.isdir(res2_folder))
         self.assertTrue(os.path.isdir(res3_folder))        
+
+
+class SyncSessionTest(TestCase):
+    """
+    Tests the persistent HTTP connections and the gzip support of the
+    `SyncSession` with a minimal local HTTP/1.1 server.
+    """
+    class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        clients = set()
+
+        def do_GET(self):
+            SyncSessionTest._Handler.clients.add(self.client_address)
+            if self.path == '/redirect/':
+                self.send_response(302)
+                self.send_header('Location', '/target/')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = self.path * 1000
+            headers = {}
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                compressed = StringIO()
+                with closing(GzipFile(fileobj=compressed, mode='w')) as _gzip:
+                    _gzip.write(body)
+                body = compressed.getvalue()
+                headers['Content-Encoding'] = 'gzip'
+            self.send_response(200)
+            headers['Content-Length'] = str(len(body))
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    def setUp(self):
+        SyncSessionTest._Handler.clients = set()
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                SyncSessionTest._Handler)
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        server_thread = threading.Thread(target=self.server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_persistent_gzip_connection(self):
+        session = SyncSession()
+        for i in range(5):
+            path = '/resource{}/'.format(i)
+            response = session.open(self.base_url + path)
+            self.assertEquals(path * 1000, response.read())
+            response.close()
+        self.assertEquals(5, session.request_count)
+        # all requests have been sent over the same connection
+        self.assertEquals(1, len(SyncSessionTest._Handler.clients))
+        # the content has been transferred compressed
+        self.assertTrue(0 < session.bytes_received < 5 * 11 * 1000)
+        session.close()
+
+    def test_redirect(self):
+        session = SyncSession()
+        response = session.open(self.base_url + '/redirect/')
+        self.assertEquals('/target/' * 1000, response.read())
+        self.assertEquals(2, session.request_count)
+        session.close()
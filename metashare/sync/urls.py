@@ -3,5 +3,6 @@ from django.conf.urls.defaults import patterns
 
 urlpatterns = patterns('metashare.sync.views',
   (r'^$', 'inventory'),
+  (r'^metadata/$', 'full_metadata_batch'),
   (r'^(?P<resource_uuid>[0-9a-fA-F]{64})/metadata/$', 'full_metadata'),
 )
@@ -1,13 +1,36 @@
 from django.http import HttpResponse
 import json
+import logging
+import os
+import tarfile
 from zipfile import ZipFile
 from metashare import settings
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
+from django.views.decorators.gzip import gzip_page
 from metashare.storage.models import StorageObject, MASTER, PROXY, INTERNAL, \
     REMOTE
+from metashare.sync.models import get_current_cursor, get_inventory_changes
+from metashare.settings import LOG_HANDLER
+from metashare.utils import serve_file, StreamBuffer
 
+# Setup logging support.
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(LOG_HANDLER)
 
+# sync protocols which support delta inventories based on change cursors
+DELTA_SYNC_PROTOCOLS = ('1.1', '1.2')
+
+# sync protocols which support the batch full metadata view
+BATCH_SYNC_PROTOCOLS = ('1.2',)
+
+# maximum number of resources which can be requested from the batch full
+# metadata view at once
+MAX_METADATA_BATCH_SIZE = 500
+
+
+# the inventory is compressed for clients which accept gzip encoding
+@gzip_page
 def inventory(request):
     if settings.SYNC_NEEDS_AUTHENTICATION and not request.user.has_perm('storage.can_sync'):
         return HttpResponse("Forbidden: only synchronization users can access this page.", status=403)
@@ -32,9 +55,25 @@ def inventory(request):
     response['Content-Disposition'] = 'attachment; filename="inventory.zip"'
     response['Sync-Protocol'] = sync_protocol
 
+    if sync_protocol in DELTA_SYNC_PROTOCOLS:
+        # the cursor has to be determined before collecting the inventory so
+        # that no concurrent change can get lost
+        response['Sync-Cursor'] = get_current_cursor()
+        # if the client sent a valid change cursor, only send the changes
+        # since then; otherwise fall back to a full inventory
+        if 'cursor' in request.GET:
+            json_response = get_inventory_changes(request.GET['cursor'])
+            if json_response is not None:
+                response['Sync-Inventory'] = 'delta'
+                with ZipFile(response, 'w') as outzip:
+                    outzip.writestr('inventory.json', json.dumps(json_response))
+                return response
+        response['Sync-Inventory'] = 'full'
+
     # collect inventory for existing resources;
-    # consists of key - value pairs of resource identifiers and digest checksums
-    json_response = {}
+    # consists of key - value pairs of resource identifiers and digest checksums;
+    # the digests precomputed by the `update_digests` job are sent, so that no
+    # digest has to be (re-)created while the requesting node waits
     objects_to_sync = StorageObject.objects \
         .filter(Q(copy_status=MASTER) | Q(copy_status=PROXY)) \
         .exclude(publication_status=INTERNAL)
@@ -47,8 +86,12 @@ def inventory(request):
 #        except ValueError:
 #            # If we cannot parse the date string, act as if none was provided
 #            pass
-    for obj in objects_to_sync:
-        json_response[obj.identifier] = obj.get_digest_checksum()
+    json_response = dict(objects_to_sync \
+        .values_list('identifier', 'digest_checksum'))
+    # resources without digest, e.g., after a bulk import, are listed without
+    # digest, as the requesting node would delete its copies of them if they
+    # were left out; their digests are never created inline, but by the import
+    # and the `update_digests` job
     
     with ZipFile(response, 'w') as outzip:
         outzip.writestr('inventory.json', json.dumps(json_response))
@@ -63,19 +106,74 @@ def full_metadata(request, resource_uuid):
     if storage_object.copy_status == REMOTE:
         return HttpResponse("Forbidden: the specified resource is a `REMOTE` " \
             "resource and cannot be distributed by this node.", status=403)
-    response = HttpResponse(status=200, content_type='application/zip')
+    # the digest is never created inline; it is maintained by the
+    # `update_digests` job
+    zipfilename = storage_object.get_digest_path()
+    if storage_object.digest_checksum is None \
+            or not os.path.isfile(zipfilename):
+        LOGGER.warn('No digest available yet for resource {0}.' \
+                    .format(resource_uuid))
+        return HttpResponse("Service unavailable: the digest of the given "
+            "resource has not been created yet.", status=503)
+    response = serve_file(request, zipfilename, content_type='application/zip')
     response['Metashare-Version'] = settings.METASHARE_VERSION
     response['Content-Disposition'] = 'attachment; filename="full-metadata.zip"'
-    if storage_object.digest_checksum is None:
-        storage_object.update_storage()
-    #if storage_object.digest_checksum is None: # still no digest? something is very wrong here:
-    #    raise Exception("Object {0} has no digest".format(resource_uuid))
-    zipfilename = "{0}/resource.zip".format(storage_object._storage_folder())
-    with open(zipfilename, 'rb') as inzip:
-        zipfiledata = inzip.read()
-        response.write(zipfiledata)
-#    with ZipFile(response, 'w') as outzip:
-#        outzip.writestr('storage-global.json', str(storage_object.identifier))
-#        outzip.writestr('metadata.xml', storage_object.metadata.encode('utf-8'))
     return response
-    
\ No newline at end of file
+
+def full_metadata_batch(request):
+    """
+    Returns the full metadata of all resources whose identifiers are POSTed in
+    the `resource` parameter.
+    
+    The response is a tar archive which is streamed entry by entry. It
+    contains a `<identifier>.zip` entry with the same content as the response
+    of the `full_metadata` view for each requested resource that can be
+    distributed by this node; all other resources are silently left out.
+    """
+    if settings.SYNC_NEEDS_AUTHENTICATION and not request.user.has_perm('storage.can_sync'):
+        return HttpResponse("Forbidden: only synchronization users can access this page.", status=403)
+    if request.method != 'POST':
+        return HttpResponse("Method not allowed: resources must be POSTed.",
+                            status=405)
+    resource_uuids = request.POST.getlist('resource')
+    if len(resource_uuids) > MAX_METADATA_BATCH_SIZE:
+        return HttpResponse("Bad request: at most {} resources can be "
+            "requested at once.".format(MAX_METADATA_BATCH_SIZE), status=400)
+    storage_objects = StorageObject.objects \
+        .filter(identifier__in=resource_uuids) \
+        .filter(Q(copy_status=MASTER) | Q(copy_status=PROXY)) \
+        .exclude(publication_status=INTERNAL)
+    response = HttpResponse(_stream_full_metadata(storage_objects),
+                            status=200, content_type='application/x-tar')
+    response['Metashare-Version'] = settings.METASHARE_VERSION
+    response['Content-Disposition'] = \
+        'attachment; filename="full-metadata.tar"'
+    return response
+
+def _stream_full_metadata(storage_objects):
+    """
+    Generator which yields a tar archive with the digest zip-archives of the
+    given storage objects; each chunk contains (at most) one complete archive
+    entry, so that memory consumption does not depend on the number of
+    storage objects.
+    
+    Storage objects whose digest has not been created yet are left out.
+    """
+    stream = StreamBuffer()
+    outtar = tarfile.open(fileobj=stream, mode='w|')
+    for storage_object in storage_objects:
+        zipfilename = storage_object.get_digest_path()
+        if storage_object.digest_checksum is None \
+                or not os.path.isfile(zipfilename):
+            LOGGER.warn('No digest available yet for resource {0}.' \
+                        .format(storage_object.identifier))
+            continue
+        entry = tarfile.TarInfo('{0}.zip'.format(storage_object.identifier))
+        entry.size = os.path.getsize(zipfilename)
+        entry.mtime = os.path.getmtime(zipfilename)
+        with open(zipfilename, 'rb') as inzip:
+            outtar.addfile(entry, inzip)
+        yield stream.pop()
+    outtar.close()
+    yield stream.pop()
+
@@ -17,7 +17,17 @@ def _run_custom_test_db_setup():
     """
     # from now on, redirect any search index access to the test index
     MetashareRouter.in_test_mode = True
-    # clear the test index
+    # the tests expect the index to be up-to-date right after each change
+    settings.QUEUE_INDEX_UPDATES = False
+    # ... and the statistics to be written right away
+    settings.STATS_BUFFER_SIZE = 0
+
+
+def _clear_test_index():
+    """
+    Clears the test index; this starts a new search index generation, so it
+    must only be run once the test databases have been created.
+    """
     call_command('clear_index', interactive=False,
                  using=settings.TEST_MODE_NAME)
 
@@ -34,7 +44,10 @@ class MetashareTestRunner(SeleniumTestRunner):
     def setup_databases(self, **kwargs):
         _run_custom_test_db_setup()
         # run the normal Django test setup
-        return super(MetashareTestRunner, self).setup_databases(**kwargs)
+        _old_config = super(MetashareTestRunner, self).setup_databases(
+                                                                    **kwargs)
+        _clear_test_index()
+        return _old_config
 
 
 # if we're in a Jenkins test environment, then we also create a test runner for
@@ -58,7 +71,9 @@ try:
         def setup_databases(self, **kwargs):
             _run_custom_test_db_setup()
             # run the normal Django test setup
-            return super(MetashareJenkinsTestRunner, self).setup_databases(
-                                                                    **kwargs)
+            _old_config = super(MetashareJenkinsTestRunner, self) \
+                .setup_databases(**kwargs)
+            _clear_test_index()
+            return _old_config
 except ImportError:
     pass
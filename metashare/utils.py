@@ -6,10 +6,32 @@ import logging
 import os
 import re
 import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import tzinfo, timedelta
+from hashlib import md5
+from mimetypes import guess_type
 
 from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.utils.http import http_date
 
+# the block size in bytes in which files are streamed to the client
+FILE_STREAM_BLOCK_SIZE = 64 * 1024
+
+# regular expression for a single byte range as in "Range: bytes=500-999"
+_BYTE_RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# the number of lock files to which the locks on the storage of single
+# resources are hashed
+STORAGE_LOCK_BUCKETS = 64
+
+# lock wait times and hold durations of at least this many seconds are logged
+# as info messages, shorter ones as debug messages
+LOCK_LOG_THRESHOLD = 1.0
 
 # Setup logging support.
 LOGGER = logging.getLogger(__name__)
@@ -79,30 +101,67 @@ def create_breadcrumb_template_params(model, action):
     return dictionary
 
 
+def bulk_insert(model, field_names, rows):
+    """
+    Inserts entries of the given model with the values of the given fields in
+    the given rows with a single statement.
+    """
+    if not rows:
+        return
+    _qn = connection.ops.quote_name
+    _fields = [model._meta.get_field(_name) for _name in field_names]
+    _sql = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+        _qn(model._meta.db_table),
+        ', '.join(_qn(_field.column) for _field in _fields),
+        ', '.join(['%s'] * len(_fields)))
+    connection.cursor().executemany(_sql, [[_field.get_db_prep_save(_value,
+            connection=connection) for _field, _value in zip(_fields, _row)]
+        for _row in rows])
+
+
 class Lock():
     """
-    Each instance of this class can be used to acquire an exclusive, system-wide
-    (multi-process) lock on a particular name.
+    Each instance of this class can be used to acquire a system-wide
+    (multi-process) lock on a particular name. The lock is either exclusive or
+    shared with all other shared locks on the same name.
+    
+    The times spent waiting for and holding the lock are logged.
     
     This class will only work on Unix systems viz. systems that provide the
     `fcntl` module. On other systems the class will silently do nothing.
     """
-    def __init__(self, lock_name):
+    def __init__(self, lock_name, shared=False):
         """
-        Create a `Lock` object which can create an exclusive lock on the given
-        name.
+        Create a `Lock` object which can create an exclusive (or shared) lock
+        on the given name.
         """
+        self.lock_name = lock_name
+        self.shared = shared
+        self.acquired = None
         if 'fcntl' in sys.modules:
             self.handle = open(os.path.join(settings.LOCK_DIR, lock_name), 'w')
         else:
             self.handle = None
 
+    def _log_time(self, message, seconds):
+        """
+        Logs the given message about the given number of seconds.
+        """
+        _log = LOGGER.info if seconds >= LOCK_LOG_THRESHOLD else LOGGER.debug
+        _log(message.format(seconds, 'shared' if self.shared else 'exclusive',
+                            self.lock_name))
+
     def acquire(self):
         """
         Acquire a lock on the name for which this `Lock` was created.
         """
         if self.handle:
-            fcntl.flock(self.handle, fcntl.LOCK_EX)
+            _start = time.time()
+            fcntl.flock(self.handle,
+                        fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+            self.acquired = time.time()
+            self._log_time('Waited {0:.3f}s for the {1} lock "{2}".',
+                           self.acquired - _start)
 
     def release(self):
         """
@@ -110,12 +169,138 @@ class Lock():
         """
         if self.handle:
             fcntl.flock(self.handle, fcntl.LOCK_UN)
+            if self.acquired is not None:
+                self._log_time('Held the {1} lock "{2}" for {0:.3f}s.',
+                               time.time() - self.acquired)
+                self.acquired = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
 
     def __del__(self):
         if self.handle:
             self.handle.close()
 
 
+def get_storage_lock(shared=False):
+    """
+    Returns a `Lock` on the whole storage.
+    
+    Operations on (potentially) all resources of the storage, such as repairs,
+    take the exclusive lock. Operations on particular resources take the
+    shared lock plus the locks of these resources, so that they can run
+    concurrently with each other.
+    """
+    return Lock('storage', shared)
+
+
+def get_resource_locks(identifiers):
+    """
+    Returns the list of exclusive `Lock`s on the storage of the resources with
+    the given identifiers.
+    
+    The resources are hashed to STORAGE_LOCK_BUCKETS lock files. The locks are
+    returned without duplicates, as a process must not lock a file twice, and
+    in the order in which they have to be acquired to avoid deadlocks.
+    """
+    _buckets = set(int(md5(_id.encode('utf-8')).hexdigest(), 16)
+                   % STORAGE_LOCK_BUCKETS for _id in identifiers)
+    return [Lock('storage-{0}'.format(_bucket)) for _bucket in sorted(_buckets)]
+
+
+def get_import_lock():
+    """
+    Returns the exclusive `Lock` which serializes the imports of resources.
+    
+    Imported resources are deduplicated against the existing reusable entities,
+    such as persons and organizations, which concurrent imports would create
+    twice.
+    """
+    return Lock('import')
+
+
+@contextmanager
+def acquired(locks):
+    """
+    Holds the given locks for the duration of a `with` block; the locks are
+    acquired in the given order and released in the reverse order.
+    """
+    _acquired = []
+    try:
+        for _lock in locks:
+            _lock.acquire()
+            _acquired.append(_lock)
+        yield
+    finally:
+        for _lock in reversed(_acquired):
+            _lock.release()
+
+
+class LRUCache():
+    """
+    A thread-safe, dictionary-like cache which holds at most `max_size` entries
+    by discarding the least recently used entries.
+    
+    The numbers of cache hits and misses are counted in `hits` and `misses`.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for the given key or the given default value
+        if there is no such entry; a found entry becomes the most recently used
+        one.
+        """
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._entries.pop(key, default)
+
+    def values(self):
+        with self._lock:
+            return self._entries.values()
+
+    def clear(self):
+        """
+        Removes all entries and resets the hit/miss statistics.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
 class SimpleTimezone(tzinfo):
     """
     A fixed offset timezone with an unknown name and an unknown DST adjustment.
@@ -131,3 +316,155 @@ class SimpleTimezone(tzinfo):
 
     def dst(self, dt):
         return None
+
+
+class StreamBuffer():
+    """
+    A minimal write-only file-like object which collects the written data until
+    it is popped.
+    
+    It can be used as target of the `tarfile` and `zipfile` modules (which only
+    require `write()` and `tell()` when writing a stream) so that an archive
+    can be yielded chunk by chunk instead of being built in memory.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(data)
+        self._position += len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        """
+        Returns and removes all data which has been written since the last
+        call.
+        """
+        result = ''.join(self._chunks)
+        self._chunks = []
+        return result
+
+
+def _file_stream_generator(path, start, length):
+    """
+    Generator which yields `length` bytes of the given file starting at offset
+    `start` in blocks of FILE_STREAM_BLOCK_SIZE.
+    """
+    with open(path, 'rb') as _in:
+        _in.seek(start)
+        while length > 0:
+            _chunk = _in.read(min(FILE_STREAM_BLOCK_SIZE, length))
+            if not _chunk:
+                break
+            length -= len(_chunk)
+            yield _chunk
+
+
+def _parse_byte_range(range_header, size):
+    """
+    Parses the given HTTP Range header value for a file with the given size.
+    
+    Returns a tuple of the first and the last requested byte position, or None
+    if the header is not a single byte range that we support; then the full
+    file should be returned. Raises a ValueError if the range cannot be
+    satisfied.
+    """
+    _match = _BYTE_RANGE_PATTERN.match(range_header.strip())
+    if not _match or _match.groups() == ('', ''):
+        return None
+    _first, _last = _match.groups()
+    if not _first:
+        # suffix range: the last n bytes
+        _suffix_length = int(_last)
+        if _suffix_length == 0:
+            raise ValueError('empty suffix range')
+        return max(0, size - _suffix_length), size - 1
+    _first = int(_first)
+    _last = min(int(_last), size - 1) if _last else size - 1
+    if _first >= size or _last < _first:
+        raise ValueError('unsatisfiable range')
+    return _first, _last
+
+
+def is_resumed_download(request, path):
+    """
+    Returns whether the given request for the given local file only asks for a
+    part of the file which does not start at its first byte, e.g., because an
+    interrupted download is resumed.
+    
+    Unlike the status code of the response of `serve_file()`, this also holds
+    if sending the file is offloaded to the web server.
+    """
+    _last_modified = http_date(os.path.getmtime(path))
+    # the full file is sent if its version does not match the requested one
+    if 'HTTP_RANGE' not in request.META or request.META.get('HTTP_IF_RANGE',
+                                    _last_modified) != _last_modified:
+        return False
+    try:
+        _range = _parse_byte_range(request.META['HTTP_RANGE'],
+                                   os.path.getsize(path))
+    except ValueError:
+        # an unsatisfiable range is not a download at all
+        return True
+    return bool(_range) and _range[0] > 0
+
+
+def serve_file(request, path, content_type=None):
+    """
+    Returns an HTTP response for the given local file which does not depend on
+    the file size in terms of memory consumption.
+    
+    If SENDFILE_HEADER is configured, sending the file is offloaded to the web
+    server; otherwise the file is streamed in blocks by Django. Single HTTP
+    Range requests are supported, so that interrupted downloads can be resumed.
+    
+    content_type (optional): the MIME type of the file; guessed if not given
+    """
+    if not content_type:
+        content_type = guess_type(path)[0] or 'application/octet-stream'
+    _size = os.path.getsize(path)
+    _last_modified = http_date(os.path.getmtime(path))
+
+    if settings.SENDFILE_HEADER:
+        response = HttpResponse(content_type=content_type)
+        if settings.SENDFILE_HEADER == 'X-Accel-Redirect':
+            # nginx expects the URI of an internal location which is mapped to
+            # the storage folder
+            _storage_path = os.path.join(settings.STORAGE_PATH, '')
+            if not path.startswith(_storage_path):
+                raise ValueError('Only files below STORAGE_PATH can be sent '
+                                 'with X-Accel-Redirect: {}'.format(path))
+            response['X-Accel-Redirect'] = '{0}{1}'.format(
+                settings.SENDFILE_ACCEL_LOCATION, path[len(_storage_path):])
+        else:
+            response[settings.SENDFILE_HEADER] = path
+    else:
+        _range = None
+        if 'HTTP_RANGE' in request.META and request.META.get('HTTP_IF_RANGE',
+                                    _last_modified) == _last_modified:
+            try:
+                _range = _parse_byte_range(request.META['HTTP_RANGE'], _size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */{}'.format(_size)
+                return response
+        if _range:
+            _first, _last = _range
+            response = HttpResponse(_file_stream_generator(path, _first,
+                _last - _first + 1), status=206, content_type=content_type)
+            response['Content-Range'] = \
+                'bytes {0}-{1}/{2}'.format(_first, _last, _size)
+            response['Content-Length'] = _last - _first + 1
+        else:
+            response = HttpResponse(_file_stream_generator(path, 0, _size),
+                                    content_type=content_type)
+            response['Content-Length'] = _size
+        response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = _last_modified
+    return response
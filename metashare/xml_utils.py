@@ -7,10 +7,15 @@ import logging
 import os
 import re
 import sys
+import time
+from copy import deepcopy
+from itertools import islice
+from multiprocessing import Pool
 from subprocess import call, STDOUT
 from zipfile import is_zipfile, ZipFile
 
 from django import db
+from django.db import transaction
 from django.contrib.admin.models import LogEntry, ADDITION
 from django.contrib.contenttypes.models import ContentType
 from django.utils.encoding import force_unicode
@@ -33,6 +38,13 @@ XML_DECL = re.compile(r'\s*<\?xml version=".+" encoding=".+"\?>\s*\n?',
 XML_DECL_2 = re.compile(r"\s*<\?xml version='.+' encoding='.+'\?>\s*\n?",
   re.I|re.S|re.U)
 
+# the default number of resources which are imported in a single database
+# transaction by `bulk_import_from_files()`
+BULK_IMPORT_BATCH_SIZE = 100
+
+# the stages of `bulk_import_from_files()` for which timings are reported
+BULK_IMPORT_STAGES = ('parse', 'import', 'storage', 'statistics', 'index')
+
 def xml_compare(file1, file2, outfile=None):
     """
     Compare two XML files with the external program xdiff.
@@ -76,8 +88,26 @@ def import_from_string(xml_string, targetstatus, copy_status, owner_id=None):
     Returns the imported resource object on success, raises and Exception on failure.
     """
     from metashare.repository.models import resourceInfoType_model
-    result = resourceInfoType_model.import_from_string(xml_string, copy_status=copy_status)
+    resource = _save_imported_resource(
+        resourceInfoType_model.import_from_string(xml_string, copy_status=copy_status),
+        targetstatus, owner_id)
+
+    # explicitly write metadata XML and storage object to the storage folder
+    resource.storage_object.update_storage()
+
+    # Update statistics
+    saveLRStats(resource, UPDATE_STAT)
+
+    return resource
+
+
+def _save_imported_resource(result, targetstatus, owner_id):
+    """
+    Saves the resource of the given `import_from_*()` result tuple with the
+    given target status and owner.
     
+    Returns the resource object on success, raises an Exception on failure.
+    """
     if not result[0]:
         msg = u''
         if len(result) > 2:
@@ -101,9 +131,6 @@ def import_from_string(xml_string, targetstatus, copy_status, owner_id=None):
     else:
         resource.storage_object.save()
 
-    # explicitly write metadata XML and storage object to the storage folder
-    resource.storage_object.update_storage()
-
     # Create log ADDITION message for the new object, but only if we have a user:
     if owner_id:
         LogEntry.objects.log_action(
@@ -114,9 +141,6 @@ def import_from_string(xml_string, targetstatus, copy_status, owner_id=None):
             action_flag     = ADDITION
         )
 
-    # Update statistics
-    saveLRStats(resource, UPDATE_STAT)
-
     return resource
     
     
@@ -181,6 +205,211 @@ def import_from_file(filehandle, descriptor, targetstatus, copy_status, owner_id
     return imported_resources, erroneous_descriptors
 
 
+def _read_xml_records(filenames):
+    """
+    Generator which yields a pair of descriptor and XML string for each XML
+    record contained in the given XML files and zip archives.
+    """
+    for filename in filenames:
+        with open(filename, 'rb') as filehandle:
+            handling_zip_file = is_zipfile(filehandle)
+            filehandle.seek(0)
+            if not handling_zip_file:
+                yield filename, filehandle.read()
+                continue
+            temp_zip = ZipFile(filehandle)
+            for xml_name in temp_zip.namelist():
+                if xml_name.endswith('/') or xml_name.endswith('\\'):
+                    continue
+                yield xml_name, temp_zip.read(xml_name)
+
+
+def _parse_xml_record(record):
+    """
+    Parses and checks the given pair of descriptor and XML string; this is run
+    in the worker processes of `bulk_import_from_files()`.
+    
+    Returns a triple of the descriptor, the parsed XML element tree and None on
+    success, or a triple of the descriptor, None and an Exception on failure.
+    """
+    from metashare.repository.models import resourceInfoType_model
+    descriptor, xml_string = record
+    try:
+        element_tree = ElementTree.fromstring(xml_string)
+    # pylint: disable-msg=W0703
+    except Exception as problem:
+        return descriptor, None, Exception(u'{}'.format(problem))
+    # name space information in tags is ignored by the importer
+    if element_tree.tag.split('}')[-1] != resourceInfoType_model.__schema_name__:
+        return descriptor, None, Exception(u"Tags don't match: {}!={}" \
+            .format(element_tree.tag, resourceInfoType_model.__schema_name__))
+    return descriptor, element_tree, None
+
+
+def _import_batch(parsed_records, targetstatus, copy_status, owner_id):
+    """
+    Imports the given parsed records of `_parse_xml_record()` in a single
+    database transaction. If this fails, the batch is imported again with one
+    transaction per record so that the erroneous records can be told apart.
+    
+    Returns a pair of lists, the first list containing the ids of the
+    successfully imported resources, the second containing pairs of
+    descriptors of the erroneous XML records and errors.
+    """
+    from metashare.repository.models import resourceInfoType_model
+    from metashare.repository.supermodel import OBJECT_XML_CACHE
+
+    def import_record(element_tree):
+        return _save_imported_resource(
+            resourceInfoType_model.import_from_elementtree(element_tree,
+                copy_status=copy_status), targetstatus, owner_id).id
+
+    erroneous_descriptors = [(descriptor, problem)
+        for descriptor, _, problem in parsed_records if problem]
+    valid_records = [(descriptor, element_tree)
+        for descriptor, element_tree, problem in parsed_records if not problem]
+    try:
+        with transaction.commit_on_success():
+            # the importer modifies the element trees, so it gets copies which
+            # leaves the originals for a possible second attempt
+            return [import_record(deepcopy(element_tree))
+                    for _, element_tree in valid_records], erroneous_descriptors
+    # pylint: disable-msg=W0703
+    except Exception:
+        LOGGER.info('Importing a batch of {} records failed; importing the ' \
+                    'records one by one.'.format(len(valid_records)))
+    
+    imported_ids = []
+    for descriptor, element_tree in valid_records:
+        # the duplicate detection cache may refer to rolled back objects
+        OBJECT_XML_CACHE.clear()
+        try:
+            with transaction.commit_on_success():
+                imported_ids.append(import_record(element_tree))
+        # pylint: disable-msg=W0703
+        except Exception as problem:
+            LOGGER.warn('Caught an exception while importing %s:',
+                descriptor, exc_info=True)
+            if isinstance(problem, db.utils.DatabaseError):
+                # reset database connection (required for PostgreSQL)
+                db.close_connection()
+            erroneous_descriptors.append((descriptor, problem))
+    return imported_ids, erroneous_descriptors
+
+
+def _finish_bulk_import(resource_ids, timings, index):
+    """
+    Runs the deferred post-pass of `bulk_import_from_files()` for the given
+    imported resources: the storage objects are serialized (which includes
+    the digest creation), the usage statistics are updated and, if `index` is
+    True, the resources are added to the search index.
+    
+    The time spent in each of these stages is added to the given timings dict.
+    """
+    from metashare.repository.models import resourceInfoType_model
+    from metashare.repository.search_indexes import update_lr_index_entries
+
+    _start = time.time()
+    resources = list(resourceInfoType_model.objects.filter(id__in=resource_ids)
+                     .select_related('storage_object'))
+    with transaction.commit_on_success():
+        for resource in resources:
+            try:
+                resource.storage_object.update_storage()
+            # pylint: disable-msg=W0703
+            except Exception:
+                LOGGER.warn('Could not serialize the storage object of ' \
+                    'resource #{0}.'.format(resource.id), exc_info=True)
+    _now = time.time()
+    timings['storage'] += _now - _start
+    _start = _now
+
+    for resource in resources:
+        saveLRStats(resource, UPDATE_STAT)
+    _now = time.time()
+    timings['statistics'] += _now - _start
+    _start = _now
+
+    if index:
+        update_lr_index_entries(resources)
+    timings['index'] += time.time() - _start
+
+
+def bulk_import_from_files(filenames, targetstatus, copy_status, owner_id=None,
+                           processes=None, batch_size=BULK_IMPORT_BATCH_SIZE):
+    """
+    Imports the XML metadata records contained in the given XML files and zip
+    archives in bulk.
+    
+    In contrast to `import_from_file()`, the XML records are parsed and checked
+    in a pool of worker processes while the previous batch of records is
+    written to the database in a single transaction. The serialization of the
+    storage objects, the usage statistics and the search indexing are deferred
+    to a post-pass per batch, in which only the imported resources are
+    indexed with a single request. Indexing is skipped completely if the
+    DISABLE_INDEXING_DURING_IMPORT environment variable is 'True'.
+    
+    processes (optional): the number of worker processes; defaults to the
+        number of CPUs
+    batch_size (optional): the number of records per database transaction
+    
+    Returns a triple of the list of ids of the successfully imported resources,
+    the list of pairs of descriptors of the erroneous XML records and errors,
+    and a dict with the time in seconds spent in each import stage.
+    """
+    imported_ids = []
+    erroneous_descriptors = []
+    timings = dict((stage, 0.0) for stage in BULK_IMPORT_STAGES)
+    _import_start = time.time()
+
+    # the real-time indexing of each saved resource is replaced by the
+    # indexing in the post-pass
+    _indexing_disabled = os.environ.get('DISABLE_INDEXING_DURING_IMPORT')
+    os.environ['DISABLE_INDEXING_DURING_IMPORT'] = 'True'
+
+    records = _read_xml_records(filenames)
+    # the worker processes only parse XML; they never access the database
+    pool = Pool(processes)
+    try:
+        # while a batch is imported, the next one is already parsed; this
+        # keeps at most two batches of records in memory
+        _pending = pool.map_async(_parse_xml_record,
+                                  list(islice(records, batch_size)))
+        while True:
+            _start = time.time()
+            _batch = _pending.get()
+            timings['parse'] += time.time() - _start
+            if not _batch:
+                break
+            _pending = pool.map_async(_parse_xml_record,
+                                      list(islice(records, batch_size)))
+
+            _start = time.time()
+            _batch_ids, _batch_errors = \
+                _import_batch(_batch, targetstatus, copy_status, owner_id)
+            timings['import'] += time.time() - _start
+
+            _finish_bulk_import(_batch_ids, timings,
+                                index=(_indexing_disabled != 'True'))
+            imported_ids.extend(_batch_ids)
+            erroneous_descriptors.extend(_batch_errors)
+            LOGGER.info('Imported {0} resources so far ({1:.1f} resources/s), ' \
+                'errors occurred in {2} cases.'.format(len(imported_ids),
+                    len(imported_ids) / (time.time() - _import_start),
+                    len(erroneous_descriptors)))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        if _indexing_disabled is None:
+            del os.environ['DISABLE_INDEXING_DURING_IMPORT']
+        else:
+            os.environ['DISABLE_INDEXING_DURING_IMPORT'] = _indexing_disabled
+
+    timings['total'] = time.time() - _import_start
+    return imported_ids, erroneous_descriptors, timings
+
+
 def to_xml_string(node, encoding="ASCII"):
     """
     Serialize the given XML node as Unicode string using the given encoding.